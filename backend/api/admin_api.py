@@ -8,14 +8,26 @@ import sys
 from pathlib import Path
 import aiosqlite
 import os
+from datetime import datetime, timedelta, timezone
 
 sys.path.insert(0, str(Path(__file__).parent.parent.parent.parent))
 
 from database import (
-    DB_NAME, get_user_count, get_resume_count,
-    get_pending_payment_requests, update_payment_request_status,
+    get_resume_count,
+    get_pending_payment_requests,
     add_balance, activate_premium
 )
+from core.db import pool, get_db
+from core import events, schema
+from core.events import event_bus
+from core.idempotency import idempotency_store
+from core.payments import APPROVED, MAX_BULK_REQUESTS, REJECTED, review_payments
+from core.ratelimit import rate_limiter
+from core.response_cache import response_cache
+from core.cache_sync import RESPONSE_CACHE, cache_sync
+from core import queries
+from core.scheduler import scheduler
+from api.tekin import task_dispatcher
 
 router = APIRouter()
 
@@ -32,56 +44,83 @@ async def check_admin(user_id: int):
 # ============================================
 
 @router.get("/stats")
-async def get_stats(user_id: int):
-    """Get bot statistics (admin only)"""
+async def get_stats(user_id: int, db: aiosqlite.Connection = Depends(get_db)):
+    """Get bot statistics (admin only)
+
+    Totals come from trigger-maintained counters, so the cost does not grow
+    with the number of users.
+    """
     await check_admin(user_id)
-    
-    async with aiosqlite.connect(DB_NAME) as db:
-        db.row_factory = aiosqlite.Row
-        
-        stats = {
-            'total_users': await get_user_count(),
-            'total_resumes': await get_resume_count(),
-            'premium_users': 0,
-            'today_users': 0,
-            'total_balance': 0,
-            'active_jobs': 0,
-            'active_products': 0
-        }
-        
-        # Premium users
-        async with db.execute(
-            "SELECT COUNT(*) as count FROM users WHERE premium_until > datetime('now')"
-        ) as cursor:
-            stats['premium_users'] = (await cursor.fetchone())[0]
-        
-        # Today's new users
-        async with db.execute(
-            "SELECT COUNT(*) as count FROM users WHERE DATE(created_at) = DATE('now')"
-        ) as cursor:
-            stats['today_users'] = (await cursor.fetchone())[0]
-        
-        # Total balance
-        async with db.execute(
-            "SELECT SUM(balance) as total FROM users"
-        ) as cursor:
-            result = await cursor.fetchone()
-            stats['total_balance'] = result[0] or 0
-        
-        # Active jobs
-        async with db.execute(
-            "SELECT COUNT(*) as count FROM jobs WHERE status = 'active'"
-        ) as cursor:
-            stats['active_jobs'] = (await cursor.fetchone())[0]
-        
-        # Active products
-        async with db.execute(
-            "SELECT COUNT(*) as count FROM products WHERE status = 'active' AND stock > 0"
-        ) as cursor:
-            stats['active_products'] = (await cursor.fetchone())[0]
-    
+
+    stats = {
+        'total_users': 0,
+        'total_resumes': 0,
+        'premium_users': 0,
+        'today_users': 0,
+        'total_balance': 0,
+        'active_jobs': 0,
+        'active_products': 0
+    }
+
+    # Running totals
+    async with db.execute("SELECT name, value FROM stats_counters") as cursor:
+        for row in await cursor.fetchall():
+            if row['name'] in stats:
+                stats[row['name']] = row['value']
+
+    if 'total_resumes' not in schema.stats_enabled:
+        stats['total_resumes'] = await get_resume_count()
+
+    # Premium users (range scan on idx_users_premium_until)
+    async with db.execute(
+        "SELECT COUNT(*) as count FROM users WHERE premium_until > datetime('now')"
+    ) as cursor:
+        stats['premium_users'] = (await cursor.fetchone())[0]
+
+    # Today's new users
+    async with db.execute(
+        "SELECT value FROM stats_daily WHERE day = DATE('now') AND name = 'new_users'"
+    ) as cursor:
+        row = await cursor.fetchone()
+        stats['today_users'] = row[0] if row else 0
+
     return stats
 
+@router.get("/stats/timeseries")
+async def get_stats_timeseries(
+    user_id: int,
+    days: int = 30,
+    db: aiosqlite.Connection = Depends(get_db)
+):
+    """Get daily statistics for the last N days (admin only)"""
+    await check_admin(user_id)
+
+    days = max(1, min(days, 366))
+    # stats_daily is keyed by SQLite's date('now'), which is UTC
+    start = datetime.now(timezone.utc).date() - timedelta(days=days - 1)
+    series = {
+        (start + timedelta(days=i)).isoformat(): dict.fromkeys(schema.STATS_DAILY, 0)
+        for i in range(days)
+    }
+
+    async with db.execute(
+        "SELECT day, name, value FROM stats_daily WHERE day >= ? ORDER BY day",
+        (start.isoformat(),)
+    ) as cursor:
+        for row in await cursor.fetchall():
+            if row['day'] in series and row['name'] in series[row['day']]:
+                series[row['day']][row['name']] = row['value']
+
+    return {"days": [{"date": day, **values} for day, values in series.items()]}
+
+@router.post("/stats/rebuild")
+async def rebuild_stats(user_id: int):
+    """Recount materialized statistics from the source tables (admin only)"""
+    await check_admin(user_id)
+
+    await pool.write(schema.rebuild_stats)
+    return {"success": True, "message": "Statistics rebuilt"}
+
 # ============================================
 # PAYMENT APPROVAL ENDPOINTS
 # ============================================
@@ -94,60 +133,104 @@ async def get_pending_payments(user_id: int):
     requests = await get_pending_payment_requests()
     return {"requests": requests}
 
+def _publish_reviews(changed: List[dict], status: str, note: str):
+    for item in changed:
+        data = {"request_id": item["request_id"], "status": status, "amount": item["amount"]}
+        if status == REJECTED:
+            data["reason"] = note
+        event_bus.publish(events.PAYMENT_REVIEWED, data, users=(item["user_id"],), admin=True)
+        if status == APPROVED:
+            event_bus.publish(
+                events.BALANCE_CHANGED,
+                {"amount": item["amount"], "balance": item["balance"]},
+                users=(item["user_id"],)
+            )
+
+async def _review_one(user_id: int, request_id: int, status: str, note: str):
+    await check_admin(user_id)
+    results, changed = await review_payments([request_id], status, user_id, note)
+    error = results[request_id].get("error")
+    if error == "not_found":
+        raise HTTPException(status_code=404, detail="Payment request not found")
+    if error == "user_not_found":
+        raise HTTPException(status_code=404, detail="User not found")
+    if error:
+        raise HTTPException(
+            status_code=409, detail=f"Payment request is already {error[len('already_'):]}"
+        )
+    _publish_reviews(changed, status, note)
+
 @router.post("/payments/{request_id}/approve")
 async def approve_payment(user_id: int, request_id: int):
     """Approve payment request (admin only)"""
-    await check_admin(user_id)
-    
-    # Get request details
-    async with aiosqlite.connect(DB_NAME) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute(
-            "SELECT * FROM payment_requests WHERE id = ?",
-            (request_id,)
-        ) as cursor:
-            request = await cursor.fetchone()
-            if not request:
-                raise HTTPException(status_code=404, detail="Payment request not found")
-            request = dict(request)
-    
-    # Add balance
-    await add_balance(request['user_id'], request['amount'], "Payment approved")
-    
-    # Update request status
-    await update_payment_request_status(request_id, 'approved', user_id, "Approved by admin")
-    
+    await _review_one(user_id, request_id, APPROVED, "Approved by admin")
     return {"success": True, "message": "Payment approved"}
 
 @router.post("/payments/{request_id}/reject")
 async def reject_payment(user_id: int, request_id: int, reason: str = ""):
     """Reject payment request (admin only)"""
-    await check_admin(user_id)
-    
-    await update_payment_request_status(request_id, 'rejected', user_id, reason or "Rejected by admin")
-    
+    await _review_one(user_id, request_id, REJECTED, reason or "Rejected by admin")
     return {"success": True, "message": "Payment rejected"}
 
+class BulkPaymentReview(BaseModel):
+    request_ids: List[int]
+    reason: Optional[str] = None
+
+async def _bulk_review(user_id: int, body: BulkPaymentReview, status: str, note: str) -> dict:
+    await check_admin(user_id)
+    if not body.request_ids:
+        raise HTTPException(status_code=400, detail="No payment requests given")
+    if len(body.request_ids) > MAX_BULK_REQUESTS:
+        raise HTTPException(
+            status_code=400, detail=f"At most {MAX_BULK_REQUESTS} payment requests at once"
+        )
+
+    results, changed = await review_payments(body.request_ids, status, user_id, note)
+    _publish_reviews(changed, status, note)
+    return {
+        "success": True,
+        "processed": len(changed),
+        "failed": len(results) - len(changed),
+        "results": [{"request_id": request_id, **result} for request_id, result in results.items()]
+    }
+
+@router.post("/payments/bulk-approve")
+async def bulk_approve_payments(user_id: int, body: BulkPaymentReview):
+    """Approve many payment requests in one transaction (admin only)
+
+    Requests that are missing or no longer pending are reported in
+    `results` and skipped; the rest are approved and credited together.
+    """
+    return await _bulk_review(user_id, body, APPROVED, body.reason or "Approved by admin")
+
+@router.post("/payments/bulk-reject")
+async def bulk_reject_payments(user_id: int, body: BulkPaymentReview):
+    """Reject many payment requests in one transaction (admin only)"""
+    return await _bulk_review(user_id, body, REJECTED, body.reason or "Rejected by admin")
+
 # ============================================
 # USER MANAGEMENT ENDPOINTS
 # ============================================
 
 @router.get("/users")
-async def get_users(user_id: int, limit: int = 50, offset: int = 0):
+async def get_users(
+    user_id: int,
+    limit: int = 50,
+    offset: int = 0,
+    db: aiosqlite.Connection = Depends(get_db)
+):
     """Get users list (admin only)"""
     await check_admin(user_id)
-    
-    async with aiosqlite.connect(DB_NAME) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute(
-            """SELECT user_id, username, first_name, balance, premium_until, created_at
-               FROM users 
-               ORDER BY created_at DESC 
-               LIMIT ? OFFSET ?""",
-            (limit, offset)
-        ) as cursor:
-            rows = await cursor.fetchall()
-            users = [dict(row) for row in rows]
+
+    async with db.execute(
+        """SELECT user_id, username, first_name, balance, premium_until, created_at
+           FROM users
+           ORDER BY created_at DESC
+           LIMIT ? OFFSET ?""",
+        (limit, offset)
+    ) as cursor:
+        rows = await cursor.fetchall()
+        users = [dict(row) for row in rows]
     
     return {"users": users}
 
@@ -157,6 +240,7 @@ async def add_user_balance(user_id: int, target_user_id: int, amount: int):
     await check_admin(user_id)
     
     await add_balance(target_user_id, amount, "Added by admin")
+    event_bus.publish(events.BALANCE_CHANGED, {"amount": amount}, users=(target_user_id,))
     return {"success": True, "message": f"Added {amount:,} to user {target_user_id}"}
 
 @router.post("/users/{target_user_id}/activate-premium")
@@ -170,4 +254,117 @@ async def activate_user_premium(
     await check_admin(user_id)
     
     await activate_premium(target_user_id, premium_type, days)
-    return {"success": True, "message": f"Premium activated for user {target_user_id}"}
\ No newline at end of file
+    return {"success": True, "message": f"Premium activated for user {target_user_id}"}
+
+# ============================================
+# CACHE MANAGEMENT
+# ============================================
+
+@router.post("/cache/invalidate")
+async def invalidate_cache(user_id: int, tags: Optional[str] = None):
+    """Drop cached responses by tag, or all of them (admin only)
+
+    Call with tags=premium_settings after changing premium prices. Other
+    workers drop their copies within CACHE_SYNC_INTERVAL seconds.
+    """
+    await check_admin(user_id)
+
+    before = response_cache.stats()['entries']
+    for tag in [t.strip() for t in tags.split(',')] if tags else ['*']:
+        await cache_sync.publish(RESPONSE_CACHE, tag)
+    return {"success": True, "invalidated": before - response_cache.stats()['entries']}
+
+# ============================================
+# HOUSEKEEPING
+# ============================================
+
+@router.post("/scheduler/run")
+async def run_scheduled_task(user_id: int, task: str):
+    """Run a housekeeping task now, in the worker serving this request (admin only)"""
+    await check_admin(user_id)
+
+    if task not in scheduler.tasks:
+        raise HTTPException(status_code=404, detail="Unknown task")
+    try:
+        rows = await scheduler.run_now(task)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"success": True, "rows": rows}
+
+# ============================================
+# DEBUG ENDPOINTS
+# ============================================
+
+@router.get("/debug/pool")
+async def get_pool_stats(user_id: int):
+    """Get database connection pool statistics (admin only)"""
+    await check_admin(user_id)
+
+    return pool.stats()
+
+@router.get("/debug/scheduler")
+async def get_scheduler_stats(user_id: int):
+    """Get background task run statistics for this worker (admin only)"""
+    await check_admin(user_id)
+
+    return scheduler.stats()
+
+@router.get("/debug/dispatch")
+async def get_dispatch_stats(user_id: int):
+    """Get in-memory tekin task dispatcher statistics for this worker (admin only)"""
+    await check_admin(user_id)
+
+    return task_dispatcher.stats()
+
+@router.get("/debug/events")
+async def get_event_stats(user_id: int):
+    """Get push event stream statistics for this worker (admin only)"""
+    await check_admin(user_id)
+
+    return event_bus.stats()
+
+@router.get("/debug/idempotency")
+async def get_idempotency_stats(user_id: int):
+    """Get Idempotency-Key replay statistics for this worker (admin only)"""
+    await check_admin(user_id)
+
+    return idempotency_store.stats()
+
+@router.get("/debug/ratelimit")
+async def get_rate_limit_stats(user_id: int):
+    """Get rate limiter statistics for this worker (admin only)"""
+    await check_admin(user_id)
+
+    return rate_limiter.stats()
+
+@router.get("/debug/cache")
+async def get_cache_stats(user_id: int):
+    """Get response cache and cross-worker invalidation statistics (admin only)"""
+    await check_admin(user_id)
+
+    return {**response_cache.stats(), 'sync': cache_sync.stats()}
+
+@router.get("/debug/queries")
+async def get_query_stats(
+    user_id: int,
+    limit: int = 20,
+    sort: str = 'total',
+    reset: bool = False
+):
+    """Get the top SQL statements by total, max, avg time or count (admin only)
+
+    Slow statements carry their EXPLAIN QUERY PLAN; full_scan marks plans
+    that read a whole table.
+    """
+    await check_admin(user_id)
+
+    if sort not in ('total', 'max', 'avg', 'count'):
+        raise HTTPException(status_code=400, detail="sort must be total, max, avg or count")
+
+    result = {
+        "slow_query_ms": queries.SLOW_QUERY_MS,
+        "queries": queries.report(max(1, min(limit, 200)), sort)
+    }
+    if reset:
+        queries.reset()
+    return result
@@ -1,7 +1,7 @@
 """
 Books & Competitions API endpoints
 """
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from pydantic import BaseModel
 from typing import List, Optional
 import sys
@@ -10,7 +10,13 @@ import aiosqlite
 
 sys.path.insert(0, str(Path(__file__).parent.parent.parent.parent))
 
-from database import DB_NAME, deduct_balance
+from core.db import get_db, pool
+from core.ledger import debit
+from core import schema
+from core.competitions import (
+    get_answer_key, get_question_set, is_participant, add_participant,
+    score_answers, score_counts, rank_table, top_scores, my_score
+)
 
 router = APIRouter()
 
@@ -26,57 +32,53 @@ class TestAnswer(BaseModel):
 # ============================================
 
 @router.get("/competitions")
-async def get_competitions(status: Optional[str] = None):
+async def get_competitions(
+    status: Optional[str] = None,
+    db: aiosqlite.Connection = Depends(get_db)
+):
     """Get book competitions"""
-    async with aiosqlite.connect(DB_NAME) as db:
-        db.row_factory = aiosqlite.Row
-        
-        query = "SELECT * FROM competitions"
-        params = []
-        
-        if status:
-            query += " WHERE status = ?"
-            params.append(status)
-        else:
-            query += " WHERE status IN ('upcoming', 'active')"
-        
-        query += " ORDER BY start_date DESC"
-        
-        async with db.execute(query, params) as cursor:
-            rows = await cursor.fetchall()
-            competitions = [dict(row) for row in rows]
-    
+    query = "SELECT * FROM competitions"
+    params = []
+
+    if status:
+        query += " WHERE status = ?"
+        params.append(status)
+    else:
+        query += " WHERE status IN ('upcoming', 'active')"
+
+    query += " ORDER BY start_date DESC"
+
+    async with db.execute(query, params) as cursor:
+        rows = await cursor.fetchall()
+        competitions = [dict(row) for row in rows]
+
     return {"competitions": competitions}
 
 @router.get("/competitions/{competition_id}")
-async def get_competition(competition_id: int):
+async def get_competition(competition_id: int, db: aiosqlite.Connection = Depends(get_db)):
     """Get competition details"""
-    async with aiosqlite.connect(DB_NAME) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute(
-            "SELECT * FROM competitions WHERE id = ?",
-            (competition_id,)
-        ) as cursor:
-            row = await cursor.fetchone()
-            if not row:
-                raise HTTPException(status_code=404, detail="Competition not found")
-            return dict(row)
+    async with db.execute(
+        "SELECT * FROM competitions WHERE id = ?",
+        (competition_id,)
+    ) as cursor:
+        row = await cursor.fetchone()
+        if not row:
+            raise HTTPException(status_code=404, detail="Competition not found")
+        return dict(row)
 
 @router.post("/competitions/join")
 async def join_competition(user_id: int, join: CompetitionJoin):
     """Join a competition"""
-    async with aiosqlite.connect(DB_NAME) as db:
+    async def insert_participant(db: aiosqlite.Connection) -> int:
         # Check if already joined
         async with db.execute(
-            "SELECT * FROM competition_participants WHERE user_id = ? AND competition_id = ?",
+            "SELECT 1 FROM competition_participants WHERE user_id = ? AND competition_id = ?",
             (user_id, join.competition_id)
         ) as cursor:
-            existing = await cursor.fetchone()
-            if existing:
+            if await cursor.fetchone():
                 raise HTTPException(status_code=400, detail="Already joined this competition")
-        
+
         # Get competition details
-        db.row_factory = aiosqlite.Row
         async with db.execute(
             "SELECT * FROM competitions WHERE id = ?",
             (join.competition_id,)
@@ -85,103 +87,120 @@ async def join_competition(user_id: int, join: CompetitionJoin):
             if not competition:
                 raise HTTPException(status_code=404, detail="Competition not found")
             competition = dict(competition)
-        
-        # Deduct participation fee
-        fee = competition.get('participation_fee', 0)
-        if fee > 0:
-            await deduct_balance(user_id, fee, f"Competition participation - {competition['title']}")
-        
-        # Add participant
-        await db.execute(
-            """INSERT INTO competition_participants 
+
+        # Add participant and charge the participation fee together
+        fee = competition.get('participation_fee') or 0
+        cursor = await db.execute(
+            """INSERT INTO competition_participants
                (user_id, competition_id, payment_status)
                VALUES (?, ?, ?)""",
             (user_id, join.competition_id, 'paid' if fee > 0 else 'free')
         )
-        await db.commit()
-    
-    return {"success": True, "message": "Successfully joined competition"}
+        return await debit(
+            db, user_id, fee, f"Competition participation - {competition['title']}",
+            'competition_participant', cursor.lastrowid
+        )
+
+    balance = await pool.write(insert_participant)
+    add_participant(join.competition_id, user_id)
+
+    return {"success": True, "message": "Successfully joined competition", "balance": balance}
 
 @router.get("/competitions/{competition_id}/questions")
-async def get_questions(competition_id: int, user_id: int):
-    """Get competition questions"""
-    async with aiosqlite.connect(DB_NAME) as db:
-        # Check if user is participant
-        async with db.execute(
-            "SELECT * FROM competition_participants WHERE user_id = ? AND competition_id = ?",
-            (user_id, competition_id)
-        ) as cursor:
-            participant = await cursor.fetchone()
-            if not participant:
-                raise HTTPException(status_code=403, detail="Not a participant")
-        
-        # Get questions
-        db.row_factory = aiosqlite.Row
-        async with db.execute(
-            "SELECT * FROM competition_questions WHERE competition_id = ? ORDER BY id",
-            (competition_id,)
-        ) as cursor:
-            rows = await cursor.fetchall()
-            questions = [dict(row) for row in rows]
-    
-    return {"questions": questions}
+async def get_questions(
+    competition_id: int,
+    user_id: int,
+    db: aiosqlite.Connection = Depends(get_db)
+):
+    """Get competition questions (without the correct answers)"""
+    # Check if user is participant
+    if not await is_participant(db, competition_id, user_id):
+        raise HTTPException(status_code=403, detail="Not a participant")
+
+    return Response(
+        content=await get_question_set(db, competition_id), media_type="application/json"
+    )
 
 @router.post("/competitions/submit-test")
 async def submit_test(user_id: int, test: TestAnswer):
     """Submit test answers"""
-    async with aiosqlite.connect(DB_NAME) as db:
+    async def record_score(db: aiosqlite.Connection) -> tuple:
         # Check if already submitted
         async with db.execute(
-            """SELECT * FROM competition_participants 
+            """SELECT 1 FROM competition_participants
                WHERE user_id = ? AND competition_id = ? AND test_submitted = 1""",
             (user_id, test.competition_id)
         ) as cursor:
             if await cursor.fetchone():
                 raise HTTPException(status_code=400, detail="Test already submitted")
-        
+
         # Calculate score
-        db.row_factory = aiosqlite.Row
-        async with db.execute(
-            "SELECT * FROM competition_questions WHERE competition_id = ? ORDER BY id",
-            (test.competition_id,)
-        ) as cursor:
-            questions = await cursor.fetchall()
-        
-        correct_count = 0
-        for i, question in enumerate(questions):
-            if i < len(test.answers) and test.answers[i] == question['correct_answer']:
-                correct_count += 1
-        
-        # Update participant
+        key = await get_answer_key(db, test.competition_id)
+        correct_count = score_answers(test.answers, key)
+
+        # Update participant; triggers keep the leaderboard counts current
         await db.execute(
-            """UPDATE competition_participants 
+            """UPDATE competition_participants
                SET test_submitted = 1, test_score = ?, test_date = CURRENT_TIMESTAMP
                WHERE user_id = ? AND competition_id = ?""",
             (correct_count, user_id, test.competition_id)
         )
-        await db.commit()
-    
+        return correct_count, len(key)
+
+    correct_count, total = await pool.write(record_score)
+
     return {
         "success": True,
         "score": correct_count,
-        "total": len(questions),
-        "message": f"Test submitted! Score: {correct_count}/{len(questions)}"
+        "total": total,
+        "message": f"Test submitted! Score: {correct_count}/{total}"
+    }
+
+@router.get("/competitions/{competition_id}/leaderboard")
+async def get_leaderboard(
+    competition_id: int,
+    user_id: int,
+    limit: int = 10,
+    db: aiosqlite.Connection = Depends(get_db)
+):
+    """Get the top scores of a competition and the caller's rank
+
+    Equal scores share a rank; among them earlier submissions are listed first.
+    """
+    if not schema.leaderboard_enabled:
+        raise HTTPException(status_code=503, detail="Leaderboard is not available")
+
+    limit = max(1, min(limit, 100))
+    counts = await score_counts(db, competition_id)
+    ranks = rank_table(counts)
+
+    leaderboard = await top_scores(db, competition_id, limit)
+    for entry in leaderboard:
+        entry['rank'] = ranks.get(entry['score'])
+
+    me = None
+    score = await my_score(db, competition_id, user_id)
+    if score is not None:
+        me = {"rank": ranks.get(score), "score": score}
+
+    return {
+        "leaderboard": leaderboard,
+        "participants": sum(participants for _, participants in counts),
+        "me": me
     }
 
 @router.get("/my-competitions")
-async def get_my_competitions(user_id: int):
+async def get_my_competitions(user_id: int, db: aiosqlite.Connection = Depends(get_db)):
     """Get user's competitions"""
-    async with aiosqlite.connect(DB_NAME) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute(
-            """SELECT cp.*, c.title, c.book_title, c.status
-               FROM competition_participants cp
-               JOIN competitions c ON cp.competition_id = c.id
-               WHERE cp.user_id = ?
-               ORDER BY cp.joined_at DESC""",
-            (user_id,)
-        ) as cursor:
-            rows = await cursor.fetchall()
-            competitions = [dict(row) for row in rows]
-    
-    return {"competitions": competitions}
\ No newline at end of file
+    async with db.execute(
+        """SELECT cp.*, c.title, c.book_title, c.status
+           FROM competition_participants cp
+           JOIN competitions c ON cp.competition_id = c.id
+           WHERE cp.user_id = ?
+           ORDER BY cp.joined_at DESC""",
+        (user_id,)
+    ) as cursor:
+        rows = await cursor.fetchall()
+        competitions = [dict(row) for row in rows]
+
+    return {"competitions": competitions}
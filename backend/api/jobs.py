@@ -1,7 +1,7 @@
 """
 Jobs API endpoints
 """
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from pydantic import BaseModel
 from typing import List, Optional
 import sys
@@ -10,7 +10,12 @@ import aiosqlite
 
 sys.path.insert(0, str(Path(__file__).parent.parent.parent.parent))
 
-from database import DB_NAME, deduct_balance, get_user_balance
+from core.db import get_db, pool
+from core.ledger import debit
+from core.pagination import fetch_page, count_rows
+from core import schema
+from core.search import build_match_query
+from core.response_cache import response_cache, CATALOG, CATALOG_TTL, CATALOG_MAX_AGE
 
 router = APIRouter()
 
@@ -48,83 +53,95 @@ async def get_jobs(
     region: Optional[str] = None,
     job_type: str = 'monthly',
     limit: int = 20,
-    offset: int = 0
+    offset: int = 0,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: aiosqlite.Connection = Depends(get_db)
 ):
-    """Get job listings"""
-    async with aiosqlite.connect(DB_NAME) as db:
-        db.row_factory = aiosqlite.Row
-        
-        query = "SELECT * FROM jobs WHERE status = 'active' AND job_type = ?"
-        params = [job_type]
-        
-        if category:
-            query += " AND category = ?"
-            params.append(category)
-        
-        if region:
-            query += " AND region = ?"
-            params.append(region)
-        
-        query += " ORDER BY created_at DESC LIMIT ? OFFSET ?"
-        params.extend([limit, offset])
-        
-        async with db.execute(query, params) as cursor:
-            rows = await cursor.fetchall()
-            jobs = [dict(row) for row in rows]
-    
-    return {"jobs": jobs, "total": len(jobs)}
+    """Get job listings
+
+    Pass the returned next_cursor back as `cursor` to fetch the next page.
+    `fields` (comma-separated columns) trims each item to those columns.
+    """
+    where = "status = 'active' AND job_type = ?"
+    params = [job_type]
+
+    if category:
+        where += " AND category = ?"
+        params.append(category)
+
+    if region:
+        where += " AND region = ?"
+        params.append(region)
+
+    jobs, next_cursor = await fetch_page(
+        db, "jobs", where, params, ("created_at", "id"), limit, cursor, offset, fields
+    )
+    total = await count_rows(db, "jobs", where, params)
+
+    return {"jobs": jobs, "total": total, "next_cursor": next_cursor}
 
 @router.get("/daily")
 async def get_daily_jobs(
     region: Optional[str] = None,
     limit: int = 20,
-    offset: int = 0
+    offset: int = 0,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: aiosqlite.Connection = Depends(get_db)
 ):
-    """Get daily job listings"""
-    async with aiosqlite.connect(DB_NAME) as db:
-        db.row_factory = aiosqlite.Row
-        
-        query = "SELECT * FROM daily_jobs WHERE status = 'active'"
-        params = []
-        
-        if region:
-            query += " AND location LIKE ?"
+    """Get daily job listings
+
+    Pass the returned next_cursor back as `cursor` to fetch the next page.
+    `fields` (comma-separated columns) trims each item to those columns.
+    """
+    where = "status = 'active'"
+    params = []
+
+    if region:
+        match = build_match_query(region, column='location') if schema.fts_enabled else None
+        if match:
+            where += " AND id IN (SELECT rowid FROM daily_jobs_fts WHERE daily_jobs_fts MATCH ?)"
+            params.append(match)
+        else:
+            where += " AND location LIKE ?"
             params.append(f"%{region}%")
-        
-        query += " ORDER BY work_date DESC, created_at DESC LIMIT ? OFFSET ?"
-        params.extend([limit, offset])
-        
-        async with db.execute(query, params) as cursor:
-            rows = await cursor.fetchall()
-            jobs = [dict(row) for row in rows]
-    
-    return {"jobs": jobs, "total": len(jobs)}
+
+    jobs, next_cursor = await fetch_page(
+        db, "daily_jobs", where, params, ("work_date", "created_at", "id"),
+        limit, cursor, offset, fields
+    )
+    total = await count_rows(db, "daily_jobs", where, params)
+
+    return {"jobs": jobs, "total": total, "next_cursor": next_cursor}
 
 @router.get("/{job_id}")
-async def get_job(job_id: int):
+async def get_job(job_id: int, db: aiosqlite.Connection = Depends(get_db)):
     """Get job details"""
-    async with aiosqlite.connect(DB_NAME) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)) as cursor:
-            row = await cursor.fetchone()
-            if not row:
-                raise HTTPException(status_code=404, detail="Job not found")
-            return dict(row)
+    async with db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)) as cursor:
+        row = await cursor.fetchone()
+        if not row:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return dict(row)
+
+JOB_CATEGORIES = [
+    "IT va Dasturlash",
+    "Marketing va Reklama",
+    "Savdo va Biznes",
+    "Ta'lim",
+    "Sog'liqni saqlash",
+    "Qurilish",
+    "Transport",
+    "Boshqa"
+]
 
 @router.get("/categories/list")
-async def get_categories():
+async def get_categories(request: Request):
     """Get job categories"""
-    categories = [
-        "IT va Dasturlash",
-        "Marketing va Reklama",
-        "Savdo va Biznes",
-        "Ta'lim",
-        "Sog'liqni saqlash",
-        "Qurilish",
-        "Transport",
-        "Boshqa"
-    ]
-    return {"categories": categories}
+    return await response_cache.serve(
+        request, 'jobs:categories', lambda: {"categories": JOB_CATEGORIES},
+        ttl=CATALOG_TTL, max_age=CATALOG_MAX_AGE, tags=(CATALOG,)
+    )
 
 # ============================================
 # JOB POSTING ENDPOINTS
@@ -133,59 +150,54 @@ async def get_categories():
 @router.post("/create")
 async def create_job(user_id: int, job: JobCreate):
     """Create a new job posting"""
-    # Check if user can post (premium or has balance)
-    balance = await get_user_balance(user_id)
     posting_fee = 5000  # 5,000 so'm per job post
-    
-    if balance < posting_fee:
-        raise HTTPException(status_code=400, detail="Insufficient balance")
-    
-    # Deduct posting fee
-    await deduct_balance(user_id, posting_fee, "Job posting fee")
-    
+
     # Create job
-    async with aiosqlite.connect(DB_NAME) as db:
-        from datetime import datetime, timedelta
-        expires_at = (datetime.now() + timedelta(days=30)).isoformat()
-        
+    from datetime import datetime, timedelta
+    expires_at = (datetime.now() + timedelta(days=30)).isoformat()
+
+    async def insert_job(db: aiosqlite.Connection) -> tuple:
         cursor = await db.execute(
-            """INSERT INTO jobs 
-               (employer_id, title, company, description, requirements, salary_min, 
+            """INSERT INTO jobs
+               (employer_id, title, company, description, requirements, salary_min,
                 salary_max, location, category, expires_at, status, job_type)
                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
             (user_id, job.title, job.company, job.description,
              job.requirements, job.salary_min, job.salary_max,
              job.location, job.category, expires_at, 'active', job.job_type)
         )
-        await db.commit()
         job_id = cursor.lastrowid
-    
-    return {"success": True, "job_id": job_id}
+        # Charge the posting fee in the same transaction
+        balance = await debit(db, user_id, posting_fee, "Job posting fee", 'job', job_id)
+        return job_id, balance
+
+    job_id, balance = await pool.write(insert_job)
+
+    return {"success": True, "job_id": job_id, "balance": balance}
 
 @router.post("/daily/create")
 async def create_daily_job(user_id: int, job: DailyJobCreate):
     """Create a daily job posting"""
-    balance = await get_user_balance(user_id)
     posting_fee = 3000  # 3,000 so'm for daily job
-    
-    if balance < posting_fee:
-        raise HTTPException(status_code=400, detail="Insufficient balance")
-    
-    await deduct_balance(user_id, posting_fee, "Daily job posting fee")
-    
-    async with aiosqlite.connect(DB_NAME) as db:
+
+    async def insert_daily_job(db: aiosqlite.Connection) -> tuple:
         cursor = await db.execute(
-            """INSERT INTO daily_jobs 
-               (user_id, title, description, location, salary, work_date, 
+            """INSERT INTO daily_jobs
+               (user_id, title, description, location, salary, work_date,
                 work_time, contact_phone, status)
                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
             (user_id, job.title, job.description, job.location, job.salary,
              job.work_date, job.work_time, job.contact_phone, 'active')
         )
-        await db.commit()
         job_id = cursor.lastrowid
-    
-    return {"success": True, "job_id": job_id}
+        balance = await debit(
+            db, user_id, posting_fee, "Daily job posting fee", 'daily_job', job_id
+        )
+        return job_id, balance
+
+    job_id, balance = await pool.write(insert_daily_job)
+
+    return {"success": True, "job_id": job_id, "balance": balance}
 
 # ============================================
 # APPLICATION ENDPOINTS
@@ -194,7 +206,7 @@ async def create_daily_job(user_id: int, job: DailyJobCreate):
 @router.post("/apply")
 async def apply_to_job(user_id: int, application: JobApplication):
     """Apply to a job"""
-    async with aiosqlite.connect(DB_NAME) as db:
+    async def insert_application(db: aiosqlite.Connection):
         # Check if already applied
         async with db.execute(
             "SELECT * FROM job_applications WHERE user_id = ? AND job_id = ?",
@@ -203,32 +215,35 @@ async def apply_to_job(user_id: int, application: JobApplication):
             existing = await cursor.fetchone()
             if existing:
                 raise HTTPException(status_code=400, detail="Already applied to this job")
-        
+
         # Create application
         await db.execute(
-            """INSERT INTO job_applications 
+            """INSERT INTO job_applications
                (user_id, job_id, cover_letter, status)
                VALUES (?, ?, ?, ?)""",
             (user_id, application.job_id, application.cover_letter, 'pending')
         )
-        await db.commit()
-    
+
+    await pool.write(insert_application)
+
     return {"success": True, "message": "Application submitted"}
 
 @router.get("/applications/my")
-async def get_my_applications(user_id: int, limit: int = 20):
+async def get_my_applications(
+    user_id: int,
+    limit: int = 20,
+    db: aiosqlite.Connection = Depends(get_db)
+):
     """Get user's job applications"""
-    async with aiosqlite.connect(DB_NAME) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute(
-            """SELECT ja.*, j.title, j.company 
-               FROM job_applications ja
-               JOIN jobs j ON ja.job_id = j.id
-               WHERE ja.user_id = ?
-               ORDER BY ja.created_at DESC LIMIT ?""",
-            (user_id, limit)
-        ) as cursor:
-            rows = await cursor.fetchall()
-            applications = [dict(row) for row in rows]
-    
-    return {"applications": applications}
\ No newline at end of file
+    async with db.execute(
+        """SELECT ja.*, j.title, j.company
+           FROM job_applications ja
+           JOIN jobs j ON ja.job_id = j.id
+           WHERE ja.user_id = ?
+           ORDER BY ja.created_at DESC LIMIT ?""",
+        (user_id, limit)
+    ) as cursor:
+        rows = await cursor.fetchall()
+        applications = [dict(row) for row in rows]
+
+    return {"applications": applications}
@@ -1,7 +1,7 @@
 """
 Marketplace API endpoints
 """
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from pydantic import BaseModel
 from typing import List, Optional
 import sys
@@ -10,7 +10,14 @@ import aiosqlite
 
 sys.path.insert(0, str(Path(__file__).parent.parent.parent.parent))
 
-from database import DB_NAME, get_user_balance, deduct_balance, add_balance
+from core.db import get_db, pool
+from core.ledger import debit
+from core.pagination import fetch_page, count_rows
+from core import events
+from core.events import event_bus
+from core.orders import place_order_line, place_cart, stock_after
+from core.response_cache import response_cache, CATALOG, CATALOG_TTL, CATALOG_MAX_AGE
+from core.responses import decode_json_fields
 
 router = APIRouter()
 
@@ -29,6 +36,15 @@ class OrderCreate(BaseModel):
     delivery_address: str
     phone: str
 
+class CartItem(BaseModel):
+    product_id: int
+    quantity: int
+
+class CartCreate(BaseModel):
+    items: List[CartItem]
+    delivery_address: str
+    phone: str
+
 # ============================================
 # PRODUCT ENDPOINTS
 # ============================================
@@ -38,162 +54,186 @@ async def get_products(
     category: Optional[str] = None,
     region: Optional[str] = None,
     limit: int = 20,
-    offset: int = 0
+    offset: int = 0,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: aiosqlite.Connection = Depends(get_db)
 ):
-    """Get marketplace products"""
-    async with aiosqlite.connect(DB_NAME) as db:
-        db.row_factory = aiosqlite.Row
-        
-        query = "SELECT * FROM products WHERE status = 'active' AND stock > 0"
-        params = []
-        
-        if category:
-            query += " AND category = ?"
-            params.append(category)
-        
-        if region:
-            query += " AND region = ?"
-            params.append(region)
-        
-        query += " ORDER BY created_at DESC LIMIT ? OFFSET ?"
-        params.extend([limit, offset])
-        
-        async with db.execute(query, params) as cursor:
-            rows = await cursor.fetchall()
-            products = [dict(row) for row in rows]
-    
-    return {"products": products, "total": len(products)}
+    """Get marketplace products
+
+    Pass the returned next_cursor back as `cursor` to fetch the next page.
+    `fields` (comma-separated columns) trims each item to those columns.
+    """
+    where = "status = 'active' AND stock > 0"
+    params = []
+
+    if category:
+        where += " AND category = ?"
+        params.append(category)
+
+    if region:
+        where += " AND region = ?"
+        params.append(region)
+
+    products, next_cursor = await fetch_page(
+        db, "products", where, params, ("created_at", "id"), limit, cursor, offset, fields
+    )
+    total = await count_rows(db, "products", where, params)
+
+    for product in products:
+        decode_json_fields(product)
+    return {"products": products, "total": total, "next_cursor": next_cursor}
 
 @router.get("/products/{product_id}")
-async def get_product(product_id: int):
+async def get_product(product_id: int, db: aiosqlite.Connection = Depends(get_db)):
     """Get product details"""
-    async with aiosqlite.connect(DB_NAME) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute("SELECT * FROM products WHERE id = ?", (product_id,)) as cursor:
-            row = await cursor.fetchone()
-            if not row:
-                raise HTTPException(status_code=404, detail="Product not found")
-            return dict(row)
+    async with db.execute("SELECT * FROM products WHERE id = ?", (product_id,)) as cursor:
+        row = await cursor.fetchone()
+        if not row:
+            raise HTTPException(status_code=404, detail="Product not found")
+        return decode_json_fields(dict(row))
 
 @router.post("/products/create")
 async def create_product(user_id: int, product: ProductCreate):
     """Create a new product listing"""
-    # Check balance for listing fee
-    balance = await get_user_balance(user_id)
     listing_fee = 5000  # 5,000 so'm
-    
-    if balance < listing_fee:
-        raise HTTPException(status_code=400, detail="Insufficient balance for listing fee")
-    
-    await deduct_balance(user_id, listing_fee, "Product listing fee")
-    
-    async with aiosqlite.connect(DB_NAME) as db:
-        import json
+
+    import json
+
+    async def insert_product(db: aiosqlite.Connection) -> tuple:
         cursor = await db.execute(
-            """INSERT INTO products 
+            """INSERT INTO products
                (seller_id, name, description, price, category, location, stock, images, status)
                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
             (user_id, product.name, product.description, product.price,
              product.category, product.location, product.stock,
              json.dumps(product.images), 'active')
         )
-        await db.commit()
         product_id = cursor.lastrowid
-    
-    return {"success": True, "product_id": product_id}
+        balance = await debit(
+            db, user_id, listing_fee, "Product listing fee", 'product', product_id,
+            insufficient="Insufficient balance for listing fee"
+        )
+        return product_id, balance
+
+    product_id, balance = await pool.write(insert_product)
+
+    return {"success": True, "product_id": product_id, "balance": balance}
+
+PRODUCT_CATEGORIES = [
+    "Elektronika",
+    "Kiyim-kechak",
+    "Uy-ro'zg'or",
+    "Kitoblar",
+    "Sport va Faoliyat",
+    "Bolalar uchun",
+    "Boshqa"
+]
 
 @router.get("/categories")
-async def get_categories():
+async def get_categories(request: Request):
     """Get product categories"""
-    categories = [
-        "Elektronika",
-        "Kiyim-kechak",
-        "Uy-ro'zg'or",
-        "Kitoblar",
-        "Sport va Faoliyat",
-        "Bolalar uchun",
-        "Boshqa"
-    ]
-    return {"categories": categories}
+    return await response_cache.serve(
+        request, 'market:categories', lambda: {"categories": PRODUCT_CATEGORIES},
+        ttl=CATALOG_TTL, max_age=CATALOG_MAX_AGE, tags=(CATALOG,)
+    )
 
 # ============================================
 # ORDER ENDPOINTS
 # ============================================
 
+def publish_orders(buyer_id: int, orders: List[dict], stock: dict):
+    """Tell the buyer and each seller about new orders and the stock left"""
+    for order in orders:
+        seller_id, left = stock.get(order["product_id"], (None, None))
+        event_bus.publish(
+            events.ORDER_CREATED, dict(order, kind="market", buyer_id=buyer_id),
+            users=(buyer_id, seller_id)
+        )
+        event_bus.publish(
+            events.STOCK_CHANGED, {"product_id": order["product_id"], "stock": left},
+            users=(seller_id,)
+        )
+
 @router.post("/orders/create")
 async def create_order(user_id: int, order: OrderCreate):
     """Create a product order"""
-    async with aiosqlite.connect(DB_NAME) as db:
-        # Get product
-        db.row_factory = aiosqlite.Row
-        async with db.execute("SELECT * FROM products WHERE id = ?", (order.product_id,)) as cursor:
-            product = await cursor.fetchone()
-            if not product:
-                raise HTTPException(status_code=404, detail="Product not found")
-            
-            product = dict(product)
-        
-        # Check stock
-        if product['stock'] < order.quantity:
-            raise HTTPException(status_code=400, detail="Insufficient stock")
-        
-        # Calculate total
-        total_price = product['price'] * order.quantity
-        commission = int(total_price * 0.05)  # 5% commission
-        
-        # Create order
-        cursor = await db.execute(
-            """INSERT INTO orders 
-               (buyer_id, seller_id, product_id, quantity, total_price, 
-                commission_amount, delivery_address, buyer_phone, status)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-            (user_id, product['seller_id'], order.product_id, order.quantity,
-             total_price, commission, order.delivery_address, order.phone, 'pending')
+    async def place_order(db: aiosqlite.Connection) -> tuple:
+        order_id, total_price = await place_order_line(
+            db, user_id, order.product_id, order.quantity,
+            order.delivery_address, order.phone
         )
-        await db.commit()
-        order_id = cursor.lastrowid
-        
-        # Update stock
-        await db.execute(
-            "UPDATE products SET stock = stock - ? WHERE id = ?",
-            (order.quantity, order.product_id)
-        )
-        await db.commit()
-    
+        return order_id, total_price, await stock_after(db, [order.product_id])
+
+    order_id, total_price, stock = await pool.write(place_order)
+    publish_orders(user_id, [{
+        "order_id": order_id,
+        "product_id": order.product_id,
+        "quantity": order.quantity,
+        "total_price": total_price,
+    }], stock)
+
     return {"success": True, "order_id": order_id, "total_price": total_price}
 
+@router.post("/orders/cart")
+async def create_cart_orders(user_id: int, cart: CartCreate):
+    """Place every cart item in one transaction
+
+    Either all items are ordered or, if any product is missing or short on
+    stock, none are.
+    """
+    async def place(db: aiosqlite.Connection) -> tuple:
+        orders = await place_cart(
+            db, user_id, [(item.product_id, item.quantity) for item in cart.items],
+            cart.delivery_address, cart.phone
+        )
+        return orders, await stock_after(db, [o["product_id"] for o in orders])
+
+    orders, stock = await pool.write(place)
+    publish_orders(user_id, orders, stock)
+
+    return {
+        "success": True,
+        "orders": orders,
+        "total_price": sum(o["total_price"] for o in orders)
+    }
+
 @router.get("/orders/my")
-async def get_my_orders(user_id: int, limit: int = 20):
+async def get_my_orders(
+    user_id: int,
+    limit: int = 20,
+    db: aiosqlite.Connection = Depends(get_db)
+):
     """Get user's orders"""
-    async with aiosqlite.connect(DB_NAME) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute(
-            """SELECT o.*, p.name as product_name, p.price
-               FROM orders o
-               JOIN products p ON o.product_id = p.id
-               WHERE o.buyer_id = ?
-               ORDER BY o.created_at DESC LIMIT ?""",
-            (user_id, limit)
-        ) as cursor:
-            rows = await cursor.fetchall()
-            orders = [dict(row) for row in rows]
-    
+    async with db.execute(
+        """SELECT o.*, p.name as product_name, p.price
+           FROM orders o
+           JOIN products p ON o.product_id = p.id
+           WHERE o.buyer_id = ?
+           ORDER BY o.created_at DESC LIMIT ?""",
+        (user_id, limit)
+    ) as cursor:
+        rows = await cursor.fetchall()
+        orders = [dict(row) for row in rows]
+
     return {"orders": orders}
 
 @router.get("/orders/selling")
-async def get_selling_orders(user_id: int, limit: int = 20):
+async def get_selling_orders(
+    user_id: int,
+    limit: int = 20,
+    db: aiosqlite.Connection = Depends(get_db)
+):
     """Get seller's orders"""
-    async with aiosqlite.connect(DB_NAME) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute(
-            """SELECT o.*, p.name as product_name
-               FROM orders o
-               JOIN products p ON o.product_id = p.id
-               WHERE o.seller_id = ?
-               ORDER BY o.created_at DESC LIMIT ?""",
-            (user_id, limit)
-        ) as cursor:
-            rows = await cursor.fetchall()
-            orders = [dict(row) for row in rows]
-    
-    return {"orders": orders}
\ No newline at end of file
+    async with db.execute(
+        """SELECT o.*, p.name as product_name
+           FROM orders o
+           JOIN products p ON o.product_id = p.id
+           WHERE o.seller_id = ?
+           ORDER BY o.created_at DESC LIMIT ?""",
+        (user_id, limit)
+    ) as cursor:
+        rows = await cursor.fetchall()
+        orders = [dict(row) for row in rows]
+
+    return {"orders": orders}
@@ -1,7 +1,7 @@
 """
 Premium API endpoints
 """
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from pydantic import BaseModel
 from typing import Optional
 import sys
@@ -13,6 +13,9 @@ from database import (
     get_premium_settings_db, activate_premium, get_premium_info,
     create_payment_request, get_user
 )
+from core.response_cache import (
+    response_cache, PREMIUM_SETTINGS, SETTINGS_TTL, SETTINGS_MAX_AGE
+)
 
 router = APIRouter()
 
@@ -25,8 +28,15 @@ class PremiumPurchase(BaseModel):
 # ============================================
 
 @router.get("/plans")
-async def get_premium_plans():
+async def get_premium_plans(request: Request):
     """Get premium plans and pricing"""
+    return await response_cache.serve(
+        request, 'premium:plans', build_premium_plans,
+        ttl=SETTINGS_TTL, max_age=SETTINGS_MAX_AGE, tags=(PREMIUM_SETTINGS,)
+    )
+
+async def build_premium_plans() -> dict:
+    """Premium plans with prices from the current settings"""
     settings = await get_premium_settings_db()
     
     plans = [
@@ -1,15 +1,19 @@
 """
 Resume Builder API endpoints
 """
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import FileResponse
 from pydantic import BaseModel
 from typing import List, Optional
+import json
 import sys
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent.parent.parent.parent))
 
 from database import save_resume, get_user_resumes, delete_resume, get_resume_by_id
+from core.response_cache import response_cache, CATALOG, CATALOG_TTL, CATALOG_MAX_AGE
+from core.pdf import pdf_renderer, TEMPLATES
 
 router = APIRouter()
 
@@ -74,6 +78,54 @@ async def get_resume(user_id: int, resume_id: int):
     
     return resume
 
+def _resume_fields(resume: dict) -> dict:
+    """Resume fields, whether stored as columns or as a JSON `data` column"""
+    fields = dict(resume)
+    if isinstance(fields.get('data'), str):
+        try:
+            fields.update(json.loads(fields['data']))
+        except ValueError:
+            pass
+    return fields
+
+@router.get("/{resume_id}/pdf")
+async def get_resume_pdf(
+    request: Request,
+    user_id: int,
+    resume_id: int,
+    template: Optional[str] = None
+):
+    """Download a resume as PDF, rendered once per content and template
+
+    Supports Range requests and If-None-Match.
+    """
+    resume = await get_resume_by_id(resume_id)
+    if not resume:
+        raise HTTPException(status_code=404, detail="Resume not found")
+
+    if resume.get('user_id') != user_id:
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    fields = _resume_fields(resume)
+    template = template or fields.get('template') or 'classic'
+    if template not in TEMPLATES:
+        raise HTTPException(status_code=400, detail="Unknown template")
+
+    path = await pdf_renderer.get(fields, template)
+    # The file name is the content hash, so it doubles as a strong ETag
+    etag = f'"{path.stem}"'
+    headers = {'ETag': etag, 'Cache-Control': 'private, max-age=0, must-revalidate'}
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match and etag in (tag.strip() for tag in if_none_match.split(',')):
+        return Response(status_code=304, headers=headers)
+
+    return FileResponse(
+        path,
+        media_type='application/pdf',
+        filename=f"resume_{resume_id}_{template}.pdf",
+        headers=headers
+    )
+
 @router.delete("/{resume_id}")
 async def delete_resume_endpoint(user_id: int, resume_id: int):
     """Delete a resume"""
@@ -87,13 +139,17 @@ async def delete_resume_endpoint(user_id: int, resume_id: int):
     success = await delete_resume(resume_id)
     return {"success": success}
 
+RESUME_TEMPLATES = [
+    {"id": "classic", "name": "Classic", "preview": "/templates/classic.png"},
+    {"id": "modern", "name": "Modern", "preview": "/templates/modern.png"},
+    {"id": "professional", "name": "Professional", "preview": "/templates/professional.png"},
+    {"id": "creative", "name": "Creative", "preview": "/templates/creative.png"}
+]
+
 @router.get("/templates/list")
-async def get_templates():
+async def get_templates(request: Request):
     """Get available resume templates"""
-    templates = [
-        {"id": "classic", "name": "Classic", "preview": "/templates/classic.png"},
-        {"id": "modern", "name": "Modern", "preview": "/templates/modern.png"},
-        {"id": "professional", "name": "Professional", "preview": "/templates/professional.png"},
-        {"id": "creative", "name": "Creative", "preview": "/templates/creative.png"}
-    ]
-    return {"templates": templates}
\ No newline at end of file
+    return await response_cache.serve(
+        request, 'resume:templates', lambda: {"templates": RESUME_TEMPLATES},
+        ttl=CATALOG_TTL, max_age=CATALOG_MAX_AGE, tags=(CATALOG,)
+    )
\ No newline at end of file
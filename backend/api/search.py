@@ -0,0 +1,51 @@
+"""
+Search API endpoints
+"""
+from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional
+import aiosqlite
+
+from core import schema
+from core.db import get_db
+from core.responses import decode_json_fields
+from core.search import SEARCHABLE, build_match_query, search_table
+
+router = APIRouter()
+
+# ============================================
+# SEARCH ENDPOINTS
+# ============================================
+
+@router.get("")
+async def search(
+    q: str,
+    types: Optional[str] = None,
+    limit: int = 20,
+    db: aiosqlite.Connection = Depends(get_db)
+):
+    """Keyword search across jobs, daily jobs and products
+
+    `types` is a comma-separated subset of jobs,daily_jobs,products.
+    Matches are prefix-based and ranked with BM25; each result carries a
+    highlighted `snippet` (HTML-escaped, matches wrapped in <mark>).
+    """
+    if not schema.fts_enabled:
+        raise HTTPException(status_code=503, detail="Search is not available")
+
+    tables = [t.strip() for t in types.split(',')] if types else list(SEARCHABLE)
+    unknown = [t for t in tables if t not in SEARCHABLE]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown search type: {', '.join(unknown)}")
+
+    match = build_match_query(q)
+    if not match:
+        raise HTTPException(status_code=400, detail="Search query is empty")
+
+    limit = max(1, min(limit, 50))
+    results = {}
+    for table in tables:
+        results[table] = [
+            decode_json_fields(item) for item in await search_table(db, table, match, limit)
+        ]
+
+    return {"query": q, "results": results}
@@ -1,9 +1,11 @@
 """
 Tekin Obunachi API endpoints
 """
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from pydantic import BaseModel
 from typing import List, Optional
+import asyncio
+import os
 import sys
 from pathlib import Path
 
@@ -17,9 +19,26 @@ from tekin_obunachi_db import (
     get_recent_activities, PRICES
 )
 from database import create_payment_request
+from core import events
+from core.cache import TTLCache
+from core.db import pool
+from core.dispatch import TaskDispatcher
+from core.events import event_bus
+from core.response_cache import response_cache, CATALOG, CATALOG_TTL, CATALOG_MAX_AGE
 
 router = APIRouter()
 
+# user_id -> (balance, activities limit, dashboard). An entry is only reused
+# while the balance is unchanged, so balance changes made anywhere (other
+# workers, the bot) show up immediately; the TTL bounds the rest.
+dashboards = TTLCache(
+    maxsize=int(os.getenv('DASHBOARD_CACHE_SIZE', '5000')),
+    ttl=float(os.getenv('DASHBOARD_CACHE_TTL', '30'))
+)
+
+# Active admin tasks served from memory; started and stopped by the app lifespan
+task_dispatcher = TaskDispatcher(get_active_admin_tasks, submit_task_completion)
+
 # Pydantic models
 class BalanceResponse(BaseModel):
     balance: int
@@ -47,8 +66,9 @@ class TopupRequest(BaseModel):
 @router.get("/balance")
 async def get_balance(user_id: int):
     """Get user's Tekin Obunachi balance"""
-    balance = await get_tekin_balance(user_id)
-    stats = await get_tekin_balance_stats(user_id)
+    balance, stats = await asyncio.gather(
+        get_tekin_balance(user_id), get_tekin_balance_stats(user_id)
+    )
     
     return BalanceResponse(
         balance=balance,
@@ -57,6 +77,37 @@ async def get_balance(user_id: int):
         total_withdrawn=stats.get('total_withdrawn', 0)
     )
 
+@router.get("/dashboard")
+async def get_dashboard(user_id: int, activities_limit: int = 10):
+    """Balance, balance totals, stats, achievements and recent activities in one call"""
+    activities_limit = max(1, min(activities_limit, 50))
+
+    # The bot's helpers share one pooled reader instead of a connection each
+    async with pool.lend():
+        balance = await get_tekin_balance(user_id)
+        cached = dashboards.get(user_id)
+        if cached and cached[:2] == (balance, activities_limit):
+            return cached[2]
+        balance_stats = await get_tekin_balance_stats(user_id)
+        stats = await get_user_tekin_stats(user_id)
+        achievements = await get_user_achievements(user_id)
+        activities = await get_recent_activities(user_id, activities_limit)
+    dashboard = {
+        "balance": balance,
+        "total_earned": balance_stats.get('total_earned', 0),
+        "total_spent": balance_stats.get('total_spent', 0),
+        "total_withdrawn": balance_stats.get('total_withdrawn', 0),
+        "stats": stats,
+        "achievements": achievements,
+        "activities": activities
+    }
+    dashboards.set(user_id, (balance, activities_limit, dashboard))
+    return dashboard
+
+def invalidate_dashboard(user_id: int):
+    """Drop a user's cached dashboard after a change made through this API"""
+    dashboards.pop(user_id)
+
 @router.get("/stats")
 async def get_stats(user_id: int):
     """Get user's Tekin Obunachi statistics"""
@@ -83,26 +134,52 @@ async def get_activities(user_id: int, limit: int = 20):
 async def claim_daily(user_id: int):
     """Claim daily bonus"""
     result = await claim_daily_bonus(user_id)
+    invalidate_dashboard(user_id)
     if result:
         return {"success": True, "amount": result, "message": "Daily bonus claimed!"}
     else:
         return {"success": False, "message": "Already claimed today"}
 
 @router.get("/tasks")
-async def get_tasks(user_id: int):
-    """Get available admin tasks"""
-    tasks = await get_active_admin_tasks()
-    return {"tasks": tasks}
+async def get_tasks(user_id: int, task_type: Optional[str] = None, limit: int = 50):
+    """Get available admin tasks, best paying first"""
+    if task_dispatcher.loaded_at is None:
+        # Snapshot not loaded yet
+        tasks = await get_active_admin_tasks()
+        return {"tasks": tasks}
+    limit = max(1, min(limit, 200))
+    return {"tasks": task_dispatcher.available(user_id, task_type, limit)}
+
+@router.get("/tasks/next")
+async def get_next_task(user_id: int, task_type: Optional[str] = None):
+    """Get the next task this user hasn't done yet"""
+    return {"task": task_dispatcher.next_task(user_id, task_type)}
 
 @router.post("/tasks/submit")
 async def submit_task(user_id: int, submission: TaskSubmission):
     """Submit task completion"""
+    if task_dispatcher.has(submission.task_id):
+        # Refused from memory, or written with the dispatcher's next batch
+        error = await task_dispatcher.claim(user_id, submission.task_id, submission.proof_url)
+        if error:
+            return {"success": False, "message": error}
+        invalidate_dashboard(user_id)
+        event_bus.publish(
+            events.TASK_SUBMITTED, {"task_id": submission.task_id, "user_id": user_id}, admin=True
+        )
+        return {"success": True, "message": "Task submitted for review"}
+
+    # Not in the snapshot (e.g. added since the last reload)
     success = await submit_task_completion(
         user_id=user_id,
         task_id=submission.task_id,
         proof_url=submission.proof_url
     )
+    invalidate_dashboard(user_id)
     if success:
+        event_bus.publish(
+            events.TASK_SUBMITTED, {"task_id": submission.task_id, "user_id": user_id}, admin=True
+        )
         return {"success": True, "message": "Task submitted for review"}
     else:
         return {"success": False, "message": "Failed to submit task"}
@@ -112,9 +189,12 @@ async def submit_task(user_id: int, submission: TaskSubmission):
 # ============================================
 
 @router.get("/prices")
-async def get_prices():
+async def get_prices(request: Request):
     """Get service prices"""
-    return PRICES
+    return await response_cache.serve(
+        request, 'tekin:prices', lambda: PRICES,
+        ttl=CATALOG_TTL, max_age=CATALOG_MAX_AGE, tags=(CATALOG,)
+    )
 
 @router.post("/orders")
 async def create_order(user_id: int, order: OrderCreate):
@@ -126,6 +206,13 @@ async def create_order(user_id: int, order: OrderCreate):
             quantity=order.quantity,
             target=order.target
         )
+        invalidate_dashboard(user_id)
+        event_bus.publish(
+            events.ORDER_CREATED,
+            {"kind": "tekin", "order_id": order_id, "order_type": order.order_type,
+             "quantity": order.quantity},
+            users=(user_id,)
+        )
         return {"success": True, "order_id": order_id}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -155,6 +242,11 @@ async def request_topup(user_id: int, topup: TopupRequest):
             amount=topup.amount,
             receipt_photo=topup.receipt_photo
         )
+        event_bus.publish(
+            events.PAYMENT_CREATED,
+            {"request_id": request_id, "user_id": user_id, "amount": topup.amount},
+            admin=True
+        )
         return {"success": True, "request_id": request_id, "message": "Top-up request submitted"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
@@ -0,0 +1,142 @@
+"""
+Leaderboard benchmark
+Seeds one competition with many submitted participants, maintains
+competition_score_counts with the triggers from core.schema and compares
+"my rank" via COUNT(*) over participants with the score-count lookup.
+Also times scoring against a cached answer key vs re-reading the questions.
+
+Usage:
+    python benchmarks/bench_leaderboard.py --participants 100000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from core.competitions import compact_key, rank_table, score_answers
+from core.schema import LEADERBOARD_TABLES, leaderboard_triggers
+
+QUESTIONS = 30
+
+
+def seed(path: str, participants: int):
+    db = sqlite3.connect(path)
+    db.executescript(
+        """CREATE TABLE users (user_id INTEGER PRIMARY KEY, first_name TEXT, username TEXT);
+           CREATE TABLE competition_questions (
+               id INTEGER PRIMARY KEY AUTOINCREMENT, competition_id INTEGER,
+               question TEXT, options TEXT, correct_answer INTEGER
+           );
+           CREATE TABLE competition_participants (
+               id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, competition_id INTEGER,
+               payment_status TEXT, test_submitted INTEGER DEFAULT 0, test_score INTEGER,
+               test_date TIMESTAMP, joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+           );"""
+    )
+    for statement in LEADERBOARD_TABLES + leaderboard_triggers():
+        db.execute(statement)
+
+    rng = random.Random(3)
+    db.executemany(
+        "INSERT INTO competition_questions (competition_id, question, options, correct_answer) "
+        "VALUES (1, 'q', '[]', ?)",
+        [(rng.randint(0, 3),) for _ in range(QUESTIONS)]
+    )
+    db.executemany(
+        "INSERT INTO users (user_id, first_name) VALUES (?, ?)",
+        [(i, f"user {i}") for i in range(participants)]
+    )
+
+    started = time.perf_counter()
+    db.executemany(
+        """INSERT INTO competition_participants
+           (user_id, competition_id, payment_status, test_submitted, test_score, test_date)
+           VALUES (?, 1, 'free', 1, ?, datetime('now', ?))""",
+        [(i, min(QUESTIONS, max(0, int(rng.gauss(18, 5)))), f"-{i} seconds")
+         for i in range(participants)]
+    )
+    db.commit()
+    print(f"seeded {participants:,} submissions (triggers on) in {time.perf_counter() - started:.1f}s")
+    return db
+
+
+def timed(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+def main(args):
+    path = os.path.join(tempfile.mkdtemp(), 'bench_leaderboard.db')
+    db = seed(path, args.participants)
+    user_id = args.participants // 2
+    score = db.execute(
+        "SELECT test_score FROM competition_participants WHERE user_id = ?", (user_id,)
+    ).fetchone()[0]
+
+    def count_rank():
+        return 1 + db.execute(
+            """SELECT COUNT(*) FROM competition_participants
+               WHERE competition_id = 1 AND test_submitted = 1 AND test_score > ?""",
+            (score,)
+        ).fetchone()[0]
+
+    def counts_rank():
+        counts = db.execute(
+            """SELECT score, participants FROM competition_score_counts
+               WHERE competition_id = 1 AND participants > 0 ORDER BY score DESC"""
+        ).fetchall()
+        return rank_table(counts)[score]
+
+    def top_n():
+        return db.execute(
+            """SELECT cp.user_id, cp.test_score, u.first_name FROM competition_participants cp
+               LEFT JOIN users u ON u.user_id = cp.user_id
+               WHERE cp.competition_id = 1 AND cp.test_submitted = 1
+                 AND cp.test_score IS NOT NULL
+               ORDER BY cp.test_score DESC, cp.test_date ASC LIMIT 10"""
+        ).fetchall()
+
+    assert count_rank() == counts_rank()
+    print(f"{'my rank, COUNT(*)':<32} {timed(count_rank, args.repeat):>8.3f} ms")
+    print(f"{'my rank, score counts':<32} {timed(counts_rank, args.repeat):>8.3f} ms")
+    print(f"{'top 10':<32} {timed(top_n, args.repeat):>8.3f} ms")
+
+    answers = [random.randint(0, 3) for _ in range(QUESTIONS)]
+
+    def score_from_rows():
+        db.row_factory = sqlite3.Row
+        rows = db.execute(
+            "SELECT * FROM competition_questions WHERE competition_id = 1 ORDER BY id"
+        ).fetchall()
+        db.row_factory = None
+        return sum(
+            1 for i, q in enumerate(rows) if i < len(answers) and answers[i] == q['correct_answer']
+        )
+
+    key = compact_key([
+        row[0] for row in db.execute(
+            "SELECT correct_answer FROM competition_questions WHERE competition_id = 1 ORDER BY id"
+        )
+    ])
+    assert score_from_rows() == score_answers(answers, key)
+    print(f"{'score, SELECT * + loop':<32} {timed(score_from_rows, args.repeat):>8.3f} ms")
+    print(f"{'score, cached key':<32} {timed(lambda: score_answers(answers, key), args.repeat):>8.3f} ms")
+    db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--participants', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=50)
+    main(parser.parse_args())
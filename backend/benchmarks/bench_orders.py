@@ -0,0 +1,150 @@
+"""
+Order placement load test
+Fires concurrent orders and carts at a handful of low-stock products through
+ConnectionPool.write() and checks that no product is oversold: for every
+product, ordered quantity + remaining stock must equal the starting stock.
+
+--legacy replays the old flow (read stock, insert, then decrement in separate
+steps) for comparison.
+
+Usage:
+    python benchmarks/bench_orders.py --orders 5000 --concurrency 300 --mode wal
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from fastapi import HTTPException
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from core.db import ConnectionPool
+from core.orders import place_cart, place_order_line
+
+
+def create_db(path: str, products: int, stock: int):
+    db = sqlite3.connect(path)
+    db.executescript(
+        """CREATE TABLE products (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               seller_id INTEGER, name TEXT, price INTEGER, stock INTEGER,
+               status TEXT DEFAULT 'active'
+           );
+           CREATE TABLE orders (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               buyer_id INTEGER, seller_id INTEGER, product_id INTEGER,
+               quantity INTEGER, total_price INTEGER, commission_amount INTEGER,
+               delivery_address TEXT, buyer_phone TEXT, status TEXT,
+               created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+           );"""
+    )
+    db.executemany(
+        "INSERT INTO products (seller_id, name, price, stock) VALUES (?, ?, ?, ?)",
+        [(1, f"product {i}", 10000, stock) for i in range(products)]
+    )
+    db.commit()
+    db.close()
+
+
+async def legacy_order(pool: ConnectionPool, buyer_id: int, product_id: int, quantity: int):
+    """The pre-transactional flow: check, insert, decrement as separate steps"""
+    async with pool.reader() as db:
+        async with db.execute("SELECT * FROM products WHERE id = ?", (product_id,)) as cursor:
+            product = dict(await cursor.fetchone())
+    if product['stock'] < quantity:
+        raise HTTPException(status_code=400, detail="Insufficient stock")
+
+    async def insert(db):
+        await db.execute(
+            """INSERT INTO orders (buyer_id, seller_id, product_id, quantity, total_price, status)
+               VALUES (?, ?, ?, ?, ?, 'pending')""",
+            (buyer_id, product['seller_id'], product_id, quantity, product['price'] * quantity)
+        )
+
+    async def decrement(db):
+        await db.execute(
+            "UPDATE products SET stock = stock - ? WHERE id = ?", (quantity, product_id)
+        )
+
+    await pool.write(insert)
+    await asyncio.sleep(0)
+    await pool.write(decrement)
+
+
+def verify(path: str, stock: int) -> list:
+    db = sqlite3.connect(path)
+    rows = db.execute(
+        """SELECT p.id, p.stock, COALESCE(SUM(o.quantity), 0)
+           FROM products p LEFT JOIN orders o ON o.product_id = p.id
+           GROUP BY p.id"""
+    ).fetchall()
+    db.close()
+    return [
+        (product_id, remaining, ordered) for product_id, remaining, ordered in rows
+        if remaining < 0 or remaining + ordered != stock
+    ]
+
+
+async def main(args):
+    path = os.path.join(tempfile.mkdtemp(), 'bench_orders.db')
+    create_db(path, args.products, args.stock)
+    pool = ConnectionPool(size=4, storage_mode=args.mode)
+    await pool.open(path)
+
+    rng = random.Random(7)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    outcome = {'placed': 0, 'rejected': 0}
+
+    async def one(i):
+        product_id = rng.randint(1, args.products)
+        quantity = rng.randint(1, 3)
+        async with semaphore:
+            try:
+                if args.legacy:
+                    await legacy_order(pool, i, product_id, quantity)
+                elif i % 10 == 0:
+                    # Every tenth buyer checks out a two-item cart
+                    other = rng.randint(1, args.products)
+                    await pool.write(lambda db: place_cart(
+                        db, i, [(product_id, quantity), (other, 1)], "Toshkent", "+998901234567"
+                    ))
+                else:
+                    await pool.write(lambda db: place_order_line(
+                        db, i, product_id, quantity, "Toshkent", "+998901234567"
+                    ))
+                outcome['placed'] += 1
+            except HTTPException:
+                outcome['rejected'] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.orders)))
+    elapsed = time.perf_counter() - started
+    await pool.close()
+
+    label = 'legacy' if args.legacy else f"atomic ({args.mode})"
+    print(
+        f"{label:<18} {args.orders / elapsed:>8,.0f} orders/s  "
+        f"placed={outcome['placed']} rejected={outcome['rejected']}"
+    )
+    oversold = verify(path, args.stock)
+    if oversold:
+        print(f"OVERSOLD {len(oversold)} products, e.g. (id, stock, ordered) {oversold[:3]}")
+        sys.exit(1)
+    print("no overselling: ordered + remaining == starting stock for every product")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--orders', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=300)
+    parser.add_argument('--products', type=int, default=20)
+    parser.add_argument('--stock', type=int, default=100)
+    parser.add_argument('--mode', choices=['default', 'wal'], default='default')
+    parser.add_argument('--legacy', action='store_true')
+    asyncio.run(main(parser.parse_args()))
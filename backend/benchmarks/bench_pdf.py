@@ -0,0 +1,107 @@
+"""
+Resume PDF benchmark
+Times a cold render of each template, a warm request served from the disk
+cache, and a burst of distinct resumes rendered through the process pool
+while measuring how late a 10ms ticker on the event loop fires (loop lag).
+
+Usage:
+    python benchmarks/bench_pdf.py --resumes 40 --workers 2
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from core.pdf import TEMPLATES, PdfRenderer, render
+
+RESUME = {
+    'full_name': "Oʻktam Gʻaniyev",
+    'phone': "+998 90 123 45 67",
+    'email': "oktam@example.com",
+    'date_of_birth': "1998-04-12",
+    'address': "Toshkent, Chilonzor tumani",
+    'objective': "Backend dasturchi sifatida yuqori yuklamali tizimlar ustida ishlash.",
+    'education': "TATU, Dasturiy injiniring (2016-2020)",
+    'experience': "\n".join(
+        f"Kompaniya {i} — Python dasturchi (20{10 + i}-20{11 + i}). "
+        "API, maʼlumotlar bazasi va navbatlar bilan ishlash." for i in range(8)
+    ),
+    'skills': "Python, FastAPI, SQLite, PostgreSQL, Redis, Docker, Linux",
+    'languages': "O'zbek (ona tili), Rus (C1), Ingliz (B2)",
+    'additional': "Haydovchilik guvohnomasi (B)",
+}
+
+
+async def loop_lag(stop: asyncio.Event) -> list:
+    lags = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.01)
+        lags.append(time.perf_counter() - started - 0.01)
+    return lags
+
+
+async def burst(renderer: PdfRenderer, resumes: int, in_loop: bool) -> tuple:
+    """Render `resumes` distinct resumes; returns (seconds, max loop lag ms)"""
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(loop_lag(stop))
+    started = time.perf_counter()
+    jobs = [
+        (dict(RESUME, full_name=f"Test User {i}"), TEMPLATES[i % len(TEMPLATES)])
+        for i in range(resumes)
+    ]
+    if in_loop:
+        # What a synchronous render inside the handler would do
+        for data, template in jobs:
+            render(data, template)
+            await asyncio.sleep(0)
+    else:
+        await asyncio.gather(*(renderer.get(data, template) for data, template in jobs))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    lags = await ticker
+    return elapsed, max(lags) * 1000 if lags else 0.0
+
+
+async def main(args):
+    print(f"{'template':<14} {'cold ms':>9} {'repeat ms':>10}")
+    for template in TEMPLATES:
+        started = time.perf_counter()
+        render(RESUME, template)
+        cold = (time.perf_counter() - started) * 1000
+        samples = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            render(RESUME, template)
+            samples.append(time.perf_counter() - started)
+        print(f"{template:<14} {cold:>9.1f} {statistics.median(samples) * 1000:>10.1f}")
+
+    renderer = PdfRenderer(Path(tempfile.mkdtemp()), workers=args.workers)
+    started = time.perf_counter()
+    await renderer.get(RESUME, 'classic')
+    print(f"\nfirst request (pool start + render) {(time.perf_counter() - started) * 1000:>8.1f} ms")
+    samples = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        await renderer.get(RESUME, 'classic')
+        samples.append(time.perf_counter() - started)
+    print(f"warm request (disk cache hit)       {statistics.median(samples) * 1000:>8.3f} ms")
+
+    print(f"\n{args.resumes} distinct resumes        {'total s':>8} {'max loop lag ms':>16}")
+    for label, in_loop in (("rendered on the loop", True), (f"process pool x{args.workers}", False)):
+        elapsed, lag = await burst(renderer, args.resumes, in_loop)
+        print(f"{label:<28} {elapsed:>8.2f} {lag:>16.1f}")
+    renderer.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--resumes', type=int, default=40)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
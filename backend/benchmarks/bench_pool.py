@@ -0,0 +1,95 @@
+"""
+Connection pool benchmark
+Compares the old per-request aiosqlite.connect pattern with the shared pool
+on a synthetic jobs table.
+
+Usage:
+    python benchmarks/bench_pool.py --requests 5000 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import aiosqlite
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from core.db import ConnectionPool
+
+LIST_QUERY = (
+    "SELECT * FROM jobs WHERE status = 'active' AND job_type = ? "
+    "ORDER BY created_at DESC LIMIT 20"
+)
+
+
+def seed(path: str, rows: int):
+    db = sqlite3.connect(path)
+    db.execute(
+        """CREATE TABLE jobs (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               employer_id INTEGER, title TEXT, company TEXT, description TEXT,
+               status TEXT, job_type TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+           )"""
+    )
+    db.executemany(
+        "INSERT INTO jobs (employer_id, title, company, description, status, job_type) "
+        "VALUES (?, ?, ?, ?, 'active', 'monthly')",
+        ((i, f"Job {i}", f"Company {i % 50}", "x" * 200) for i in range(rows))
+    )
+    db.commit()
+    db.close()
+
+
+async def run(label: str, handler, requests: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await handler()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    rps = requests / elapsed
+    print(f"{label:<12} {requests} requests in {elapsed:.2f}s -> {rps:,.0f} req/s")
+    return rps
+
+
+async def main(args):
+    path = os.path.join(tempfile.mkdtemp(), 'bench_pool.db')
+    seed(path, args.rows)
+
+    async def per_request():
+        async with aiosqlite.connect(path) as db:
+            db.row_factory = aiosqlite.Row
+            async with db.execute(LIST_QUERY, ('monthly',)) as cursor:
+                [dict(row) for row in await cursor.fetchall()]
+
+    pool = ConnectionPool(size=args.pool_size)
+    await pool.open(path)
+
+    async def pooled():
+        async with pool.reader() as db:
+            async with db.execute(LIST_QUERY, ('monthly',)) as cursor:
+                [dict(row) for row in await cursor.fetchall()]
+
+    before = await run('per-request', per_request, args.requests, args.concurrency)
+    after = await run('pooled', pooled, args.requests, args.concurrency)
+    await pool.close()
+
+    print(f"speedup: {after / before:.2f}x")
+    print(pool.stats())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--pool-size', type=int, default=4)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,136 @@
+"""
+Search benchmark
+Seeds a synthetic daily_jobs table, builds the FTS5 index from core.schema
+and compares the old `location LIKE '%…%'` filter with FTS5 MATCH queries.
+
+Usage:
+    python benchmarks/bench_search.py --rows 1000000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from core.schema import FTS_TABLES, fts_backfill, fts_statements
+from core.search import build_match_query
+
+REGIONS = [
+    "Toshkent", "Samarqand", "Buxoro", "Andijon", "Farg'ona", "Namangan",
+    "Qashqadaryo", "Surxondaryo", "Xorazm", "Navoiy", "Jizzax", "Sirdaryo",
+]
+WORDS = [
+    "yuk", "tashish", "qurilish", "sotuvchi", "oshpaz", "haydovchi", "farrosh",
+    "o'qituvchi", "sog'liqni", "saqlash", "ombor", "qadoqlash", "ta'mirlash",
+    "bog'bon", "kuryer", "kassir", "qorovul", "tikuvchi", "dasturchi", "usta",
+]
+SYLLABLES = ["ba", "qo", "ri", "sh", "lo", "ma", "ta", "ni", "ka", "zo", "g'u", "ye"]
+
+
+def vocabulary(rng: random.Random, size: int = 5000) -> list:
+    """Real job words diluted in filler so each keyword hits ~0.5% of rows"""
+    filler = {
+        ''.join(rng.choices(SYLLABLES, k=rng.randint(2, 4))) for _ in range(size * 2)
+    }
+    return WORDS + sorted(filler - set(WORDS))[:size]
+
+
+def seed(path: str, rows: int):
+    db = sqlite3.connect(path)
+    db.execute(
+        """CREATE TABLE daily_jobs (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               user_id INTEGER, title TEXT, description TEXT, location TEXT,
+               salary INTEGER, work_date TEXT, work_time TEXT, contact_phone TEXT,
+               status TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+           )"""
+    )
+    rng = random.Random(42)
+    words = vocabulary(rng)
+
+    def row(i):
+        region = rng.choice(REGIONS)
+        return (
+            i, ' '.join(rng.choices(words, k=3)), ' '.join(rng.choices(words, k=25)),
+            f"{region} viloyati, {rng.randint(1, 99)}-uy", rng.randint(50, 500) * 1000,
+            f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}", "09:00",
+            "+998901234567", 'active'
+        )
+
+    db.executemany(
+        """INSERT INTO daily_jobs (user_id, title, description, location, salary,
+               work_date, work_time, contact_phone, status)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        (row(i) for i in range(rows))
+    )
+    db.commit()
+
+    started = time.perf_counter()
+    columns = FTS_TABLES['daily_jobs']
+    for statement in fts_statements('daily_jobs', columns):
+        db.execute(statement)
+    db.execute(fts_backfill('daily_jobs', columns))
+    db.commit()
+    print(f"indexed {rows:,} rows in {time.perf_counter() - started:.1f}s")
+    return db
+
+
+def timed(db, query: str, params: tuple, repeat: int) -> tuple:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = db.execute(query, params).fetchall()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000, len(rows)
+
+
+def main(args):
+    path = os.path.join(tempfile.mkdtemp(), 'bench_search.db')
+    db = seed(path, args.rows)
+
+    like_query = (
+        "SELECT * FROM daily_jobs WHERE status = 'active' AND location LIKE ? "
+        "ORDER BY work_date DESC, created_at DESC, id DESC LIMIT 20"
+    )
+    fts_region_query = (
+        "SELECT * FROM daily_jobs WHERE status = 'active' "
+        "AND id IN (SELECT rowid FROM daily_jobs_fts WHERE daily_jobs_fts MATCH ?) "
+        "ORDER BY work_date DESC, created_at DESC, id DESC LIMIT 20"
+    )
+    like_keyword = (
+        "SELECT * FROM daily_jobs WHERE status = 'active' "
+        "AND (title LIKE ? OR description LIKE ?) LIMIT 20"
+    )
+    fts_keyword = (
+        "SELECT d.*, bm25(daily_jobs_fts) AS score FROM daily_jobs_fts "
+        "JOIN daily_jobs d ON d.id = daily_jobs_fts.rowid "
+        "WHERE daily_jobs_fts MATCH ? AND d.status = 'active' ORDER BY score LIMIT 20"
+    )
+
+    print(f"{'case':<34} {'LIKE ms':>10} {'FTS5 ms':>10}")
+    for region in ("Xorazm", "Farg'ona"):
+        like_ms, _ = timed(db, like_query, (f"%{region}%",), args.repeat)
+        fts_ms, _ = timed(
+            db, fts_region_query, (build_match_query(region, column='location'),), args.repeat
+        )
+        print(f"{'region=' + region:<34} {like_ms:>10.2f} {fts_ms:>10.2f}")
+
+    for keyword in ("sog'liqni", "ta'mir", "dasturchi usta"):
+        like_ms, _ = timed(db, like_keyword, (f"%{keyword}%", f"%{keyword}%"), args.repeat)
+        fts_ms, _ = timed(db, fts_keyword, (build_match_query(keyword),), args.repeat)
+        print(f"{'q=' + keyword:<34} {like_ms:>10.2f} {fts_ms:>10.2f}")
+
+    db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    main(parser.parse_args())
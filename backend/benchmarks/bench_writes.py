@@ -0,0 +1,80 @@
+"""
+Write throughput benchmark
+Fires concurrent single-row inserts through ConnectionPool.write() and
+reports rows/sec for the default mode and for WAL group commit at several
+batch sizes.
+
+Usage:
+    python benchmarks/bench_writes.py --writes 5000 --concurrency 200
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from core.db import ConnectionPool
+
+
+def create_db(path: str):
+    db = sqlite3.connect(path)
+    db.execute(
+        """CREATE TABLE orders (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               buyer_id INTEGER, product_id INTEGER, quantity INTEGER,
+               status TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+           )"""
+    )
+    db.commit()
+    db.close()
+
+
+async def run(label: str, pool: ConnectionPool, writes: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def insert(db, i):
+        cursor = await db.execute(
+            "INSERT INTO orders (buyer_id, product_id, quantity, status) VALUES (?, ?, 1, 'pending')",
+            (i, i % 100)
+        )
+        return cursor.lastrowid
+
+    async def one(i):
+        async with semaphore:
+            await pool.write(lambda db: insert(db, i))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(writes)))
+    elapsed = time.perf_counter() - started
+    stats = pool.stats()
+    print(
+        f"{label:<14} {writes / elapsed:>10,.0f} writes/s  "
+        f"batches={stats['write_batches']} avg_batch={stats['write_batch_avg']}"
+    )
+
+
+async def main(args):
+    workdir = tempfile.mkdtemp()
+    modes = [('default', 1)] + [('wal', size) for size in args.batch_sizes]
+
+    for mode, batch_size in modes:
+        path = os.path.join(workdir, f'bench_writes_{mode}_{batch_size}.db')
+        create_db(path)
+        pool = ConnectionPool(size=1, storage_mode=mode, write_batch_size=batch_size)
+        await pool.open(path)
+        label = mode if mode == 'default' else f"wal batch={batch_size}"
+        await run(label, pool, args.writes, args.concurrency)
+        await pool.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--writes', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 32, 128])
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,456 @@
+"""
+API load test
+Seeds a synthetic bot_database.db, then drives the real FastAPI app in-process
+over httpx's ASGI transport with Telegram-signed initData, and reports RPS and
+p50/p95/p99 latency per endpoint. Results can be saved as a JSON baseline and
+compared against a previous run.
+
+The bot's `database` and `tekin_obunachi_db` modules must be importable (as
+they are for main.py). Tables are created with CREATE TABLE IF NOT EXISTS, so
+a database initialized by the bot keeps its own schema; tables whose columns
+don't match are skipped with a warning.
+
+With --url the requests go over HTTP to a server started separately on the
+same database and bot token, e.g. to compare throughput across worker counts.
+
+Usage:
+    python benchmarks/loadtest.py --users 20000 --requests 2000 --concurrency 50 \\
+        --save benchmarks/results/baseline.json
+    python benchmarks/loadtest.py --db /tmp/bench.db --reuse --compare benchmarks/results/baseline.json
+
+    # multi-worker: seed once, start the server on it, then drive it over HTTP
+    python benchmarks/loadtest.py --db /tmp/bench.db --requests 0
+    DB_PATH=/tmp/bench.db BOT_TOKEN=123456:bench ADMIN_ID=1 DB_STORAGE_MODE=wal \\
+        uvicorn main:app --port 8000 --workers 4
+    python benchmarks/loadtest.py --db /tmp/bench.db --reuse --url http://127.0.0.1:8000
+"""
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import hmac
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from urllib.parse import urlencode
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent.parent.parent))
+
+import httpx
+
+ADMIN_ID = 1
+
+CATEGORIES = ["IT va Dasturlash", "Savdo va Biznes", "Ta'lim", "Qurilish", "Transport", "Boshqa"]
+PRODUCT_CATEGORIES = ["Elektronika", "Kiyim-kechak", "Kitoblar", "Boshqa"]
+REGIONS = ["Toshkent", "Samarqand", "Buxoro", "Andijon", "Farg'ona", "Namangan", "Xorazm"]
+WORDS = [
+    "yuk", "tashish", "qurilish", "sotuvchi", "oshpaz", "haydovchi", "o'qituvchi",
+    "ombor", "kuryer", "kassir", "dasturchi", "usta", "telefon", "kitob", "ko'ylak",
+]
+
+SCHEMA = {
+    'users': """CREATE TABLE IF NOT EXISTS users (
+        user_id INTEGER PRIMARY KEY, username TEXT, first_name TEXT, last_name TEXT,
+        balance INTEGER DEFAULT 0, premium_until TIMESTAMP, premium_type TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)""",
+    'jobs': """CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, employer_id INTEGER, title TEXT, company TEXT,
+        description TEXT, requirements TEXT, salary_min INTEGER, salary_max INTEGER,
+        location TEXT, region TEXT, category TEXT, expires_at TIMESTAMP, status TEXT,
+        job_type TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)""",
+    'daily_jobs': """CREATE TABLE IF NOT EXISTS daily_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, title TEXT, description TEXT,
+        location TEXT, salary INTEGER, work_date TEXT, work_time TEXT, contact_phone TEXT,
+        status TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)""",
+    'products': """CREATE TABLE IF NOT EXISTS products (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, seller_id INTEGER, name TEXT, description TEXT,
+        price INTEGER, category TEXT, location TEXT, region TEXT, stock INTEGER, images TEXT,
+        status TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)""",
+    'orders': """CREATE TABLE IF NOT EXISTS orders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, buyer_id INTEGER, seller_id INTEGER,
+        product_id INTEGER, quantity INTEGER, total_price INTEGER, commission_amount INTEGER,
+        delivery_address TEXT, buyer_phone TEXT, status TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)""",
+    'competitions': """CREATE TABLE IF NOT EXISTS competitions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT, book_title TEXT, status TEXT,
+        participation_fee INTEGER DEFAULT 0, start_date TEXT)""",
+    'competition_questions': """CREATE TABLE IF NOT EXISTS competition_questions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, competition_id INTEGER, question TEXT,
+        options TEXT, correct_answer INTEGER)""",
+    'competition_participants': """CREATE TABLE IF NOT EXISTS competition_participants (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, competition_id INTEGER,
+        payment_status TEXT, test_submitted INTEGER DEFAULT 0, test_score INTEGER,
+        test_date TIMESTAMP, joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)""",
+    'tekin_orders': """CREATE TABLE IF NOT EXISTS tekin_orders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, order_type TEXT,
+        quantity INTEGER, completed INTEGER DEFAULT 0, target TEXT, status TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)""",
+}
+
+
+# ============================================
+# SEEDING
+# ============================================
+
+def _text(rng: random.Random, words: int) -> str:
+    return ' '.join(rng.choices(WORDS, k=words))
+
+
+def _days_ago(rng: random.Random) -> str:
+    return f"-{rng.randint(0, 90 * 86400)} seconds"
+
+
+def seed(path: str, users: int, seed_value: int = 1):
+    """Create and fill the synthetic database; sizes scale with `users`"""
+    rng = random.Random(seed_value)
+    db = sqlite3.connect(path)
+    db.execute("PRAGMA journal_mode = WAL")
+    for statement in SCHEMA.values():
+        db.execute(statement)
+
+    competitions = max(5, users // 2000)
+    rows = {
+        'users': (
+            """INSERT OR IGNORE INTO users (user_id, username, first_name, balance, premium_until, created_at)
+               VALUES (?, ?, ?, ?, ?, datetime('now', ?))""",
+            ((i, f"user{i}", f"User {i}", rng.randint(0, 200) * 1000,
+              "2099-01-01" if i % 10 == 0 else None, _days_ago(rng))
+             for i in range(1, users + 1))
+        ),
+        'jobs': (
+            """INSERT INTO jobs (employer_id, title, company, description, requirements, salary_min,
+                   salary_max, location, category, expires_at, status, job_type, created_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, '2099-01-01', ?, 'monthly', datetime('now', ?))""",
+            ((rng.randint(1, users), _text(rng, 3), f"Company {rng.randint(1, 500)}",
+              _text(rng, 30), _text(rng, 10), 2_000_000, 6_000_000, rng.choice(REGIONS),
+              rng.choice(CATEGORIES), 'active' if rng.random() < 0.8 else 'closed', _days_ago(rng))
+             for _ in range(users // 2))
+        ),
+        'daily_jobs': (
+            """INSERT INTO daily_jobs (user_id, title, description, location, salary, work_date,
+                   work_time, contact_phone, status, created_at)
+               VALUES (?, ?, ?, ?, ?, date('now', ?), '09:00', '+998901234567', ?, datetime('now', ?))""",
+            ((rng.randint(1, users), _text(rng, 3), _text(rng, 20),
+              f"{rng.choice(REGIONS)} viloyati", rng.randint(50, 500) * 1000,
+              f"+{rng.randint(0, 30)} days", 'active' if rng.random() < 0.8 else 'closed',
+              _days_ago(rng))
+             for _ in range(users // 2))
+        ),
+        'products': (
+            """INSERT INTO products (seller_id, name, description, price, category, location,
+                   stock, images, status, created_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, '[]', 'active', datetime('now', ?))""",
+            ((rng.randint(1, users), _text(rng, 2), _text(rng, 20), rng.randint(10, 5000) * 1000,
+              rng.choice(PRODUCT_CATEGORIES), rng.choice(REGIONS), rng.randint(0, 50),
+              _days_ago(rng))
+             for _ in range(users))
+        ),
+        'orders': (
+            """INSERT INTO orders (buyer_id, seller_id, product_id, quantity, total_price,
+                   commission_amount, delivery_address, buyer_phone, status, created_at)
+               VALUES (?, ?, ?, ?, ?, ?, 'Toshkent', '+998901234567', 'pending', datetime('now', ?))""",
+            ((rng.randint(1, users), rng.randint(1, users), rng.randint(1, users), 1,
+              100_000, 5_000, _days_ago(rng))
+             for _ in range(users * 2))
+        ),
+        'competitions': (
+            """INSERT INTO competitions (title, book_title, status, participation_fee, start_date)
+               VALUES (?, ?, 'active', 0, date('now'))""",
+            ((f"Competition {i}", f"Book {i}") for i in range(competitions))
+        ),
+        'competition_questions': (
+            """INSERT INTO competition_questions (competition_id, question, options, correct_answer)
+               VALUES (?, ?, '["a", "b", "c", "d"]', ?)""",
+            ((c, f"Question {q}", rng.randint(0, 3))
+             for c in range(1, competitions + 1) for q in range(30))
+        ),
+        'competition_participants': (
+            """INSERT INTO competition_participants (user_id, competition_id, payment_status,
+                   test_submitted, test_score, test_date)
+               VALUES (?, ?, 'free', 1, ?, datetime('now', ?))""",
+            ((u, rng.randint(1, competitions), rng.randint(0, 30), _days_ago(rng))
+             for u in range(1, users + 1))
+        ),
+        'tekin_orders': (
+            """INSERT INTO tekin_orders (user_id, order_type, quantity, target, status)
+               VALUES (?, 'subscriber', ?, '@channel', ?)""",
+            ((rng.randint(1, users), rng.randint(10, 1000), rng.choice(['active', 'completed']))
+             for _ in range(users))
+        ),
+    }
+
+    for table, (query, values) in rows.items():
+        started = time.perf_counter()
+        try:
+            db.executemany(query, values)
+            db.commit()
+        except sqlite3.Error as e:
+            db.rollback()
+            print(f"  skipped {table}: {e}")
+            continue
+        count = db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        print(f"  {table:<26} {count:>10,} rows  {time.perf_counter() - started:6.1f}s")
+    db.close()
+    return competitions
+
+
+# ============================================
+# LOAD
+# ============================================
+
+def sign_init_data(bot_token: str, user_id: int) -> str:
+    """initData signed the way Telegram does, accepted by validate_telegram_webapp_data"""
+    fields = {
+        'auth_date': str(int(time.time())),
+        'query_id': f"bench{user_id}",
+        'user': json.dumps({'id': user_id, 'first_name': f"User {user_id}", 'username': f"user{user_id}"}),
+    }
+    check_string = '\n'.join(f"{k}={v}" for k, v in sorted(fields.items()))
+    secret = hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+    fields['hash'] = hmac.new(secret, check_string.encode(), hashlib.sha256).hexdigest()
+    return urlencode(fields)
+
+
+def scenarios(users: int, competitions: int) -> dict:
+    """name -> callable(rng) returning (method, path, params, json)"""
+    def uid(rng):
+        return rng.randint(1, users)
+
+    return {
+        'auth_validate': lambda rng: ('POST', '/api/auth/validate', {}, None),
+        'jobs_list': lambda rng: ('GET', '/api/jobs/list', {'user_id': uid(rng)}, None),
+        'jobs_list_category': lambda rng: (
+            'GET', '/api/jobs/list', {'category': rng.choice(CATEGORIES)}, None
+        ),
+        'job_detail': lambda rng: ('GET', f"/api/jobs/{rng.randint(1, users // 2)}", {}, None),
+        'daily_jobs_region': lambda rng: (
+            'GET', '/api/jobs/daily', {'region': rng.choice(REGIONS)}, None
+        ),
+        'products_list': lambda rng: (
+            'GET', '/api/market/products', {'category': rng.choice(PRODUCT_CATEGORIES)}, None
+        ),
+        'product_detail': lambda rng: ('GET', f"/api/market/products/{uid(rng)}", {}, None),
+        'my_orders': lambda rng: ('GET', '/api/market/orders/my', {'user_id': uid(rng)}, None),
+        'search': lambda rng: ('GET', '/api/search', {'q': rng.choice(WORDS)}, None),
+        'competitions': lambda rng: ('GET', '/api/books/competitions', {}, None),
+        'leaderboard': lambda rng: (
+            'GET', f"/api/books/competitions/{rng.randint(1, competitions)}/leaderboard",
+            {'user_id': uid(rng)}, None
+        ),
+        'job_categories': lambda rng: ('GET', '/api/jobs/categories/list', {}, None),
+        'premium_plans': lambda rng: ('GET', '/api/premium/plans', {}, None),
+        'tekin_orders_active': lambda rng: (
+            'GET', '/api/tekin/orders/active', {'user_id': uid(rng)}, None
+        ),
+        'tekin_tasks': lambda rng: ('GET', '/api/tekin/tasks', {'user_id': uid(rng)}, None),
+        'tekin_next_task': lambda rng: ('GET', '/api/tekin/tasks/next', {'user_id': uid(rng)}, None),
+        'admin_stats': lambda rng: ('GET', '/api/admin/stats', {'user_id': ADMIN_ID}, None),
+        # The Mini App's start-up calls in one round trip
+        'startup_batch': lambda rng: ('POST', '/api/batch', {}, {'requests': STARTUP_REQUESTS}),
+        'create_order': lambda rng: (
+            'POST', '/api/market/orders/create', {'user_id': uid(rng)},
+            {'product_id': uid(rng), 'quantity': 1, 'delivery_address': 'Toshkent',
+             'phone': '+998901234567'}
+        ),
+    }
+
+
+WRITE_SCENARIOS = {'create_order'}
+
+STARTUP_REQUESTS = [
+    {'method': 'POST', 'path': '/api/auth/validate'},
+    {'path': '/api/tekin/balance'},
+    {'path': '/api/tekin/stats'},
+    {'path': '/api/premium/status'},
+    {'path': '/api/jobs/list'},
+    {'path': '/api/market/products'},
+]
+
+
+def percentile(samples: list, pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def run_scenario(client, build, requests: int, concurrency: int, users: int, bot_token: str):
+    rng = random.Random(requests)
+    latencies, errors = [], 0
+    semaphore = asyncio.Semaphore(concurrency)
+    # Sign a pool of users up front so signing isn't part of the measurement
+    auth = [sign_init_data(bot_token, rng.randint(1, users)) for _ in range(min(users, 500))]
+
+    async def one():
+        nonlocal errors
+        method, path, params, body = build(rng)
+        headers = {'Authorization': rng.choice(auth)}
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.request(method, path, params=params, json=body, headers=headers)
+            latencies.append(time.perf_counter() - started)
+        # 4xx on random ids (missing product, sold out) is expected; 5xx is not
+        if response.status_code >= 500:
+            errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    return {
+        'requests': requests,
+        'rps': round(requests / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 3),
+        'errors': errors,
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> bool:
+    """Print deltas against a baseline; returns False on a regression beyond tolerance"""
+    ok = True
+    print(f"\n{'endpoint':<22} {'rps':>16} {'p95 ms':>18}")
+    for name, result in current['endpoints'].items():
+        base = baseline.get('endpoints', {}).get(name)
+        if not base:
+            continue
+        rps_delta = (result['rps'] - base['rps']) / base['rps'] * 100 if base['rps'] else 0
+        p95_delta = (result['p95_ms'] - base['p95_ms']) / base['p95_ms'] * 100 if base['p95_ms'] else 0
+        flag = ''
+        if rps_delta < -tolerance or p95_delta > tolerance:
+            flag, ok = '  REGRESSION', False
+        print(
+            f"{name:<22} {result['rps']:>8.0f} ({rps_delta:+5.1f}%) "
+            f"{result['p95_ms']:>9.2f} ({p95_delta:+5.1f}%){flag}"
+        )
+    return ok
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=Path(__file__).parent,
+            stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+async def main(args):
+    path = args.db or os.path.join(tempfile.mkdtemp(), 'bot_database.db')
+    if args.reuse and os.path.exists(path):
+        db = sqlite3.connect(path)
+        competitions = db.execute("SELECT COUNT(*) FROM competitions").fetchone()[0]
+        db.close()
+        print(f"reusing {path}")
+    else:
+        print(f"seeding {path} with {args.users:,} users")
+        competitions = seed(path, args.users)
+
+    # Point the app and the shared bot modules at the synthetic database
+    os.environ['DB_PATH'] = path
+    os.environ.setdefault('BOT_TOKEN', '123456:bench')
+    os.environ.setdefault('ADMIN_ID', str(ADMIN_ID))
+    # Every simulated user shares one client address; measure the app, not the limiter
+    os.environ.setdefault('RATE_LIMIT_ENABLED', '0')
+    import database
+    database.DB_NAME = path
+    try:
+        import tekin_obunachi_db
+        if hasattr(tekin_obunachi_db, 'DB_NAME'):
+            tekin_obunachi_db.DB_NAME = path
+    except ImportError:
+        pass
+
+    if not args.requests:
+        return
+
+    if args.url:
+        app_module = None
+        transport = None
+        base_url = args.url
+    else:
+        import logging
+        import main as app_module
+        logging.getLogger().setLevel(logging.WARNING)
+        # Slow statements are still counted; see /api/admin/debug/queries
+        logging.getLogger('core.queries').setLevel(logging.ERROR)
+        transport = httpx.ASGITransport(app=app_module.app)
+        base_url = "http://loadtest"
+
+    available = scenarios(args.users, competitions)
+    names = args.endpoints or [n for n in available if args.writes or n not in WRITE_SCENARIOS]
+    unknown = [n for n in names if n not in available]
+    if unknown:
+        raise SystemExit(f"unknown endpoints: {', '.join(unknown)}; choose from {', '.join(available)}")
+
+    results = {}
+    lifespan = app_module.lifespan(app_module.app) if app_module else contextlib.nullcontext()
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with lifespan:
+        async with httpx.AsyncClient(transport=transport, base_url=base_url, limits=limits) as client:
+            print(f"\n{'endpoint':<22} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'5xx':>6}")
+            for name in names:
+                # Warm caches and connections before measuring
+                await run_scenario(client, available[name], min(50, args.requests), args.concurrency,
+                                   args.users, os.environ['BOT_TOKEN'])
+                result = await run_scenario(client, available[name], args.requests, args.concurrency,
+                                            args.users, os.environ['BOT_TOKEN'])
+                results[name] = result
+                print(
+                    f"{name:<22} {result['rps']:>8.0f} {result['p50_ms']:>8.2f} "
+                    f"{result['p95_ms']:>8.2f} {result['p99_ms']:>8.2f} {result['errors']:>6}"
+                )
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'users': args.users,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'storage_mode': os.getenv('DB_STORAGE_MODE', 'default'),
+            'url': args.url,
+        },
+        'endpoints': results,
+    }
+
+    if args.save:
+        Path(args.save).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.save).write_text(json.dumps(report, indent=2))
+        print(f"\nsaved {args.save}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        if not compare(report, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--db', help="database path (default: a fresh temp file)")
+    parser.add_argument('--reuse', action='store_true', help="skip seeding if --db exists")
+    parser.add_argument('--requests', type=int, default=1000,
+                        help="requests per endpoint (0 = only seed the database)")
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--endpoints', nargs='+', help="subset of scenarios to run")
+    parser.add_argument('--writes', action='store_true', help="include write scenarios")
+    parser.add_argument('--url', help="drive a running server instead of the app in-process")
+    parser.add_argument('--save', help="write results as a JSON baseline")
+    parser.add_argument('--compare', help="baseline JSON to compare against")
+    parser.add_argument('--tolerance', type=float, default=20.0,
+                        help="allowed %% drop in rps / rise in p95 before failing")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,146 @@
+"""
+Batched API requests
+Runs several GET/POST sub-requests through the app in-process and returns
+all of their responses at once, so the Mini App can load a screen in one
+round trip. Sub-requests go through the normal middleware and routing;
+JSON bodies are spliced into the batch response as raw bytes rather than
+decoded and encoded again.
+"""
+import asyncio
+import json
+import re
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from pydantic import BaseModel
+
+MAX_BATCH_SIZE = 20
+ALLOWED_METHODS = {'GET', 'POST'}
+BATCH_PATH = '/api/batch'
+# Streams and file downloads; their bodies can't be embedded in a JSON response
+EXCLUDED_PATHS = re.compile(r'^/api/(batch|events/.*|resume/[^/]+/pdf)/?$')
+NOT_JSON = b'{"detail": "Only JSON responses can be batched"}'
+
+# Sub-request headers copied from the batch request
+FORWARDED_HEADERS = {b'authorization', b'accept-language', b'user-agent', b'x-forwarded-for'}
+
+
+class SubRequest(BaseModel):
+    id: Optional[str] = None
+    method: str = 'GET'
+    path: str
+    params: Optional[Dict[str, Any]] = None
+    body: Optional[Any] = None
+
+
+class BatchRequest(BaseModel):
+    requests: List[SubRequest]
+
+
+def validate(sub: SubRequest) -> Optional[str]:
+    """Why a sub-request can't run, or None"""
+    if sub.method.upper() not in ALLOWED_METHODS:
+        return "Method not allowed in batch"
+    path = urlsplit(sub.path).path
+    if not path.startswith('/api/') or EXCLUDED_PATHS.match(path):
+        return "Path not allowed in batch"
+    return None
+
+
+def _scope(parent: dict, sub: SubRequest, user_id: int, body: bytes) -> dict:
+    url = urlsplit(sub.path)
+    params = parse_qsl(url.query, keep_blank_values=True)
+    params += list((sub.params or {}).items())
+    # Sub-requests always act as the authenticated user
+    params = [(k, v) for k, v in params if k != 'user_id'] + [('user_id', user_id)]
+    query = urlencode(params, doseq=True)
+
+    headers = [(k, v) for k, v in parent['headers'] if k in FORWARDED_HEADERS]
+    if body:
+        headers += [(b'content-type', b'application/json'),
+                    (b'content-length', str(len(body)).encode())]
+    return {
+        'type': 'http',
+        'asgi': parent.get('asgi', {'version': '3.0'}),
+        'http_version': parent.get('http_version', '1.1'),
+        'method': sub.method.upper(),
+        'scheme': parent.get('scheme', 'http'),
+        'server': parent.get('server'),
+        'client': parent.get('client'),
+        'root_path': parent.get('root_path', ''),
+        'path': url.path,
+        'raw_path': url.path.encode(),
+        'query_string': query.encode(),
+        'headers': headers,
+        'state': dict(parent.get('state', {})),
+    }
+
+
+async def dispatch(app, parent: dict, sub: SubRequest, user_id: int) -> tuple:
+    """Run one sub-request; returns (status, JSON body bytes)
+
+    A response that turns out not to be JSON is abandoned as soon as its
+    headers arrive (the app sees a disconnect) and reported as a 406.
+    """
+    body = json.dumps(sub.body).encode() if sub.body is not None else b''
+    scope = _scope(parent, sub, user_id, body)
+    done = asyncio.Event()
+    sent_body = False
+    rejected = False
+    status, content_type, chunks = 500, b'', []
+
+    async def receive():
+        nonlocal sent_body
+        if not sent_body:
+            sent_body = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        await done.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        nonlocal status, content_type, rejected
+        if rejected:
+            return
+        if message['type'] == 'http.response.start':
+            status = message['status']
+            for key, value in message.get('headers', ()):
+                if key.lower() == b'content-type':
+                    content_type = value
+            if content_type and not content_type.startswith(b'application/json'):
+                rejected = True
+                done.set()
+        elif message['type'] == 'http.response.body':
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body'):
+                done.set()
+
+    try:
+        await app(scope, receive, send)
+    except Exception:
+        # Already logged by the app; report it like any other 500
+        if not chunks:
+            return 500, b'{"detail": "Internal Server Error"}'
+    finally:
+        done.set()
+    if rejected:
+        return 406, NOT_JSON
+    return status, b''.join(chunks)
+
+
+def encode(sub: SubRequest, status: int, body: bytes) -> bytes:
+    """One entry of the batch response; `body` is JSON (or empty)"""
+    head = json.dumps({'id': sub.id, 'status': status}, ensure_ascii=False)[:-1].encode()
+    payload = body if body else b'null'
+    return head + b', "body": ' + payload + b'}'
+
+
+async def run(app, parent: dict, batch: BatchRequest, user_id: int) -> bytes:
+    """Run all sub-requests concurrently; `{"responses": [...]}` in request order"""
+    async def one(sub: SubRequest) -> bytes:
+        error = validate(sub)
+        if error:
+            return encode(sub, 400, json.dumps({'detail': error}).encode())
+        return encode(sub, *await dispatch(app, parent, sub, user_id))
+
+    parts = await asyncio.gather(*(one(sub) for sub in batch.requests))
+    return b'{"responses": [' + b', '.join(parts) + b']}'
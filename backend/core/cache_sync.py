@@ -0,0 +1,116 @@
+"""
+Cross-process cache invalidation
+With several workers each process keeps its own in-memory caches, so an
+invalidation done by one worker has to reach the others. Invalidations are
+published as version bumps of `cache:<channel>:<key>` rows in cache_versions;
+every worker polls those rows and runs its local handler for the channel,
+with the key, when a version moves.
+
+The caches that are already version-checked against cache_versions on read
+(question sets, answer keys) or only TTL-bounded (counts, auth) need nothing
+from here.
+"""
+import asyncio
+import logging
+import os
+from typing import Callable, Dict, Optional
+
+import aiosqlite
+
+from core.db import pool
+from core.schema import bump_version
+
+logger = logging.getLogger(__name__)
+
+CACHE_SYNC_INTERVAL = float(os.getenv('CACHE_SYNC_INTERVAL', '2'))
+
+PREFIX = 'cache:'
+
+# Channels
+RESPONSE_CACHE = 'response_cache'  # key: a response cache tag, or '*'
+
+
+class CacheSync:
+    def __init__(self, interval: float = CACHE_SYNC_INTERVAL):
+        self.interval = interval
+        self._handlers: Dict[str, Callable[[str], object]] = {}
+        self._seen: Dict[str, int] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.received = 0
+
+    def subscribe(self, channel: str, handler: Callable[[str], object]):
+        """Call `handler(key)` in this process whenever `channel` is published"""
+        self._handlers[channel] = handler
+
+    async def publish(self, channel: str, key: str = '*'):
+        """Invalidate here right away and in the other workers on their next poll"""
+        name = f"{PREFIX}{channel}:{key}"
+
+        async def unit(db: aiosqlite.Connection):
+            return await bump_version(db, name)
+
+        self._seen[name] = await pool.write(unit)
+        self._dispatch(name)
+
+    def _dispatch(self, name: str):
+        channel, _, key = name[len(PREFIX):].partition(':')
+        handler = self._handlers.get(channel)
+        if handler is None:
+            return
+        try:
+            handler(key)
+        except Exception as e:
+            logger.error(f"Cache sync handler for {channel}:{key} failed: {e}")
+
+    async def _versions(self) -> Dict[str, int]:
+        async with pool.reader() as db:
+            async with db.execute(
+                "SELECT name, version FROM cache_versions WHERE name LIKE ?", (PREFIX + '%',)
+            ) as cursor:
+                return {row[0]: row[1] for row in await cursor.fetchall()}
+
+    async def poll(self) -> int:
+        """Run handlers for channels published elsewhere; returns how many fired"""
+        fired = 0
+        for name, version in (await self._versions()).items():
+            if self._seen.get(name) == version:
+                continue
+            self._seen[name] = version
+            self._dispatch(name)
+            fired += 1
+        self.received += fired
+        return fired
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.poll()
+            except Exception as e:
+                logger.error(f"Cache sync poll failed: {e}")
+
+    async def start(self):
+        # Whatever was published before this worker started is already reflected
+        # in its (empty) caches
+        self._seen = await self._versions()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            'interval': self.interval,
+            'channels': sorted(self._handlers),
+            'received': self.received,
+            'versions': dict(self._seen),
+        }
+
+
+cache_sync = CacheSync()
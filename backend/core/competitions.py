@@ -0,0 +1,158 @@
+"""
+Competition questions, scoring and leaderboards
+Answer keys and the client-facing question sets are cached per competition,
+stamped with the question-set version from cache_versions so edits made
+anywhere (including the bot) are picked up on the next request.
+"""
+import operator
+from array import array
+from typing import List, Optional, Sequence, Tuple
+
+import aiosqlite
+
+from core.cache import TTLCache
+from core.response_cache import serialize
+from core.schema import get_version, question_set
+
+# competition_id -> (version, answer key)
+answer_keys = TTLCache(maxsize=256, ttl=3600)
+
+# competition_id -> (version, serialized questions without answers)
+question_sets = TTLCache(maxsize=256, ttl=3600)
+
+# Columns never sent to clients
+ANSWER_FIELDS = ('correct_answer',)
+
+# competition_id -> user_ids known to have joined. Only ever grows, so a
+# participant removed by the bot keeps access until the entry expires.
+participant_sets = TTLCache(maxsize=64, ttl=600)
+
+
+def compact_key(answers: list) -> Sequence:
+    """Pack integer answers into an array; leave anything else as a tuple"""
+    try:
+        return array('l', answers)
+    except TypeError:
+        return tuple(answers)
+
+
+async def get_answer_key(db: aiosqlite.Connection, competition_id: int) -> Sequence:
+    """Correct answers in question order, from cache when the version matches"""
+    version = await get_version(db, question_set(competition_id))
+    cached = answer_keys.get(competition_id)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    async with db.execute(
+        "SELECT correct_answer FROM competition_questions WHERE competition_id = ? ORDER BY id",
+        (competition_id,)
+    ) as cursor:
+        key = compact_key([row[0] for row in await cursor.fetchall()])
+    answer_keys.set(competition_id, (version, key))
+    return key
+
+
+async def get_question_set(db: aiosqlite.Connection, competition_id: int) -> bytes:
+    """`{"questions": [...]}` as JSON bytes, answers stripped"""
+    version = await get_version(db, question_set(competition_id))
+    cached = question_sets.get(competition_id)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    async with db.execute(
+        "SELECT * FROM competition_questions WHERE competition_id = ? ORDER BY id",
+        (competition_id,)
+    ) as cursor:
+        rows = await cursor.fetchall()
+    questions = [
+        {k: v for k, v in dict(row).items() if k not in ANSWER_FIELDS} for row in rows
+    ]
+    body = serialize({"questions": questions})
+    question_sets.set(competition_id, (version, body))
+    return body
+
+
+async def is_participant(db: aiosqlite.Connection, competition_id: int, user_id: int) -> bool:
+    """Membership check against the cached set, falling back to the DB on a miss"""
+    members = participant_sets.get(competition_id)
+    if members is None:
+        async with db.execute(
+            "SELECT user_id FROM competition_participants WHERE competition_id = ?",
+            (competition_id,)
+        ) as cursor:
+            members = {row[0] for row in await cursor.fetchall()}
+        participant_sets.set(competition_id, members)
+        return user_id in members
+
+    if user_id in members:
+        return True
+
+    # Joined through the bot or another worker since the set was loaded
+    async with db.execute(
+        "SELECT 1 FROM competition_participants WHERE competition_id = ? AND user_id = ?",
+        (competition_id, user_id)
+    ) as cursor:
+        found = await cursor.fetchone() is not None
+    if found:
+        members.add(user_id)
+    return found
+
+
+def add_participant(competition_id: int, user_id: int):
+    members = participant_sets.get(competition_id)
+    if members is not None:
+        members.add(user_id)
+
+
+def score_answers(answers: Sequence, key: Sequence) -> int:
+    """Number of answers matching the key position by position"""
+    # map/zip stop at the shorter sequence, like the old index check did
+    return sum(map(operator.eq, answers, key))
+
+
+async def score_counts(db: aiosqlite.Connection, competition_id: int) -> List[Tuple[int, int]]:
+    """(score, participants) pairs, best score first"""
+    async with db.execute(
+        """SELECT score, participants FROM competition_score_counts
+           WHERE competition_id = ? AND participants > 0
+           ORDER BY score DESC""",
+        (competition_id,)
+    ) as cursor:
+        return [(row[0], row[1]) for row in await cursor.fetchall()]
+
+
+def rank_table(counts: List[Tuple[int, int]]) -> dict:
+    """score -> rank, where equal scores share a rank (1, 1, 3, ...)"""
+    ranks, ahead = {}, 0
+    for score, participants in counts:
+        ranks[score] = ahead + 1
+        ahead += participants
+    return ranks
+
+
+async def top_scores(db: aiosqlite.Connection, competition_id: int, limit: int) -> List[dict]:
+    """Best submissions, earliest first among equal scores"""
+    async with db.execute(
+        """SELECT cp.user_id, cp.test_score AS score, cp.test_date,
+                  u.first_name, u.username
+           FROM competition_participants cp
+           LEFT JOIN users u ON u.user_id = cp.user_id
+           WHERE cp.competition_id = ? AND cp.test_submitted = 1
+             AND cp.test_score IS NOT NULL
+           ORDER BY cp.test_score DESC, cp.test_date ASC
+           LIMIT ?""",
+        (competition_id, limit)
+    ) as cursor:
+        return [dict(row) for row in await cursor.fetchall()]
+
+
+async def my_score(
+    db: aiosqlite.Connection, competition_id: int, user_id: int
+) -> Optional[int]:
+    async with db.execute(
+        """SELECT test_score FROM competition_participants
+           WHERE competition_id = ? AND user_id = ? AND test_submitted = 1""",
+        (competition_id, user_id)
+    ) as cursor:
+        row = await cursor.fetchone()
+    return row[0] if row else None
@@ -0,0 +1,121 @@
+"""
+Response compression
+Brotli (when the `brotli` package is installed) or gzip for clients that
+accept it, applied to complete responses above COMPRESS_MIN_SIZE bytes.
+Streamed responses (files, event streams) and already-encoded or
+non-text bodies pass through untouched.
+
+A compressed body is a different representation from the identity one, so
+its ETag is made weak; conditional requests compare ETags weakly and still
+get 304s. Bodies above COMPRESS_THREAD_SIZE are compressed in a thread so
+they don't hold up the event loop.
+"""
+import asyncio
+import gzip
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', '1024'))
+GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', '5'))
+BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', '4'))
+COMPRESS_THREAD_SIZE = int(os.getenv('COMPRESS_THREAD_SIZE', str(64 * 1024)))
+
+COMPRESSIBLE_TYPES = (b'application/json', b'text/')
+
+
+def _accepted(headers: list) -> set:
+    for key, value in headers:
+        if key == b'accept-encoding':
+            return {part.split(b';')[0].strip() for part in value.lower().split(b',')}
+    return set()
+
+
+def _vary(headers: list) -> list:
+    """headers with Accept-Encoding added to Vary"""
+    headers = list(headers)
+    for i, (key, value) in enumerate(headers):
+        if key == b'vary':
+            headers[i] = (key, value + b', Accept-Encoding')
+            return headers
+    return headers + [(b'vary', b'Accept-Encoding')]
+
+
+def _weak_etag(headers: list) -> list:
+    """headers with a strong ETag turned into a weak one"""
+    return [
+        (key, b'W/' + value) if key == b'etag' and value.startswith(b'"') else (key, value)
+        for key, value in headers
+    ]
+
+
+def _compress(body: bytes, encoding: bytes) -> bytes:
+    if encoding == b'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        accepted = _accepted(scope['headers'])
+        if brotli is not None and b'br' in accepted:
+            encoding = b'br'
+        elif b'gzip' in accepted:
+            encoding = b'gzip'
+        else:
+            return await self.app(scope, receive, send)
+
+        start = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, passthrough
+            if passthrough:
+                return await send(message)
+
+            if message['type'] == 'http.response.start':
+                headers = message.get('headers', [])
+                if message['status'] == 304:
+                    # Stands for the compressed 200, so it carries the same ETag
+                    passthrough = True
+                    return await send(dict(message, headers=_weak_etag(headers)))
+                content_type = next((v for k, v in headers if k == b'content-type'), b'')
+                if (any(k == b'content-encoding' for k, _ in headers)
+                        or not content_type.startswith(COMPRESSIBLE_TYPES)):
+                    passthrough = True
+                    return await send(message)
+                start = message  # Hold until we know whether the body is complete
+                return
+
+            body = message.get('body', b'')
+            if message.get('more_body') or len(body) < self.minimum_size:
+                # Streaming or too small to be worth it
+                passthrough = True
+                await send(dict(start, headers=_vary(start['headers'])))
+                return await send(message)
+
+            if len(body) >= COMPRESS_THREAD_SIZE:
+                compressed = await asyncio.to_thread(_compress, body, encoding)
+            else:
+                compressed = _compress(body, encoding)
+            headers = [
+                (k, v) for k, v in _weak_etag(_vary(start['headers'])) if k != b'content-length'
+            ]
+            headers += [
+                (b'content-encoding', encoding),
+                (b'content-length', str(len(compressed)).encode()),
+            ]
+            await send(dict(start, headers=headers))
+            await send({'type': 'http.response.body', 'body': compressed})
+
+        await self.app(scope, receive, send_wrapper)
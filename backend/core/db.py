@@ -0,0 +1,444 @@
+"""
+Shared SQLite connection pool
+Connections are opened once in the app lifespan and handed to routers
+through FastAPI dependencies instead of calling aiosqlite.connect per request.
+
+Writes go through ConnectionPool.write(). With DB_STORAGE_MODE=wal the pool
+switches the database to WAL, applies the pragma profile below and runs a
+single writer task that group-commits queued write units.
+
+When several worker processes share the database, write transactions are
+also serialized across processes with an flock on a file next to the
+database, so workers queue for the SQLite write lock instead of retrying on
+SQLITE_BUSY until busy_timeout runs out.
+"""
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, TypeVar
+
+import aiosqlite
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+STORAGE_MODE = os.getenv('DB_STORAGE_MODE', 'default')  # 'default' or 'wal'
+WRITE_BATCH_SIZE = int(os.getenv('DB_WRITE_BATCH_SIZE', '64'))
+# Serialize write transactions across worker processes (uncontended, it costs one syscall)
+PROCESS_WRITE_LOCK = os.getenv('DB_PROCESS_WRITE_LOCK', '1') == '1'
+# Backoff while another worker holds the process write lock, in seconds
+PROCESS_LOCK_POLL_MIN = 0.0005
+PROCESS_LOCK_POLL_MAX = 0.02
+
+WAL_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': os.getenv('DB_SYNCHRONOUS', 'NORMAL'),
+    'mmap_size': int(os.getenv('DB_MMAP_SIZE', str(256 * 1024 * 1024))),
+    'cache_size': int(os.getenv('DB_CACHE_SIZE', '-65536')),  # negative = KiB
+    'busy_timeout': int(os.getenv('DB_BUSY_TIMEOUT', '5000')),
+}
+
+
+# The reader ConnectionPool.lend() hands to aiosqlite.connect() callers
+_lent: ContextVar[Optional[aiosqlite.Connection]] = ContextVar('lent_reader', default=None)
+
+
+class _LentConnection:
+    """What aiosqlite.connect() returns inside ConnectionPool.lend()
+
+    The borrowed reader with a fresh connection's row factory; closing it
+    only restores the pool's, the connection itself belongs to the pool.
+    """
+
+    def __init__(self, db: aiosqlite.Connection):
+        object.__setattr__(self, '_db', db)
+        db.row_factory = None
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._db, name, value)
+
+    async def _opened(self) -> '_LentConnection':
+        return self
+
+    def __await__(self):
+        return self._opened().__await__()
+
+    async def __aenter__(self) -> '_LentConnection':
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        self._db.row_factory = aiosqlite.Row
+
+
+class ProcessLock:
+    """Exclusive flock on a file next to the database, shared by every worker process"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    def open(self):
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+
+    def try_acquire(self) -> bool:
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    async def acquire(self):
+        # Another worker holds it: poll instead of a blocking flock in a
+        # thread, which would still take the lock after its waiter was
+        # cancelled and hold it forever
+        delay = PROCESS_LOCK_POLL_MIN
+        while not self.try_acquire():
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, PROCESS_LOCK_POLL_MAX)
+
+    def release(self):
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class ConnectionPool:
+    """Fixed set of reader connections plus a single writer connection"""
+
+    def __init__(
+        self,
+        size: int = 4,
+        storage_mode: str = 'default',
+        write_batch_size: int = 64,
+        process_write_lock: bool = False
+    ):
+        self.size = size
+        self.storage_mode = storage_mode
+        self.write_batch_size = write_batch_size
+        self.process_write_lock = process_write_lock
+        self._process_lock: Optional[ProcessLock] = None
+        self.db_path: Optional[str] = None
+        self._readers: Optional[asyncio.Queue] = None
+        self._connections: List[aiosqlite.Connection] = []
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._write_lock = asyncio.Lock()
+        self._write_queue: Optional[asyncio.Queue] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        self._stats = {
+            'write_units': 0,
+            'write_failures': 0,
+            'write_batches': 0,
+            'write_batch_max': 0,
+            'reader_acquires': 0,
+            'reader_wait_total': 0.0,
+            'reader_wait_max': 0.0,
+            'writer_acquires': 0,
+            'writer_wait_total': 0.0,
+            'writer_wait_max': 0.0,
+            'writer_rollbacks': 0,
+            'process_lock_wait_total': 0.0,
+            'process_lock_wait_max': 0.0,
+        }
+
+    @property
+    def is_open(self) -> bool:
+        return self._writer is not None
+
+    @property
+    def wal(self) -> bool:
+        return self.storage_mode == 'wal'
+
+    async def _connect(self, readonly: bool = False, **kwargs) -> aiosqlite.Connection:
+        db = await metrics.connect(self.db_path, **kwargs)
+        db.row_factory = aiosqlite.Row
+        if self.wal:
+            for name, value in WAL_PRAGMAS.items():
+                await db.execute(f"PRAGMA {name} = {value}")
+            if readonly:
+                await db.execute("PRAGMA query_only = 1")
+        return db
+
+    async def open(self, db_path: str):
+        """Open reader and writer connections"""
+        if self.is_open:
+            return
+        self.db_path = db_path
+        if not getattr(aiosqlite.connect, 'lending', False):
+            aiosqlite.connect = self._lending(aiosqlite.connect)
+        if self.process_write_lock:
+            if fcntl is None:
+                logger.warning("Process write lock unavailable on this platform")
+            else:
+                # Next to the real file, even when db_path is a symlink to it
+                self._process_lock = ProcessLock(f"{os.path.realpath(db_path)}.write-lock")
+                self._process_lock.open()
+        self._readers = asyncio.Queue()
+        for _ in range(self.size):
+            db = await self._connect(readonly=True)
+            self._connections.append(db)
+            self._readers.put_nowait(db)
+        # Autocommit mode: write() issues BEGIN/SAVEPOINT explicitly
+        self._writer = await self._connect(isolation_level=None)
+        if self.wal:
+            self._write_queue = asyncio.Queue()
+            self._writer_task = asyncio.create_task(self._writer_loop())
+        logger.info(
+            f"Database pool opened: {self.size} readers + 1 writer on {db_path} "
+            f"({self.storage_mode} mode)"
+        )
+
+    async def close(self):
+        """Close every pooled connection"""
+        if not self.is_open:
+            return
+        if self._writer_task:
+            # Let queued writes land before shutting down
+            await self._write_queue.join()
+            self._writer_task.cancel()
+            try:
+                await self._writer_task
+            except asyncio.CancelledError:
+                pass
+            self._writer_task = None
+            self._write_queue = None
+        for db in self._connections:
+            await db.close()
+        await self._writer.close()
+        if self._process_lock:
+            self._process_lock.close()
+            self._process_lock = None
+        self._connections = []
+        self._readers = None
+        self._writer = None
+        logger.info("Database pool closed")
+
+    def _record_wait(self, kind: str, started: float):
+        waited = time.perf_counter() - started
+        self._stats[f'{kind}_acquires'] += 1
+        self._stats[f'{kind}_wait_total'] += waited
+        if waited > self._stats[f'{kind}_wait_max']:
+            self._stats[f'{kind}_wait_max'] = waited
+
+    @asynccontextmanager
+    async def reader(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Borrow a reader connection for the duration of the block"""
+        if not self.is_open:
+            raise RuntimeError("Database pool is not open")
+        started = time.perf_counter()
+        db = await self._readers.get()
+        self._record_wait('reader', started)
+        try:
+            yield db
+        finally:
+            self._readers.put_nowait(db)
+
+    def _lending(self, connect: Callable) -> Callable:
+        """Wrap aiosqlite.connect so it returns the reader lent by lend()"""
+        def lending_connect(database, *args, **kwargs):
+            db = _lent.get()
+            if db is None or os.path.realpath(str(database)) != os.path.realpath(self.db_path):
+                return connect(database, *args, **kwargs)
+            return _LentConnection(db)
+
+        lending_connect.lending = True
+        return lending_connect
+
+    @asynccontextmanager
+    async def lend(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Borrow a reader and lend it to the bot's modules for the block
+
+        Their aiosqlite.connect() calls on this database get the borrowed
+        reader instead of opening a connection each, so several of their
+        lookups cost one pooled connection. Call their read helpers only,
+        one at a time.
+        """
+        async with self.reader() as db:
+            token = _lent.set(db)
+            try:
+                yield db
+            finally:
+                _lent.reset(token)
+                db.row_factory = aiosqlite.Row
+
+    @asynccontextmanager
+    async def writer(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Hold the single writer connection for the duration of the block
+
+        The connection is in autocommit mode; prefer write() which wraps the
+        block in a transaction.
+        """
+        if not self.is_open:
+            raise RuntimeError("Database pool is not open")
+        started = time.perf_counter()
+        async with self._write_lock:
+            self._record_wait('writer', started)
+            if self._process_lock:
+                locked = time.perf_counter()
+                await self._process_lock.acquire()
+                waited = time.perf_counter() - locked
+                self._stats['process_lock_wait_total'] += waited
+                if waited > self._stats['process_lock_wait_max']:
+                    self._stats['process_lock_wait_max'] = waited
+            try:
+                yield self._writer
+            finally:
+                # Never leak an uncommitted transaction into the next writer
+                if self._writer.in_transaction:
+                    self._stats['writer_rollbacks'] += 1
+                    await self._writer.rollback()
+                if self._process_lock:
+                    self._process_lock.release()
+
+    async def write(self, unit: Callable[[aiosqlite.Connection], Awaitable[T]]) -> T:
+        """Run a write unit atomically on the writer connection
+
+        The unit receives the writer connection and must not commit. Any
+        exception it raises rolls its statements back and is re-raised here.
+        In WAL mode the unit is queued for the writer task and shares a
+        transaction with other queued units; the call returns once that
+        transaction has committed.
+        """
+        if not self.is_open:
+            raise RuntimeError("Database pool is not open")
+        if self._write_queue is None:
+            async with self.writer() as db:
+                self._record_batch(1)
+                await db.execute("BEGIN IMMEDIATE")
+                try:
+                    result = await unit(db)
+                except BaseException:
+                    self._stats['write_failures'] += 1
+                    await db.rollback()
+                    raise
+                await db.commit()
+                return result
+
+        future = asyncio.get_running_loop().create_future()
+        self._write_queue.put_nowait((unit, future))
+        return await future
+
+    def _record_batch(self, size: int):
+        self._stats['write_units'] += size
+        self._stats['write_batches'] += 1
+        if size > self._stats['write_batch_max']:
+            self._stats['write_batch_max'] = size
+
+    async def _writer_loop(self):
+        """Drain the write queue, committing everything pending as one batch"""
+        while True:
+            batch = [await self._write_queue.get()]
+            while len(batch) < self.write_batch_size and not self._write_queue.empty():
+                batch.append(self._write_queue.get_nowait())
+            try:
+                async with self.writer() as db:
+                    await self._commit_batch(db, batch)
+            except Exception as e:
+                logger.error(f"Write batch of {len(batch)} failed: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            finally:
+                for _ in batch:
+                    self._write_queue.task_done()
+
+    async def _commit_batch(self, db: aiosqlite.Connection, batch: list):
+        outcomes = []
+        await db.execute("BEGIN IMMEDIATE")
+        for unit, future in batch:
+            if future.done():
+                continue
+            await db.execute("SAVEPOINT write_unit")
+            try:
+                result = await unit(db)
+            except Exception as e:
+                self._stats['write_failures'] += 1
+                await db.execute("ROLLBACK TO write_unit")
+                await db.execute("RELEASE write_unit")
+                outcomes.append((future, e, None))
+            else:
+                await db.execute("RELEASE write_unit")
+                outcomes.append((future, None, result))
+        await db.commit()
+        self._record_batch(len(outcomes))
+
+        # Results are only handed out once the whole batch is durable
+        for future, error, result in outcomes:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        """Pool usage counters"""
+        reader_acquires = self._stats['reader_acquires']
+        writer_acquires = self._stats['writer_acquires']
+        return {
+            'open': self.is_open,
+            'db_path': self.db_path,
+            'readers': self.size,
+            'readers_idle': self._readers.qsize() if self._readers else 0,
+            'writer_busy': self._write_lock.locked(),
+            'reader_acquires': reader_acquires,
+            'reader_wait_avg_ms': round(
+                self._stats['reader_wait_total'] / reader_acquires * 1000, 3
+            ) if reader_acquires else 0.0,
+            'reader_wait_max_ms': round(self._stats['reader_wait_max'] * 1000, 3),
+            'writer_acquires': writer_acquires,
+            'writer_wait_avg_ms': round(
+                self._stats['writer_wait_total'] / writer_acquires * 1000, 3
+            ) if writer_acquires else 0.0,
+            'writer_wait_max_ms': round(self._stats['writer_wait_max'] * 1000, 3),
+            'writer_rollbacks': self._stats['writer_rollbacks'],
+            'storage_mode': self.storage_mode,
+            'write_queue_depth': self._write_queue.qsize() if self._write_queue else 0,
+            'write_units': self._stats['write_units'],
+            'write_failures': self._stats['write_failures'],
+            'write_batches': self._stats['write_batches'],
+            'write_batch_avg': round(
+                self._stats['write_units'] / self._stats['write_batches'], 2
+            ) if self._stats['write_batches'] else 0.0,
+            'write_batch_max': self._stats['write_batch_max'],
+            'process_write_lock': self._process_lock is not None,
+            'process_lock_wait_total_ms': round(self._stats['process_lock_wait_total'] * 1000, 3),
+            'process_lock_wait_max_ms': round(self._stats['process_lock_wait_max'] * 1000, 3),
+            'pid': os.getpid(),
+        }
+
+
+pool = ConnectionPool(
+    size=int(os.getenv('DB_POOL_SIZE', '4')),
+    storage_mode=STORAGE_MODE,
+    write_batch_size=WRITE_BATCH_SIZE,
+    process_write_lock=PROCESS_WRITE_LOCK
+)
+
+# ============================================
+# DEPENDENCIES
+# ============================================
+
+async def get_db() -> AsyncIterator[aiosqlite.Connection]:
+    """Dependency yielding a pooled reader connection"""
+    async with pool.reader() as db:
+        yield db
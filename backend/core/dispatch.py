@@ -0,0 +1,428 @@
+"""
+In-memory tekin task dispatcher
+Active tasks are loaded once from the tekin module and kept in one heap per
+task type, ordered by reward (highest first) and then by remaining quantity
+(fewest first, so nearly finished orders close out), so earners polling for
+work never touch the database. A claim reserves a slot in memory right away,
+so refusals (already submitted, nothing left) need no query, and then waits
+for the background flusher: claims that arrive while a batch is being
+written go out together in the next one, as one pool.write() unit into
+tekin_task_submissions. A claim succeeds once that commits; a failed write
+gives the slot back.
+
+Queued submissions are then handed to the tekin module's
+submit_task_completion by a separate forwarder, so slow writes there never
+hold up earners. Each worker claims the rows it forwards, and rows whose
+forwarder went away are picked up again after FORWARD_TIMEOUT.
+
+The snapshot is reloaded every DISPATCH_RELOAD_INTERVAL seconds, and sooner
+when another worker publishes on the TASKS cache-sync channel, so tasks
+added by the bot show up and per-worker reservations converge on what was
+actually persisted.
+"""
+import asyncio
+import heapq
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import aiosqlite
+
+from core.db import pool
+
+logger = logging.getLogger(__name__)
+
+FLUSH_BATCH_SIZE = int(os.getenv('DISPATCH_FLUSH_BATCH', '200'))
+RELOAD_INTERVAL = float(os.getenv('DISPATCH_RELOAD_INTERVAL', '60'))
+RELOAD_MIN_INTERVAL = float(os.getenv('DISPATCH_RELOAD_MIN_INTERVAL', '5'))
+FORWARD_TIMEOUT = float(os.getenv('DISPATCH_FORWARD_TIMEOUT', '60'))
+
+# tekin_task_submissions.status
+QUEUED = 'queued'
+FORWARDING = 'forwarding'
+FORWARDED = 'forwarded'
+REJECTED = 'rejected'
+
+# Cache-sync channel published after claims are persisted
+TASKS = 'tekin_tasks'
+
+# Heap entry: (-reward, remaining, task id, version); unlimited tasks sort as inf
+Entry = Tuple[int, float, int, int]
+
+
+def _int(value, default: int = 0) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+class DispatchTask:
+    __slots__ = ('id', 'type', 'reward', 'remaining', 'data', 'version')
+
+    def __init__(self, data: dict, reserved: int = 0):
+        """`reserved` is how many claims on this task are not persisted yet"""
+        self.id = _int(data.get('id'))
+        self.type = str(data.get('task_type') or data.get('order_type') or data.get('type') or 'task')
+        self.reward = _int(data.get('reward', data.get('price')))
+        quantity = data.get('quantity')
+        # Tasks without a quantity take any number of earners
+        self.remaining: Optional[int] = (
+            None if quantity is None
+            else max(_int(quantity) - _int(data.get('completed')) - reserved, 0)
+        )
+        self.data = data
+        self.version = 0
+
+    def entry(self) -> Entry:
+        remaining = float('inf') if self.remaining is None else self.remaining
+        return (-self.reward, remaining, self.id, self.version)
+
+
+class TaskDispatcher:
+    def __init__(
+        self,
+        load: Callable[[], Awaitable[list]],
+        persist: Callable[..., Awaitable[object]]
+    ):
+        """`load()` returns the active tasks; `persist(user_id=, task_id=, proof_url=)`
+        hands a submission to the tekin module"""
+        self._load = load
+        self._persist = persist
+        self._tasks: Dict[int, DispatchTask] = {}
+        self._heaps: Dict[str, List[Entry]] = {}
+        self._claimed: Dict[int, Set[int]] = {}
+        # (user_id, task_id, proof_url, future resolved with why it failed, or None)
+        self._pending: List[Tuple[int, int, Optional[str], asyncio.Future]] = []
+        self._wakeup = asyncio.Event()
+        self._forward_wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._forwarder: Optional[asyncio.Task] = None
+        self._dirty = False
+        self.loaded_at: Optional[float] = None
+        self.claims = 0
+        self.persisted = 0
+        self.failed = 0
+        self.forwarded = 0
+        self.rejected = 0
+        self.flushes = 0
+        self.reloads = 0
+
+    # ---- snapshot ----
+
+    def _push(self, task: DispatchTask):
+        if task.remaining != 0:
+            heapq.heappush(self._heaps.setdefault(task.type, []), task.entry())
+
+    async def _unforwarded(self) -> Dict[int, int]:
+        """Per task, submissions the tekin module doesn't count yet"""
+        async with pool.reader() as db:
+            async with db.execute(
+                """SELECT task_id, COUNT(*) FROM tekin_task_submissions
+                   WHERE status IN (?, ?) GROUP BY task_id""",
+                (QUEUED, FORWARDING)
+            ) as cursor:
+                counts = {row[0]: row[1] for row in await cursor.fetchall()}
+        for _, task_id, _, _ in self._pending:
+            counts[task_id] = counts.get(task_id, 0) + 1
+        return counts
+
+    async def reload(self) -> int:
+        """Rebuild the heaps from the database; returns how many tasks are active"""
+        rows = await self._load() or []
+        reserved = await self._unforwarded()
+        tasks = {}
+        for row in rows:
+            row = dict(row)
+            task = DispatchTask(row, reserved=reserved.get(_int(row.get('id')), 0))
+            if task.id:
+                tasks[task.id] = task
+
+        self._tasks = tasks
+        self._heaps = {}
+        for task in tasks.values():
+            self._push(task)
+        # Forget claims on tasks that are gone
+        for user_id in list(self._claimed):
+            self._claimed[user_id] &= tasks.keys()
+            if not self._claimed[user_id]:
+                del self._claimed[user_id]
+        self.loaded_at = time.monotonic()
+        self.reloads += 1
+        self._dirty = False
+        return len(tasks)
+
+    def mark_dirty(self, key: str = '*'):
+        """Cache-sync handler: reload on the flusher's next pass"""
+        self._dirty = True
+        self._wakeup.set()
+
+    def _live(self, entry: Entry) -> Optional[DispatchTask]:
+        task = self._tasks.get(entry[2])
+        if task is None or task.version != entry[3] or task.remaining == 0:
+            return None
+        return task
+
+    def _peek(self, task_type: str, claimed) -> Optional[Entry]:
+        """Best entry of one heap the user hasn't claimed; drops stale entries"""
+        heap = self._heaps.get(task_type)
+        skipped = []
+        best = None
+        while heap:
+            entry = heap[0]
+            task = self._live(entry)
+            if task is None:
+                heapq.heappop(heap)
+            elif task.id in claimed:
+                skipped.append(heapq.heappop(heap))
+            else:
+                best = entry
+                break
+        for entry in skipped:
+            heapq.heappush(heap, entry)
+        return best
+
+    # ---- earners ----
+
+    def next_task(self, user_id: int, task_type: Optional[str] = None) -> Optional[dict]:
+        """The highest-priority task `user_id` hasn't claimed yet"""
+        claimed = self._claimed.get(user_id, ())
+        best = None
+        for name in ([task_type] if task_type else list(self._heaps)):
+            entry = self._peek(name, claimed)
+            if entry and (best is None or entry < best):
+                best = entry
+        return self.view(self._tasks[best[2]]) if best else None
+
+    def available(self, user_id: int, task_type: Optional[str] = None, limit: int = 50) -> List[dict]:
+        """Up to `limit` tasks open to `user_id`, best first"""
+        claimed = self._claimed.get(user_id, ())
+        tasks = (
+            task for task in self._tasks.values()
+            if task.remaining != 0 and task.id not in claimed
+            and (task_type is None or task.type == task_type)
+        )
+        return [self.view(task) for task in heapq.nsmallest(limit, tasks, key=DispatchTask.entry)]
+
+    @staticmethod
+    def view(task: DispatchTask) -> dict:
+        data = dict(task.data)
+        if task.remaining is not None:
+            data['remaining'] = task.remaining
+        return data
+
+    def has(self, task_id: int) -> bool:
+        return task_id in self._tasks
+
+    async def claim(
+        self,
+        user_id: int,
+        task_id: int,
+        proof_url: Optional[str] = None
+    ) -> Optional[str]:
+        """Reserve a slot of a known task and wait until it is persisted
+
+        Returns why the claim was refused or failed, or None once it has
+        been written.
+        """
+        task = self._tasks.get(task_id)
+        if task is None:
+            return "Task not found"
+        claimed = self._claimed.setdefault(user_id, set())
+        if task_id in claimed:
+            return "Task already submitted"
+        if task.remaining == 0:
+            return "Task is no longer available"
+
+        claimed.add(task_id)
+        self._take(task, -1)
+        done = asyncio.get_running_loop().create_future()
+        self._pending.append((user_id, task_id, proof_url, done))
+        self.claims += 1
+        self._wakeup.set()
+        # Shielded: a client that goes away doesn't take the claim's write with it
+        return await asyncio.shield(done)
+
+    def _take(self, task: DispatchTask, delta: int):
+        """Change a task's remaining quantity and requeue it under its new priority"""
+        if task.remaining is not None:
+            task.remaining = max(task.remaining + delta, 0)
+        task.version += 1
+        self._push(task)
+
+    def _release(self, user_id: int, task_id: int):
+        """Undo a claim whose write failed"""
+        self._claimed.get(user_id, set()).discard(task_id)
+        task = self._tasks.get(task_id)
+        if task is not None:
+            self._take(task, 1)
+
+    # ---- persistence ----
+
+    async def flush(self) -> int:
+        """Write queued claims in one transaction; returns how many were persisted"""
+        batch, self._pending = self._pending[:FLUSH_BATCH_SIZE], self._pending[FLUSH_BATCH_SIZE:]
+        if not batch:
+            return 0
+        now = time.time()
+
+        async def unit(db: aiosqlite.Connection) -> Set[Tuple[int, int]]:
+            users = list({item[0] for item in batch})
+            task_ids = list({item[1] for item in batch})
+            # Submitted earlier, e.g. before this worker started
+            async with db.execute(
+                f"""SELECT user_id, task_id FROM tekin_task_submissions
+                    WHERE user_id IN ({','.join('?' * len(users))})
+                      AND task_id IN ({','.join('?' * len(task_ids))})""",
+                users + task_ids
+            ) as cursor:
+                existing = {(row[0], row[1]) for row in await cursor.fetchall()}
+            await db.executemany(
+                """INSERT OR IGNORE INTO tekin_task_submissions
+                   (user_id, task_id, proof_url, status, created_at) VALUES (?, ?, ?, ?, ?)""",
+                [(user_id, task_id, proof_url, QUEUED, now)
+                 for user_id, task_id, proof_url, _ in batch
+                 if (user_id, task_id) not in existing]
+            )
+            return existing
+
+        try:
+            existing = await pool.write(unit)
+        except Exception as e:
+            logger.error(f"Persisting {len(batch)} task submissions failed: {e}")
+            existing = None
+
+        persisted = 0
+        for user_id, task_id, _, done in batch:
+            if existing is None:
+                error = "Failed to submit task"
+                self._release(user_id, task_id)
+            elif (user_id, task_id) in existing:
+                error = "Task already submitted"
+                self._release(user_id, task_id)
+                self._claimed.setdefault(user_id, set()).add(task_id)
+            else:
+                error = None
+                persisted += 1
+            if error:
+                self.failed += 1
+            if not done.done():
+                done.set_result(error)
+
+        self.persisted += persisted
+        self.flushes += 1
+        if persisted:
+            self._forward_wakeup.set()
+        return persisted
+
+    async def forward(self) -> int:
+        """Hand one batch of queued submissions to the tekin module; returns how many"""
+        now = time.time()
+
+        async def take(db: aiosqlite.Connection) -> list:
+            async with db.execute(
+                """SELECT id, user_id, task_id, proof_url FROM tekin_task_submissions
+                   WHERE status = ? OR (status = ? AND claimed_at < ?)
+                   ORDER BY id LIMIT ?""",
+                (QUEUED, FORWARDING, now - FORWARD_TIMEOUT, FLUSH_BATCH_SIZE)
+            ) as cursor:
+                rows = await cursor.fetchall()
+            await db.executemany(
+                "UPDATE tekin_task_submissions SET status = ?, claimed_at = ? WHERE id = ?",
+                [(FORWARDING, now, row[0]) for row in rows]
+            )
+            return rows
+
+        rows = await pool.write(take)
+        results = []
+        for submission_id, user_id, task_id, proof_url in rows:
+            try:
+                ok = await self._persist(user_id=user_id, task_id=task_id, proof_url=proof_url)
+            except Exception as e:
+                # Left claimed; forwarded again after FORWARD_TIMEOUT
+                logger.error(f"Forwarding submission of task {task_id} by {user_id} failed: {e}")
+                continue
+            results.append((FORWARDED if ok else REJECTED, submission_id))
+
+        async def done(db: aiosqlite.Connection):
+            await db.executemany(
+                "UPDATE tekin_task_submissions SET status = ? WHERE id = ?", results
+            )
+
+        if results:
+            await pool.write(done)
+        forwarded = sum(1 for status, _ in results if status == FORWARDED)
+        self.forwarded += forwarded
+        self.rejected += len(results) - forwarded
+        return len(results)
+
+    async def _forward_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._forward_wakeup.wait(), RELOAD_MIN_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._forward_wakeup.clear()
+            try:
+                if await self.forward() >= FLUSH_BATCH_SIZE:
+                    self._forward_wakeup.set()
+            except Exception as e:
+                logger.error(f"Forwarding task submissions failed: {e}")
+
+    async def _run(self, publish: Optional[Callable[[], Awaitable[object]]]):
+        while True:
+            try:
+                # Woken by every claim; otherwise just checks whether to reload
+                await asyncio.wait_for(self._wakeup.wait(), RELOAD_MIN_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                if await self.flush() and publish:
+                    await publish()
+                since = time.monotonic() - (self.loaded_at or 0)
+                if since >= RELOAD_INTERVAL or (self._dirty and since >= RELOAD_MIN_INTERVAL):
+                    await self.reload()
+            except Exception as e:
+                logger.error(f"Task dispatcher pass failed: {e}")
+            if self._pending:
+                self._wakeup.set()
+
+    async def start(self, publish: Optional[Callable[[], Awaitable[object]]] = None):
+        """Load the snapshot and start the flusher; `publish()` tells other workers to reload"""
+        try:
+            await self.reload()
+        except Exception as e:
+            # The flusher retries on its next pass; until then tasks are empty
+            logger.error(f"Loading tekin tasks failed: {e}")
+        self._task = asyncio.create_task(self._run(publish))
+        self._forwarder = asyncio.create_task(self._forward_loop())
+
+    async def stop(self):
+        for task in (self._task, self._forwarder):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = self._forwarder = None
+        while self._pending:
+            await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            'tasks': len(self._tasks),
+            'open': sum(1 for task in self._tasks.values() if task.remaining != 0),
+            'heap_entries': {name: len(heap) for name, heap in self._heaps.items()},
+            'pending': len(self._pending),
+            'claims': self.claims,
+            'persisted': self.persisted,
+            'failed': self.failed,
+            'forwarded': self.forwarded,
+            'rejected': self.rejected,
+            'flushes': self.flushes,
+            'reloads': self.reloads,
+            'snapshot_age': round(time.monotonic() - self.loaded_at, 1) if self.loaded_at else None,
+        }
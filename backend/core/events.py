@@ -0,0 +1,288 @@
+"""
+Push events for connected Mini App clients
+Write paths publish small deltas (order placed, payment reviewed, task
+submitted, stock changed) to an in-process bus. Every open event stream
+has a bounded queue and receives the events addressed to its user, plus
+the admin topic for the admin. A client that falls behind far enough to
+fill its queue is disconnected and refetches when it reconnects.
+
+A client is connected to one worker only, so with several workers the
+events are also appended to event_log in batches, and each worker
+replays the rows the others wrote. The relay (EVENTS_RELAY) is on by
+default whenever several processes may share the database: in WAL mode,
+which multi-worker setups use, or when WEB_CONCURRENCY > 1.
+
+Streams are opened with a short-lived token from POST /api/events/token
+rather than initData, because EventSource can only authenticate through
+the URL and URLs end up in access logs.
+"""
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import aiosqlite
+
+from core import metrics
+from core.db import STORAGE_MODE, pool
+from core.responses import dumps
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SIZE = int(os.getenv('EVENTS_QUEUE_SIZE', '100'))
+MAX_STREAMS_PER_USER = int(os.getenv('EVENTS_MAX_PER_USER', '5'))
+HEARTBEAT = float(os.getenv('EVENTS_HEARTBEAT', '15'))
+RELAY_ENABLED = os.getenv(
+    'EVENTS_RELAY',
+    '1' if STORAGE_MODE == 'wal' or int(os.getenv('WEB_CONCURRENCY', '1')) > 1 else '0'
+) == '1'
+RELAY_INTERVAL = float(os.getenv('EVENTS_RELAY_INTERVAL', '0.5'))
+RELAY_BATCH = 500
+# Lifetime of a stream token; it is only checked when a stream (re)connects
+TOKEN_TTL = int(os.getenv('EVENTS_TOKEN_TTL', '60'))
+
+ADMIN = 'admin'
+
+# Event types
+ORDER_CREATED = 'order.created'
+PAYMENT_CREATED = 'payment.created'
+PAYMENT_REVIEWED = 'payment.reviewed'
+TASK_SUBMITTED = 'task.submitted'
+STOCK_CHANGED = 'stock.changed'
+BALANCE_CHANGED = 'balance.changed'
+
+
+def user_topic(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+def encode(event_id: int, event_type: str, data) -> bytes:
+    """One server-sent event"""
+    return (
+        f"id: {event_id}\nevent: {event_type}\ndata: ".encode()
+        + dumps(data) + b"\n\n"
+    )
+
+
+def _sign(secret: bytes, payload: str) -> str:
+    return hmac.new(secret, payload.encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def issue_token(secret: bytes, user_id: int) -> str:
+    """Stream token for `user_id`, valid for TOKEN_TTL seconds in any worker"""
+    payload = f"{user_id}.{int(time.time()) + TOKEN_TTL}"
+    return f"{payload}.{_sign(secret, payload)}"
+
+
+def verify_token(secret: bytes, token: str) -> Optional[int]:
+    """The user id of a valid, unexpired stream token, or None"""
+    payload, _, signature = token.rpartition('.')
+    user_id, _, expires = payload.partition('.')
+    # Compared as bytes: compare_digest rejects non-ASCII str with TypeError
+    if not hmac.compare_digest(_sign(secret, payload).encode(), signature.encode()):
+        return None
+    try:
+        if int(expires) < time.time():
+            return None
+        return int(user_id)
+    except ValueError:
+        return None
+
+
+class Subscriber:
+    __slots__ = ('topics', 'queue', 'closed')
+
+    def __init__(self, topics: Set[str]):
+        self.topics = topics
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.closed = False
+
+    def close(self):
+        """End the stream; whatever is still queued is dropped"""
+        self.closed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+    async def next(self, timeout: float) -> Optional[bytes]:
+        """The next encoded event, a heartbeat comment after `timeout`, or None once closed"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return b": ping\n\n"
+
+
+class EventBus:
+    def __init__(self):
+        self._topics: Dict[str, Set[Subscriber]] = {}
+        self._per_user: Dict[int, int] = {}
+        self._outbox: List[Tuple[str, str, str]] = []
+        self._relay: Optional[asyncio.Task] = None
+        self._last_id = 0
+        self.origin = random.getrandbits(62)
+        self.sequence = 0
+        self.published = 0
+        self.relayed = 0
+        self.dropped = 0
+
+    # ---- subscribers ----
+
+    def subscribe(self, user_id: int, admin: bool = False) -> Optional[Subscriber]:
+        """Open a stream for `user_id`; None when they already have too many"""
+        if self._per_user.get(user_id, 0) >= MAX_STREAMS_PER_USER:
+            return None
+        topics = {user_topic(user_id)} | ({ADMIN} if admin else set())
+        subscriber = Subscriber(topics)
+        for topic in topics:
+            self._topics.setdefault(topic, set()).add(subscriber)
+        self._per_user[user_id] = self._per_user.get(user_id, 0) + 1
+        return subscriber
+
+    def unsubscribe(self, user_id: int, subscriber: Subscriber):
+        for topic in subscriber.topics:
+            subscribers = self._topics.get(topic)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._topics[topic]
+        count = self._per_user.get(user_id, 0) - 1
+        if count > 0:
+            self._per_user[user_id] = count
+        else:
+            self._per_user.pop(user_id, None)
+
+    # ---- publishing ----
+
+    def _deliver(self, topics: Iterable[str], event_type: str, data) -> int:
+        targets = set()
+        for topic in topics:
+            targets |= self._topics.get(topic, set())
+        if not targets:
+            return 0
+
+        self.sequence += 1
+        message = encode(self.sequence, event_type, data)
+        for subscriber in targets:
+            if subscriber.closed:
+                continue
+            try:
+                subscriber.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Too far behind to catch up with deltas; the stream ends and
+                # the client reloads
+                subscriber.close()
+                self.dropped += 1
+        return len(targets)
+
+    def publish(
+        self,
+        event_type: str,
+        data: dict,
+        users: Iterable[int] = (),
+        admin: bool = False
+    ) -> int:
+        """Send an event to `users` (and the admin); returns local receivers
+
+        Call it after the change has been committed. Never blocks: other
+        workers get it from the relay's next pass.
+        """
+        topics = [user_topic(user_id) for user_id in set(users) if user_id is not None]
+        if admin:
+            topics.append(ADMIN)
+        if not topics:
+            return 0
+        self.published += 1
+        metrics.events_published.inc(event_type)
+        if self._relay is not None:
+            self._outbox.append((','.join(topics), event_type, dumps(data).decode()))
+        return self._deliver(topics, event_type, data)
+
+    # ---- cross-worker relay ----
+
+    async def _flush(self):
+        batch, self._outbox = self._outbox[:RELAY_BATCH], self._outbox[RELAY_BATCH:]
+        if not batch:
+            return
+        now = time.time()
+
+        async def unit(db: aiosqlite.Connection):
+            await db.executemany(
+                "INSERT INTO event_log (origin, topics, type, data, created_at) VALUES (?, ?, ?, ?, ?)",
+                [(self.origin, topics, event_type, data, now) for topics, event_type, data in batch]
+            )
+
+        try:
+            await pool.write(unit)
+        except Exception:
+            # Keep the events for the next pass instead of losing them
+            self._outbox[:0] = batch
+            raise
+
+    async def _replay(self):
+        async with pool.reader() as db:
+            async with db.execute(
+                """SELECT id, origin, topics, type, data FROM event_log
+                   WHERE id > ? ORDER BY id LIMIT ?""",
+                (self._last_id, RELAY_BATCH)
+            ) as cursor:
+                rows = await cursor.fetchall()
+        for event_id, origin, topics, event_type, data in rows:
+            self._last_id = event_id
+            if origin != self.origin:
+                self._deliver(topics.split(','), event_type, json.loads(data))
+                self.relayed += 1
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(RELAY_INTERVAL)
+            try:
+                await self._flush()
+                await self._replay()
+            except Exception as e:
+                logger.error(f"Event relay failed: {e}")
+
+    async def start(self):
+        if not RELAY_ENABLED:
+            return
+        async with pool.reader() as db:
+            async with db.execute("SELECT COALESCE(MAX(id), 0) FROM event_log") as cursor:
+                self._last_id = (await cursor.fetchone())[0]
+        self._relay = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._relay:
+            self._relay.cancel()
+            try:
+                await self._relay
+            except asyncio.CancelledError:
+                pass
+            self._relay = None
+            try:
+                while self._outbox:
+                    await self._flush()
+            except Exception as e:
+                logger.error(f"Event relay failed to flush {len(self._outbox)} events: {e}")
+        # Let open streams finish instead of waiting on their heartbeat
+        for subscribers in list(self._topics.values()):
+            for subscriber in subscribers:
+                if not subscriber.closed:
+                    subscriber.close()
+
+    def stats(self) -> dict:
+        return {
+            'streams': sum(self._per_user.values()),
+            'users': len(self._per_user),
+            'published': self.published,
+            'relay': RELAY_ENABLED,
+            'relayed': self.relayed,
+            'outbox': len(self._outbox),
+            'dropped': self.dropped,
+        }
+
+
+event_bus = EventBus()
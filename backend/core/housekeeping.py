@@ -0,0 +1,179 @@
+"""
+Housekeeping tasks run by core.scheduler
+Listings past their date are moved out of the 'active' set in small
+batches, one short write transaction each, so request writes interleave
+with a large backlog instead of waiting behind it.
+"""
+import logging
+import os
+import time
+from datetime import date, datetime
+from typing import Optional, Tuple
+
+import aiosqlite
+
+from core.db import pool
+from core.idempotency import IDEMPOTENCY_TTL
+from core.scheduler import Scheduler
+from core.schema import _table_exists
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.getenv('HOUSEKEEPING_BATCH_SIZE', '500'))
+ACTIVITY_RETENTION_DAYS = int(os.getenv('ACTIVITY_RETENTION_DAYS', '90'))
+VACUUM_PAGES = int(os.getenv('VACUUM_PAGES', '2000'))
+EVENT_RETENTION = float(os.getenv('EVENT_RETENTION', '600'))
+SUBMISSION_RETENTION_DAYS = int(os.getenv('SUBMISSION_RETENTION_DAYS', '30'))
+
+# The activity log lives in the tekin module's tables; first match wins
+ACTIVITY_TABLES = (os.getenv('ACTIVITY_TABLE', ''), 'activities', 'user_activities', 'tekin_activities')
+ACTIVITY_TIME_COLUMNS = ('created_at', 'timestamp', 'activity_date')
+
+EXPIRED = 'expired'
+SOLD_OUT = 'sold_out'
+
+
+async def _in_batches(table: str, sql: str, params: tuple = ()) -> int:
+    """Run a `... LIMIT ?` batch statement until it changes fewer than BATCH_SIZE rows"""
+    async with pool.reader() as db:
+        if not await _table_exists(db, table):
+            return 0
+
+    async def batch(db: aiosqlite.Connection) -> int:
+        cursor = await db.execute(sql, params + (BATCH_SIZE,))
+        return cursor.rowcount
+
+    total = 0
+    while True:
+        changed = await pool.write(batch)
+        total += changed
+        if changed < BATCH_SIZE:
+            return total
+
+
+async def expire_jobs() -> int:
+    # create_job writes local isoformat(); the bot may use a space separator.
+    # The plain comparison narrows via idx_jobs_expiry, datetime() decides.
+    now = datetime.now().isoformat()
+    return await _in_batches(
+        'jobs',
+        f"""UPDATE jobs SET status = '{EXPIRED}' WHERE id IN (
+               SELECT id FROM jobs
+               WHERE status = 'active' AND expires_at < ?
+                 AND datetime(expires_at) < datetime(?)
+               LIMIT ?)""",
+        (now, now)
+    )
+
+
+async def expire_daily_jobs() -> int:
+    # Only ISO dates compare correctly as text; anything else is left alone
+    return await _in_batches(
+        'daily_jobs',
+        f"""UPDATE daily_jobs SET status = '{EXPIRED}' WHERE id IN (
+               SELECT id FROM daily_jobs
+               WHERE status = 'active' AND work_date < ?
+                 AND work_date GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]*'
+               LIMIT ?)""",
+        (date.today().isoformat(),)
+    )
+
+
+async def close_sold_out_products() -> int:
+    # Matches the idx_products_sold_out predicate, so only sold-out rows are read
+    return await _in_batches(
+        'products',
+        f"""UPDATE products SET status = '{SOLD_OUT}' WHERE id IN (
+               SELECT id FROM products
+               WHERE status = 'active' AND COALESCE(stock, 0) <= 0
+               LIMIT ?)"""
+    )
+
+
+async def _activity_table() -> Optional[Tuple[str, str]]:
+    async with pool.reader() as db:
+        for table in filter(None, ACTIVITY_TABLES):
+            async with db.execute(
+                "SELECT name FROM pragma_table_info(?)", (table,)
+            ) as cursor:
+                columns = {row[0] for row in await cursor.fetchall()}
+            for column in ACTIVITY_TIME_COLUMNS:
+                if column in columns:
+                    return table, column
+    return None
+
+
+async def prune_activities() -> int:
+    found = await _activity_table()
+    if found is None:
+        return 0
+    table, column = found
+    return await _in_batches(
+        table,
+        f"""DELETE FROM {table} WHERE rowid IN (
+               SELECT rowid FROM {table} WHERE {column} < datetime('now', ?) LIMIT ?)""",
+        (f'-{ACTIVITY_RETENTION_DAYS} days',)
+    )
+
+
+async def prune_events() -> int:
+    # Relayed events only matter for the next few relay passes
+    return await _in_batches(
+        'event_log',
+        """DELETE FROM event_log WHERE id IN (
+               SELECT id FROM event_log WHERE created_at < ? LIMIT ?)""",
+        (time.time() - EVENT_RETENTION,)
+    )
+
+
+async def prune_idempotency_keys() -> int:
+    return await _in_batches(
+        'idempotency_keys',
+        """DELETE FROM idempotency_keys WHERE key IN (
+               SELECT key FROM idempotency_keys WHERE created_at < ? LIMIT ?)""",
+        (time.time() - IDEMPOTENCY_TTL,)
+    )
+
+
+async def prune_task_submissions() -> int:
+    # Forwarded rows only guard against resubmission; the tekin module has them
+    return await _in_batches(
+        'tekin_task_submissions',
+        """DELETE FROM tekin_task_submissions WHERE id IN (
+               SELECT id FROM tekin_task_submissions
+               WHERE status IN ('forwarded', 'rejected') AND created_at < ? LIMIT ?)""",
+        (time.time() - SUBMISSION_RETENTION_DAYS * 86400,)
+    )
+
+
+async def optimize() -> int:
+    """PRAGMA optimize, plus an incremental vacuum step when auto_vacuum allows it
+
+    Returns the number of free pages released.
+    """
+    async def unit(db: aiosqlite.Connection) -> int:
+        await db.execute("PRAGMA optimize")
+        async with db.execute("PRAGMA auto_vacuum") as cursor:
+            mode = (await cursor.fetchone())[0]
+        if mode != 2:  # INCREMENTAL; switching modes needs a full VACUUM
+            return 0
+        async with db.execute("PRAGMA freelist_count") as cursor:
+            before = (await cursor.fetchone())[0]
+        async with db.execute(f"PRAGMA incremental_vacuum({VACUUM_PAGES})") as cursor:
+            await cursor.fetchall()
+        async with db.execute("PRAGMA freelist_count") as cursor:
+            return before - (await cursor.fetchone())[0]
+
+    return await pool.write(unit)
+
+
+def register(scheduler: Scheduler):
+    """Default intervals in seconds; override with SCHEDULE_<NAME>"""
+    scheduler.add('expire_jobs', 600, expire_jobs)
+    scheduler.add('expire_daily_jobs', 600, expire_daily_jobs)
+    scheduler.add('close_sold_out_products', 300, close_sold_out_products)
+    scheduler.add('prune_activities', 3600, prune_activities)
+    scheduler.add('prune_events', 300, prune_events)
+    scheduler.add('prune_idempotency_keys', 3600, prune_idempotency_keys)
+    scheduler.add('prune_task_submissions', 6 * 3600, prune_task_submissions)
+    scheduler.add('optimize', 6 * 3600, optimize)
@@ -0,0 +1,259 @@
+"""
+Idempotency-Key support for money-moving POST endpoints
+A client that may retry a POST that charges or credits money (orders,
+top-ups, purchases, listing fees; IDEMPOTENT_PATHS) sends the same
+`Idempotency-Key` header on every attempt; on other paths it is ignored.
+The first attempt runs normally and its response is stored in
+idempotency_keys; a retry gets the stored response back (with
+`Idempotent-Replayed: true`) without running the handler, so nothing is
+charged or written twice.
+
+Keys are scoped to the caller (user_id parameter or Authorization header)
+and the path, and bound to a hash of the query string and body: reusing a
+key for a different request is a 422. While the first attempt is still
+running, retries in the same worker wait for it and retries in other
+workers get a 409. Server errors and authentication failures are not
+stored, so the request can be retried. Recently used keys are kept in an
+in-memory LRU in front of the table; housekeeping drops rows older than
+IDEMPOTENCY_TTL.
+"""
+import asyncio
+import hashlib
+import os
+import time
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qsl
+
+import aiosqlite
+
+from core.cache import TTLCache
+from core.db import pool
+
+IDEMPOTENCY_TTL = float(os.getenv('IDEMPOTENCY_TTL', '86400'))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv('IDEMPOTENCY_CACHE_SIZE', '10000'))
+# A pending key whose request hasn't finished after this long is taken over
+IDEMPOTENCY_LOCK_TIMEOUT = float(os.getenv('IDEMPOTENCY_LOCK_TIMEOUT', '60'))
+
+HEADER = b'idempotency-key'
+MAX_KEY_LENGTH = 255
+IDEMPOTENT_PATHS = frozenset({
+    '/api/market/products/create',
+    '/api/market/orders/create',
+    '/api/market/orders/cart',
+    '/api/jobs/create',
+    '/api/jobs/daily/create',
+    '/api/books/competitions/join',
+    '/api/premium/purchase',
+    '/api/tekin/orders',
+    '/api/tekin/topup',
+})
+
+# (fingerprint, status, content type, body)
+Stored = Tuple[bytes, int, bytes, bytes]
+
+
+def _digest(*parts: bytes) -> bytes:
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(len(part).to_bytes(4, 'big'))
+        h.update(part)
+    return h.digest()[:16]
+
+
+def _caller(scope: dict) -> bytes:
+    for name, value in parse_qsl(scope.get('query_string', b'').decode('latin-1')):
+        if name == 'user_id':
+            return b'user:' + value.encode()
+    for name, value in scope['headers']:
+        if name == b'authorization':
+            return b'auth:' + hashlib.sha256(value).digest()
+    return b''
+
+
+async def _read_body(receive) -> Optional[bytes]:
+    """The whole request body, or None if the client went away"""
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] != 'http.request':
+            return None
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def _send_json(
+    send,
+    status: int,
+    body: bytes,
+    content_type: bytes = b'application/json',
+    replayed: bool = False
+):
+    headers = [(b'content-type', content_type), (b'content-length', str(len(body)).encode())]
+    if replayed:
+        headers.append((b'idempotent-replayed', b'true'))
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def _storable(status: int) -> bool:
+    # 409/429 say "try again later", 401/403 "try again with fresh
+    # initData"; 5xx may not have happened at all
+    return status < 500 and status not in (401, 403, 409, 429)
+
+
+class IdempotencyStore:
+    """Stored responses: hot LRU in front of the idempotency_keys table"""
+
+    def __init__(self):
+        self.cache = TTLCache(maxsize=IDEMPOTENCY_CACHE_SIZE, ttl=IDEMPOTENCY_TTL)
+        self.inflight: Dict[bytes, asyncio.Future] = {}
+        self.replayed = 0
+        self.stored = 0
+        self.conflicts = 0
+        self.mismatches = 0
+
+    async def reserve(self, key: bytes, fingerprint: bytes):
+        """The stored response, 'pending' if another request holds the key, or None once reserved"""
+        stored = self.cache.get(key)
+        if stored is not None:
+            return stored
+
+        async def unit(db: aiosqlite.Connection):
+            now = time.time()
+            async with db.execute(
+                """SELECT fingerprint, status, content_type, body, created_at
+                   FROM idempotency_keys WHERE key = ?""",
+                (key,)
+            ) as cursor:
+                row = await cursor.fetchone()
+            if row is not None:
+                if row[1] is not None and row[4] > now - IDEMPOTENCY_TTL:
+                    return tuple(row[:4])
+                if row[1] is None and row[4] > now - IDEMPOTENCY_LOCK_TIMEOUT:
+                    return 'pending'
+            await db.execute(
+                """INSERT OR REPLACE INTO idempotency_keys (key, fingerprint, created_at)
+                   VALUES (?, ?, ?)""",
+                (key, fingerprint, now)
+            )
+            return None
+
+        stored = await pool.write(unit)
+        if isinstance(stored, tuple):
+            self.cache.set(key, stored)
+        return stored
+
+    async def complete(self, key: bytes, stored: Stored):
+        async def unit(db: aiosqlite.Connection):
+            await db.execute(
+                "UPDATE idempotency_keys SET status = ?, content_type = ?, body = ? WHERE key = ?",
+                (stored[1], stored[2], stored[3], key)
+            )
+
+        await pool.write(unit)
+        self.cache.set(key, stored)
+        self.stored += 1
+
+    async def release(self, key: bytes):
+        """Forget a reservation so the request can be retried"""
+        async def unit(db: aiosqlite.Connection):
+            await db.execute("DELETE FROM idempotency_keys WHERE key = ? AND status IS NULL", (key,))
+
+        await pool.write(unit)
+
+    def stats(self) -> dict:
+        return {
+            'cached': len(self.cache),
+            'inflight': len(self.inflight),
+            'replayed': self.replayed,
+            'stored': self.stored,
+            'conflicts': self.conflicts,
+            'mismatches': self.mismatches,
+        }
+
+
+idempotency_store = IdempotencyStore()
+
+
+class IdempotencyMiddleware:
+    def __init__(self, app, store: IdempotencyStore = idempotency_store):
+        self.app = app
+        self.store = store
+
+    async def __call__(self, scope, receive, send):
+        if (scope['type'] != 'http' or scope['method'] != 'POST'
+                or scope['path'] not in IDEMPOTENT_PATHS):
+            return await self.app(scope, receive, send)
+        client_key = next((v for k, v in scope['headers'] if k == HEADER), None)
+        if client_key is None:
+            return await self.app(scope, receive, send)
+        if not client_key or len(client_key) > MAX_KEY_LENGTH:
+            return await _send_json(send, 400, b'{"detail":"Invalid Idempotency-Key"}')
+
+        body = await _read_body(receive)
+        if body is None:
+            return
+        store = self.store
+        key = _digest(_caller(scope), scope['path'].encode(), client_key)
+        fingerprint = _digest(scope.get('query_string', b''), body)
+
+        # Wait out a first attempt still running in this worker
+        while key in store.inflight:
+            await asyncio.shield(store.inflight[key])
+
+        done = asyncio.get_running_loop().create_future()
+        store.inflight[key] = done
+        try:
+            stored = await store.reserve(key, fingerprint)
+            if stored is None:
+                return await self._run(scope, receive, send, body, key, fingerprint)
+        finally:
+            del store.inflight[key]
+            done.set_result(None)
+
+        if stored == 'pending':
+            store.conflicts += 1
+            return await _send_json(
+                send, 409, b'{"detail":"A request with this Idempotency-Key is in progress"}'
+            )
+        if stored[0] != fingerprint:
+            store.mismatches += 1
+            return await _send_json(
+                send, 422, b'{"detail":"Idempotency-Key was used for a different request"}'
+            )
+        store.replayed += 1
+        await _send_json(send, stored[1], stored[3], stored[2], replayed=True)
+
+    async def _run(self, scope, receive, send, body: bytes, key: bytes, fingerprint: bytes):
+        status, content_type, chunks = 500, b'application/json', []
+        body_sent = False
+
+        async def replay_receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {'type': 'http.request', 'body': body, 'more_body': False}
+            return await receive()
+
+        async def send_wrapper(message):
+            nonlocal status, content_type
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                content_type = next(
+                    (v for k, v in message.get('headers', ()) if k == b'content-type'), content_type
+                )
+            elif message['type'] == 'http.response.body':
+                chunks.append(message.get('body', b''))
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, send_wrapper)
+        except BaseException:
+            await self.store.release(key)
+            raise
+
+        if _storable(status):
+            await self.store.complete(key, (fingerprint, status, content_type, b''.join(chunks)))
+        else:
+            await self.store.release(key)
@@ -0,0 +1,90 @@
+"""
+Balance ledger
+Fees are charged with a guarded UPDATE inside the same pool.write()
+transaction that creates what is being paid for, so the charge and the
+listing commit or roll back together and concurrent requests cannot
+overdraw a balance. Every change is recorded in balance_ledger.
+"""
+from typing import Dict, List, Optional, Tuple
+
+import aiosqlite
+from fastapi import HTTPException
+
+
+async def get_balance(db: aiosqlite.Connection, user_id: int) -> Optional[int]:
+    """Current balance, or None for an unknown user"""
+    async with db.execute("SELECT balance FROM users WHERE user_id = ?", (user_id,)) as cursor:
+        row = await cursor.fetchone()
+    return (row[0] or 0) if row else None
+
+
+async def debit(
+    db: aiosqlite.Connection,
+    user_id: int,
+    amount: int,
+    reason: str,
+    ref_type: Optional[str] = None,
+    ref_id: Optional[int] = None,
+    insufficient: str = "Insufficient balance"
+) -> Optional[int]:
+    """Charge `amount` if the balance covers it; returns the new balance
+
+    Raises 400 with `insufficient` as detail when it does not, which rolls
+    back the surrounding write unit.
+    """
+    if amount <= 0:
+        return await get_balance(db, user_id)
+
+    cursor = await db.execute(
+        "UPDATE users SET balance = balance - ? WHERE user_id = ? AND balance >= ?",
+        (amount, user_id, amount)
+    )
+    charged = cursor.rowcount
+    balance = await get_balance(db, user_id)
+    if balance is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    if not charged:
+        raise HTTPException(status_code=400, detail=insufficient)
+
+    await db.execute(
+        """INSERT INTO balance_ledger (user_id, amount, balance_after, reason, ref_type, ref_id)
+           VALUES (?, ?, ?, ?, ?, ?)""",
+        (user_id, -amount, balance, reason, ref_type, ref_id)
+    )
+    return balance
+
+
+async def credit_many(
+    db: aiosqlite.Connection,
+    credits: List[Tuple[int, int, str, Optional[str], Optional[int]]]
+) -> Dict[int, int]:
+    """Credit (user_id, amount, reason, ref_type, ref_id) rows with one
+    executemany each for balances and balance_ledger; returns the new
+    balance per user. Credits to unknown users are skipped.
+    """
+    credits = [credit for credit in credits if credit[1] > 0]
+    if not credits:
+        return {}
+    users = list({credit[0] for credit in credits})
+    placeholders = ','.join('?' * len(users))
+    async with db.execute(
+        f"SELECT user_id, balance FROM users WHERE user_id IN ({placeholders})", users
+    ) as cursor:
+        balances = {row[0]: row[1] or 0 for row in await cursor.fetchall()}
+
+    credits = [credit for credit in credits if credit[0] in balances]
+    rows = []
+    for user_id, amount, reason, ref_type, ref_id in credits:
+        # Running balance, for several credits to one user
+        balances[user_id] += amount
+        rows.append((user_id, amount, balances[user_id], reason, ref_type, ref_id))
+    await db.executemany(
+        "UPDATE users SET balance = COALESCE(balance, 0) + ? WHERE user_id = ?",
+        [(amount, user_id) for user_id, amount, *_ in credits]
+    )
+    await db.executemany(
+        """INSERT INTO balance_ledger (user_id, amount, balance_after, reason, ref_type, ref_id)
+           VALUES (?, ?, ?, ?, ?, ?)""",
+        rows
+    )
+    return {user_id: balances[user_id] for user_id, *_ in credits}
@@ -0,0 +1,310 @@
+"""
+Request metrics
+Per-route latency histograms, DB query counts/time per request and timings
+of selected functions, rendered in the Prometheus text format for /metrics.
+
+Set PROFILE_SLOW_MS to profile a sample of requests and keep traces of the
+ones slower than that under PROFILE_DIR (pyinstrument HTML when installed,
+cProfile .prof files otherwise).
+"""
+import cProfile
+import functools
+import logging
+import os
+import random
+import re
+import sqlite3
+import time
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import aiosqlite
+
+from core import queries
+
+try:
+    from pyinstrument import Profiler
+except ImportError:
+    Profiler = None
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+PROFILE_SLOW_MS = float(os.getenv('PROFILE_SLOW_MS', '0'))  # 0 disables profiling
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0.1'))
+PROFILE_DIR = Path(os.getenv('PROFILE_DIR', 'logs'))
+
+
+class Histogram:
+    """Cumulative-bucket histogram, one series per label tuple"""
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...], buckets: tuple):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series: Dict[tuple, list] = {}
+
+    def observe(self, value: float, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            # bucket counts..., +Inf count, sum
+            series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += 1
+        series[-1] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_values, series in sorted(self._series.items()):
+            labels = _labels(self.labels, label_values)
+            sep = ',' if labels else ''
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{labels}{sep}le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{labels}{sep}le="+Inf"}} {series[-2]}')
+            lines.append(f"{self.name}_sum{{{labels}}} {series[-1]:.6f}")
+            lines.append(f"{self.name}_count{{{labels}}} {series[-2]}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{{{_labels(self.labels, label_values)}}} {value}")
+        return lines
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: tuple, values: tuple) -> str:
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+request_latency = Histogram(
+    'http_request_duration_seconds', 'Request latency by route',
+    ('method', 'route'), LATENCY_BUCKETS
+)
+request_db_time = Histogram(
+    'http_request_db_seconds', 'Time spent in database calls per request',
+    ('method', 'route'), LATENCY_BUCKETS
+)
+request_db_queries = Histogram(
+    'http_request_db_queries', 'Database statements executed per request',
+    ('method', 'route'), QUERY_COUNT_BUCKETS
+)
+requests_total = Counter(
+    'http_requests_total', 'Requests by route and status', ('method', 'route', 'status')
+)
+function_latency = Histogram(
+    'function_duration_seconds', 'Time spent in instrumented functions',
+    ('function',), LATENCY_BUCKETS
+)
+
+task_latency = Histogram(
+    'scheduler_task_duration_seconds', 'Background task run time', ('task',), LATENCY_BUCKETS
+)
+task_runs = Counter('scheduler_task_runs_total', 'Background task runs by outcome', ('task', 'status'))
+task_rows = Counter('scheduler_task_rows_total', 'Rows changed by background tasks', ('task',))
+events_published = Counter('events_published_total', 'Push events published by type', ('type',))
+rate_limited = Counter('rate_limited_total', 'Requests rejected by the rate limiter', ('rule',))
+
+METRICS = [
+    request_latency, request_db_time, request_db_queries, requests_total, function_latency,
+    task_latency, task_runs, task_rows, events_published, rate_limited,
+]
+
+
+def render() -> str:
+    lines = []
+    for metric in METRICS:
+        lines += metric.render()
+    return '\n'.join(lines) + '\n'
+
+
+# ============================================
+# PER-REQUEST CONTEXT
+# ============================================
+
+class RequestStats:
+    __slots__ = ('db_queries', 'db_time')
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_time = 0.0
+
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar('current_request', default=None)
+
+# sqlite3 calls that run a statement (as opposed to fetches, commits, ...)
+STATEMENT_CALLS = {'execute', 'executemany', 'executescript'}
+
+
+class InstrumentedConnection(aiosqlite.Connection):
+    """aiosqlite connection that charges its calls to the current request
+
+    Statements are also fed to core.queries for per-fingerprint statistics.
+    """
+
+    async def _execute(self, fn, *args, **kwargs):
+        # Every call aiosqlite makes, cursors included, funnels through here
+        started = time.perf_counter()
+        try:
+            result = await super()._execute(fn, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            name = getattr(fn, '__name__', None)
+            stats = current_request.get()
+            if stats is not None:
+                stats.db_time += elapsed
+                if name in STATEMENT_CALLS:
+                    stats.db_queries += 1
+
+        if name in STATEMENT_CALLS and args and isinstance(args[0], str):
+            needs_plan = queries.record(args[0], elapsed)
+            if needs_plan is not None:
+                await self._explain(name, args, elapsed, needs_plan)
+        return result
+
+    async def _explain(self, name: str, args: tuple, elapsed: float, stats: 'queries.QueryStats'):
+        """Attach EXPLAIN QUERY PLAN output to a slow statement's stats"""
+        stats.plan = []
+        if name == 'execute' and queries.explainable(args[0]):
+            params = args[1] if len(args) > 1 else ()
+            try:
+                cursor = await super()._execute(
+                    self._conn.execute, f"EXPLAIN QUERY PLAN {args[0]}", params
+                )
+                rows = await super()._execute(cursor.fetchall)
+                stats.plan = [row[3] for row in rows]
+            except sqlite3.Error as e:
+                stats.plan = [f"(EXPLAIN failed: {e})"]
+        queries.log_slow(args[0], elapsed, stats)
+
+
+def connect(database: str, *, iter_chunk_size: int = 64, **kwargs: Any) -> InstrumentedConnection:
+    """Drop-in for aiosqlite.connect() returning an InstrumentedConnection"""
+    return InstrumentedConnection(
+        lambda: sqlite3.connect(str(database), **kwargs), iter_chunk_size
+    )
+
+
+def timed(name: str) -> Callable:
+    """Record how long the decorated (sync) function takes"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                function_latency.observe(time.perf_counter() - started, name)
+        return wrapper
+    return decorator
+
+
+# ============================================
+# MIDDLEWARE
+# ============================================
+
+class _Profile:
+    """One sampled request profile; only one runs at a time"""
+    active = False
+
+    def __init__(self):
+        _Profile.active = True
+        if Profiler is not None:
+            self.profiler = Profiler(async_mode='enabled')
+            self.profiler.start()
+        else:
+            # cProfile sees every coroutine interleaved on the loop, not just this one
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def finish(self, elapsed: float, method: str, route: str):
+        _Profile.active = False
+        if Profiler is not None:
+            self.profiler.stop()
+        else:
+            self.profiler.disable()
+        if elapsed * 1000 < PROFILE_SLOW_MS:
+            return
+
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+        stem = f"{time.strftime('%Y%m%d-%H%M%S')}-{method}-{slug}-{int(elapsed * 1000)}ms"
+        if Profiler is not None:
+            path = PROFILE_DIR / f"{stem}.html"
+            path.write_text(self.profiler.output_html())
+        else:
+            path = PROFILE_DIR / f"{stem}.prof"
+            self.profiler.dump_stats(str(path))
+        logger.warning(f"Slow request {method} {route} took {elapsed * 1000:.0f}ms, profile: {path}")
+
+
+def route_template(scope) -> str:
+    """Matched route as a template (/api/jobs/{job_id}), or 'unmatched'"""
+    template = getattr(scope.get('route'), 'path', None)
+    if template is None:
+        return 'unmatched'
+    # Routes of included routers may only know the part after their prefix
+    depth = template.count('/')
+    prefix = scope['path'].rsplit('/', depth)[0] if depth else scope['path']
+    return prefix + template
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status and DB usage per route"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        profile = None
+        if PROFILE_SLOW_MS and not _Profile.active and random.random() < PROFILE_SAMPLE_RATE:
+            profile = _Profile()
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            current_request.reset(token)
+            # Route templates keep label cardinality bounded
+            route = route_template(scope)
+            method = scope['method']
+            request_latency.observe(elapsed, method, route)
+            request_db_time.observe(stats.db_time, method, route)
+            request_db_queries.observe(stats.db_queries, method, route)
+            requests_total.inc(method, route, status)
+            if profile:
+                profile.finish(elapsed, method, route)
@@ -0,0 +1,99 @@
+"""
+Marketplace order placement
+Every line item reserves stock with a conditional decrement, so two buyers
+racing for the last unit cannot both succeed. Run these inside pool.write()
+so a multi-item cart is placed or rolled back as one transaction.
+"""
+from typing import Dict, Iterable, List, Tuple
+
+import aiosqlite
+from fastapi import HTTPException
+
+COMMISSION_RATE = 0.05  # 5% commission
+
+MAX_CART_ITEMS = 50
+
+
+async def place_order_line(
+    db: aiosqlite.Connection,
+    buyer_id: int,
+    product_id: int,
+    quantity: int,
+    delivery_address: str,
+    phone: str
+) -> Tuple[int, int]:
+    """Reserve stock and insert one order; returns (order_id, total_price)"""
+    if quantity < 1:
+        raise HTTPException(status_code=400, detail="Invalid quantity")
+
+    cursor = await db.execute(
+        "UPDATE products SET stock = stock - ? WHERE id = ? AND stock >= ?",
+        (quantity, product_id, quantity)
+    )
+    reserved = cursor.rowcount
+
+    async with db.execute(
+        "SELECT seller_id, price FROM products WHERE id = ?", (product_id,)
+    ) as cursor:
+        product = await cursor.fetchone()
+
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    if not reserved:
+        raise HTTPException(status_code=400, detail="Insufficient stock")
+
+    seller_id, price = product[0], product[1]
+    total_price = price * quantity
+    commission = int(total_price * COMMISSION_RATE)
+
+    cursor = await db.execute(
+        """INSERT INTO orders
+           (buyer_id, seller_id, product_id, quantity, total_price,
+            commission_amount, delivery_address, buyer_phone, status)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        (buyer_id, seller_id, product_id, quantity,
+         total_price, commission, delivery_address, phone, 'pending')
+    )
+    return cursor.lastrowid, total_price
+
+
+async def stock_after(db: aiosqlite.Connection, product_ids: Iterable[int]) -> Dict[int, Tuple[int, int]]:
+    """product_id -> (seller_id, stock) as seen by the current transaction"""
+    product_ids = list(set(product_ids))
+    placeholders = ','.join('?' * len(product_ids))
+    async with db.execute(
+        f"SELECT id, seller_id, stock FROM products WHERE id IN ({placeholders})", product_ids
+    ) as cursor:
+        return {row[0]: (row[1], row[2]) for row in await cursor.fetchall()}
+
+
+async def place_cart(
+    db: aiosqlite.Connection,
+    buyer_id: int,
+    items: List[Tuple[int, int]],
+    delivery_address: str,
+    phone: str
+) -> List[dict]:
+    """Place one order per (product_id, quantity) line; any failure aborts them all"""
+    if not items:
+        raise HTTPException(status_code=400, detail="Cart is empty")
+    if len(items) > MAX_CART_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Cart is limited to {MAX_CART_ITEMS} items")
+
+    orders = []
+    for product_id, quantity in items:
+        try:
+            order_id, total_price = await place_order_line(
+                db, buyer_id, product_id, quantity, delivery_address, phone
+            )
+        except HTTPException as e:
+            raise HTTPException(
+                status_code=e.status_code, detail=f"{e.detail} (product {product_id})"
+            )
+        orders.append({
+            "order_id": order_id,
+            "product_id": product_id,
+            "quantity": quantity,
+            "total_price": total_price,
+        })
+    return orders
@@ -0,0 +1,124 @@
+"""
+Keyset (cursor) pagination helpers
+Listings are ordered by a descending sort key that ends with the primary key.
+The next page starts strictly after the last row seen, so every page costs an
+index seek no matter how deep the client scrolls.
+
+`fields=id,title,...` narrows the selected columns (sparse fieldsets); the
+sort keys are always included since the cursor is built from them.
+"""
+import base64
+import json
+import os
+from typing import List, Optional, Sequence, Tuple
+
+import aiosqlite
+from fastapi import HTTPException
+
+from core.cache import TTLCache
+
+MAX_PAGE_SIZE = 100
+
+# Real listing totals, refreshed at most every COUNT_CACHE_TTL seconds
+count_cache = TTLCache(maxsize=1024, ttl=float(os.getenv('COUNT_CACHE_TTL', '30')))
+
+# table -> column names, for validating `fields`
+table_columns = TTLCache(maxsize=64, ttl=300)
+
+
+def encode_cursor(values: Sequence) -> str:
+    """Encode sort key values as an opaque URL-safe token"""
+    raw = json.dumps(list(values), separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+
+def decode_cursor(cursor: str, size: int) -> list:
+    """Decode a token produced by encode_cursor, raising 400 if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+async def select_list(
+    db: aiosqlite.Connection,
+    table: str,
+    fields: Optional[str],
+    required: Sequence[str] = ()
+) -> str:
+    """Column list for a `fields` parameter, or * when it is not given"""
+    if not fields:
+        return "*"
+    columns = table_columns.get(table)
+    if columns is None:
+        async with db.execute("SELECT name FROM pragma_table_info(?)", (table,)) as result:
+            columns = {row[0] for row in await result.fetchall()}
+        table_columns.set(table, columns)
+
+    wanted = [f.strip() for f in fields.split(',') if f.strip()]
+    unknown = [f for f in wanted if f not in columns]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown field: {', '.join(unknown)}")
+    for key in required:
+        if key not in wanted:
+            wanted.append(key)
+    # Names are validated against the table, so quoting is only for keywords
+    return ", ".join(f'"{name}"' for name in wanted)
+
+
+async def fetch_page(
+    db: aiosqlite.Connection,
+    table: str,
+    where: str,
+    params: list,
+    sort_keys: Sequence[str],
+    limit: int,
+    cursor: Optional[str] = None,
+    offset: int = 0,
+    fields: Optional[str] = None
+) -> Tuple[List[dict], Optional[str]]:
+    """Fetch one page of rows and the cursor for the page after it
+
+    `offset` is only honoured when no cursor is given, for older clients.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    columns = await select_list(db, table, fields, sort_keys)
+    query = f"SELECT {columns} FROM {table} WHERE {where}"
+    params = list(params)
+
+    if cursor:
+        values = decode_cursor(cursor, len(sort_keys))
+        query += f" AND ({', '.join(sort_keys)}) < ({', '.join('?' * len(sort_keys))})"
+        params.extend(values)
+
+    query += " ORDER BY " + ", ".join(f"{key} DESC" for key in sort_keys) + " LIMIT ?"
+    params.append(limit + 1)
+
+    if offset and not cursor:
+        query += " OFFSET ?"
+        params.append(offset)
+
+    async with db.execute(query, params) as result:
+        rows = await result.fetchall()
+
+    items = [dict(row) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = encode_cursor([last[key] for key in sort_keys])
+    return items, next_cursor
+
+
+async def count_rows(db: aiosqlite.Connection, table: str, where: str, params: list) -> int:
+    """Total rows matching a listing filter, cached briefly"""
+    key = (table, where, tuple(params))
+    total = count_cache.get(key)
+    if total is None:
+        async with db.execute(f"SELECT COUNT(*) FROM {table} WHERE {where}", params) as result:
+            total = (await result.fetchone())[0]
+        count_cache.set(key, total)
+    return total
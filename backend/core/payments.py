@@ -0,0 +1,93 @@
+"""
+Review of top-up payment requests
+Single and bulk approve/reject both go through review_payments(), one
+pool.write() unit: the requests are read once, only those still pending
+are changed, and the status updates and the balance credits (with their
+balance_ledger rows, see core.ledger) are each written with a single
+executemany. The whole batch commits or rolls back together, so a request
+can't be credited twice or approved without being credited.
+"""
+from typing import Dict, List, Tuple
+
+import aiosqlite
+
+from core.db import pool
+from core.ledger import credit_many
+
+MAX_BULK_REQUESTS = 500
+
+PENDING = 'pending'
+APPROVED = 'approved'
+REJECTED = 'rejected'
+
+
+async def _review(
+    db: aiosqlite.Connection,
+    ids: List[int],
+    status: str,
+    admin_id: int,
+    note: str
+) -> Tuple[Dict[int, dict], List[dict]]:
+    placeholders = ','.join('?' * len(ids))
+    async with db.execute(
+        f"""SELECT p.id, p.user_id, p.amount, p.status, u.user_id IS NOT NULL
+            FROM payment_requests p LEFT JOIN users u ON u.user_id = p.user_id
+            WHERE p.id IN ({placeholders})""",
+        ids
+    ) as cursor:
+        rows = {row[0]: row for row in await cursor.fetchall()}
+
+    results: Dict[int, dict] = {}
+    changed: List[dict] = []
+    for request_id in ids:
+        row = rows.get(request_id)
+        if row is None:
+            results[request_id] = {"success": False, "error": "not_found"}
+            continue
+        _, user_id, amount, current, user_exists = row
+        if current != PENDING:
+            results[request_id] = {"success": False, "error": f"already_{current}"}
+            continue
+        if status == APPROVED and not user_exists:
+            results[request_id] = {"success": False, "error": "user_not_found"}
+            continue
+        results[request_id] = {"success": True, "status": status, "user_id": user_id}
+        changed.append({"request_id": request_id, "user_id": user_id, "amount": amount or 0})
+
+    if not changed:
+        return results, changed
+
+    # The columns the bot's update_payment_request_status() writes
+    await db.executemany(
+        """UPDATE payment_requests SET status = ?, admin_id = ?, admin_note = ?
+           WHERE id = ? AND status = ?""",
+        [(status, admin_id, note, item["request_id"], PENDING) for item in changed]
+    )
+    if status == APPROVED:
+        balances = await credit_many(db, [
+            (item["user_id"], item["amount"], "Payment approved", 'payment_request',
+             item["request_id"])
+            for item in changed
+        ])
+        for item in changed:
+            item["balance"] = balances.get(item["user_id"])
+    return results, changed
+
+
+async def review_payments(
+    request_ids: List[int],
+    status: str,
+    admin_id: int,
+    note: str
+) -> Tuple[Dict[int, dict], List[dict]]:
+    """Set every pending request in `request_ids` to `status` in one transaction
+
+    Approved requests are credited to the user's balance. Returns
+    (per-id results in request order, the requests that changed).
+    """
+    ids = list(dict.fromkeys(request_ids))
+
+    async def unit(db: aiosqlite.Connection):
+        return await _review(db, ids, status, admin_id, note)
+
+    return await pool.write(unit)
@@ -0,0 +1,394 @@
+"""
+Resume PDF rendering
+Templates are drawn with reportlab in a process pool so rendering never
+blocks the event loop. Output is cached on disk under PDF_CACHE_DIR, named
+by a hash of the rendered fields, the template and RENDERER_VERSION, so an
+unchanged resume is only ever rendered once and edits produce a new file.
+"""
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Dict, Optional
+from xml.sax.saxutils import escape
+
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.units import mm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.platypus import (
+    BaseDocTemplate, Frame, FrameBreak, HRFlowable, PageTemplate, Paragraph, Spacer
+)
+
+logger = logging.getLogger(__name__)
+
+PDF_WORKERS = int(os.getenv('PDF_WORKERS', '2'))
+PDF_CACHE_DIR = Path(os.getenv('PDF_CACHE_DIR', 'cache/pdf'))
+PDF_CACHE_MAX_FILES = int(os.getenv('PDF_CACHE_MAX_FILES', '5000'))
+
+# Bump when template output changes so cached files are rendered again
+RENDERER_VERSION = 1
+
+TEMPLATES = ('classic', 'modern', 'professional', 'creative')
+
+CONTACT_FIELDS = ('phone', 'email', 'date_of_birth', 'address')
+SECTIONS = (
+    ('objective', "Maqsad"),
+    ('education', "Ta'lim"),
+    ('experience', "Ish tajribasi"),
+    ('skills', "Ko'nikmalar"),
+    ('languages', "Tillar"),
+    ('additional', "Qo'shimcha"),
+)
+RENDERED_FIELDS = ('full_name',) + CONTACT_FIELDS + tuple(field for field, _ in SECTIONS)
+
+# ============================================
+# FONTS
+# ============================================
+
+# Built-in PDF fonts only cover Latin-1; Uzbek (ʻ) and Cyrillic need a TTF
+FONT_PATHS = [
+    os.getenv('PDF_FONT_DIR', ''),
+    '/usr/share/fonts/truetype/dejavu',
+    '/usr/share/fonts/dejavu',
+    '/Library/Fonts',
+]
+
+_fonts: Optional[Dict[str, str]] = None
+
+
+def _register_fonts() -> Dict[str, str]:
+    """Family name -> regular/bold font names, DejaVu when available"""
+    global _fonts
+    if _fonts is not None:
+        return _fonts
+
+    _fonts = {
+        'sans': 'Helvetica', 'sans-bold': 'Helvetica-Bold',
+        'serif': 'Times-Roman', 'serif-bold': 'Times-Bold',
+    }
+    faces = {
+        'sans': 'DejaVuSans.ttf', 'sans-bold': 'DejaVuSans-Bold.ttf',
+        'serif': 'DejaVuSerif.ttf', 'serif-bold': 'DejaVuSerif-Bold.ttf',
+    }
+    for directory in filter(None, FONT_PATHS):
+        if not os.path.exists(os.path.join(directory, faces['sans'])):
+            continue
+        for key, filename in faces.items():
+            path = os.path.join(directory, filename)
+            if os.path.exists(path):
+                name = filename[:-4]
+                pdfmetrics.registerFont(TTFont(name, path))
+                _fonts[key] = name
+        break
+    else:
+        logger.warning("DejaVu fonts not found; non-Latin-1 text will not render in PDFs")
+    return _fonts
+
+
+# ============================================
+# TEMPLATES
+# ============================================
+
+PRIMARY = colors.HexColor('#8B5CF6')
+SECONDARY = colors.HexColor('#3B82F6')
+DARK = colors.HexColor('#1F2937')
+MUTED = colors.HexColor('#6B7280')
+SIDEBAR = colors.HexColor('#F3F4F6')
+
+MARGIN = 18 * mm
+
+
+def _text(value) -> str:
+    """Escape user text for Paragraph markup, keeping line breaks"""
+    return escape(str(value)).replace('\n', '<br/>')
+
+
+def _styles(family: str, accent, fonts: Dict[str, str]) -> Dict[str, ParagraphStyle]:
+    regular, bold = fonts[family], fonts[f'{family}-bold']
+    return {
+        'name': ParagraphStyle('name', fontName=bold, fontSize=22, leading=26, textColor=DARK),
+        'contact': ParagraphStyle('contact', fontName=regular, fontSize=9.5, leading=13,
+                                  textColor=MUTED),
+        'heading': ParagraphStyle('heading', fontName=bold, fontSize=12, leading=15,
+                                  textColor=accent, spaceBefore=10, spaceAfter=4),
+        'body': ParagraphStyle('body', fontName=regular, fontSize=10, leading=14, textColor=DARK),
+    }
+
+
+def _contacts(data: dict) -> list:
+    return [_text(data[field]) for field in CONTACT_FIELDS if data.get(field)]
+
+
+def _sections(data: dict, styles: dict, fields=None, rule=None) -> list:
+    story = []
+    for field, title in SECTIONS:
+        if (fields is not None and field not in fields) or not data.get(field):
+            continue
+        story.append(Paragraph(escape(title), styles['heading']))
+        if rule is not None:
+            story.append(HRFlowable(width='100%', thickness=0.6, color=rule, spaceAfter=4))
+        story.append(Paragraph(_text(data[field]), styles['body']))
+    return story
+
+
+def _classic(data: dict, fonts: Dict[str, str]):
+    styles = _styles('serif', DARK, fonts)
+    styles['name'].alignment = styles['contact'].alignment = TA_CENTER
+    story = [
+        Paragraph(_text(data.get('full_name') or ''), styles['name']),
+        Paragraph(' · '.join(_contacts(data)), styles['contact']),
+        Spacer(1, 4 * mm),
+        HRFlowable(width='100%', thickness=1, color=DARK),
+    ]
+    story += _sections(data, styles, rule=MUTED)
+    frame = Frame(MARGIN, MARGIN, A4[0] - 2 * MARGIN, A4[1] - 2 * MARGIN, id='main')
+    return [PageTemplate('classic', [frame])], story
+
+
+def _modern(data: dict, fonts: Dict[str, str]):
+    styles = _styles('sans', SECONDARY, fonts)
+    header = 38 * mm
+    styles['name'].textColor = colors.white
+    styles['contact'].textColor = colors.white
+
+    def draw_header(canvas, doc):
+        if doc.page == 1:
+            canvas.saveState()
+            canvas.setFillColor(SECONDARY)
+            canvas.rect(0, A4[1] - header, A4[0], header, stroke=0, fill=1)
+            canvas.restoreState()
+
+    story = [
+        Paragraph(_text(data.get('full_name') or ''), styles['name']),
+        Paragraph('  |  '.join(_contacts(data)), styles['contact']),
+        Spacer(1, header - 26 * mm),
+    ]
+    story += _sections(data, styles)
+    top = A4[1] - 10 * mm
+    frame = Frame(MARGIN, MARGIN, A4[0] - 2 * MARGIN, top - MARGIN, id='main')
+    return [PageTemplate('modern', [frame], onPage=draw_header)], story
+
+
+def _professional(data: dict, fonts: Dict[str, str]):
+    styles = _styles('sans', DARK, fonts)
+    sidebar_width = 62 * mm
+    side_fields = ('skills', 'languages')
+
+    def draw_sidebar(canvas, doc):
+        canvas.saveState()
+        canvas.setFillColor(SIDEBAR)
+        canvas.rect(0, 0, sidebar_width, A4[1], stroke=0, fill=1)
+        canvas.restoreState()
+
+    side_styles = dict(styles, body=ParagraphStyle('side', parent=styles['body'], fontSize=9.5))
+    story = [Paragraph(_text(data.get('full_name') or ''), styles['name']), Spacer(1, 3 * mm)]
+    story += [Paragraph(line, styles['contact']) for line in _contacts(data)]
+    story += _sections(data, side_styles, fields=side_fields)
+    story.append(FrameBreak())
+    story += _sections(
+        data, styles, fields=[f for f, _ in SECTIONS if f not in side_fields], rule=DARK
+    )
+
+    height = A4[1] - 2 * MARGIN
+    side = Frame(10 * mm, MARGIN, sidebar_width - 16 * mm, height, id='side')
+    main = Frame(sidebar_width + 8 * mm, MARGIN, A4[0] - sidebar_width - 8 * mm - MARGIN,
+                 height, id='main')
+    # Pages after the first carry on in a single full-width frame
+    rest = Frame(MARGIN, MARGIN, A4[0] - 2 * MARGIN, height, id='rest')
+    return [
+        PageTemplate('first', [side, main], onPage=draw_sidebar, autoNextPageTemplate='rest'),
+        PageTemplate('rest', [rest]),
+    ], story
+
+
+def _creative(data: dict, fonts: Dict[str, str]):
+    styles = _styles('sans', PRIMARY, fonts)
+    styles['name'].textColor = PRIMARY
+    styles['name'].fontSize, styles['name'].leading = 28, 32
+    stripe = 8 * mm
+
+    def draw_stripe(canvas, doc):
+        canvas.saveState()
+        canvas.setFillColor(PRIMARY)
+        canvas.rect(0, 0, stripe, A4[1], stroke=0, fill=1)
+        canvas.setFillColor(SECONDARY)
+        canvas.rect(stripe, A4[1] - 4 * mm, A4[0] - stripe, 4 * mm, stroke=0, fill=1)
+        canvas.restoreState()
+
+    story = [
+        Paragraph(_text(data.get('full_name') or ''), styles['name']),
+        Paragraph('<br/>'.join(_contacts(data)), styles['contact']),
+        Spacer(1, 2 * mm),
+    ]
+    story += _sections(data, styles, rule=PRIMARY)
+    left = stripe + 14 * mm
+    frame = Frame(left, MARGIN, A4[0] - left - MARGIN, A4[1] - 2 * MARGIN, id='main')
+    return [PageTemplate('creative', [frame], onPage=draw_stripe)], story
+
+
+LAYOUTS = {
+    'classic': _classic,
+    'modern': _modern,
+    'professional': _professional,
+    'creative': _creative,
+}
+
+
+def render(data: dict, template: str) -> bytes:
+    """Render a resume to PDF bytes (CPU-bound; runs in the process pool)"""
+    fonts = _register_fonts()
+    page_templates, story = LAYOUTS[template](data, fonts)
+    buffer = io.BytesIO()
+    doc = BaseDocTemplate(
+        buffer, pagesize=A4, title=str(data.get('full_name') or 'Resume'),
+        author='MEGABOT', leftMargin=MARGIN, rightMargin=MARGIN,
+        topMargin=MARGIN, bottomMargin=MARGIN,
+    )
+    doc.addPageTemplates(page_templates)
+    doc.build(story)
+    return buffer.getvalue()
+
+
+def render_to_file(data: dict, template: str, path: str) -> int:
+    """Render into `path` atomically; returns the file size"""
+    pdf = render(data, template)
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(pdf)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return len(pdf)
+
+
+# ============================================
+# RENDER CACHE
+# ============================================
+
+def content_key(data: dict, template: str) -> str:
+    """Hash of everything that affects the output"""
+    fields = {field: data.get(field) for field in RENDERED_FIELDS}
+    payload = json.dumps(
+        [RENDERER_VERSION, template, fields], ensure_ascii=False, sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _touch(path: Path) -> bool:
+    """Mark a cached file as just used; False if it doesn't exist
+
+    Recency is kept in the mtime because atime is often not updated
+    (noatime/relatime mounts).
+    """
+    try:
+        os.utime(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def _prune(directory: Path, keep: int):
+    """Delete the least recently used files beyond `keep`"""
+    files = [entry for entry in os.scandir(directory) if entry.name.endswith('.pdf')]
+    if len(files) <= keep:
+        return
+    files.sort(key=lambda entry: entry.stat().st_mtime)
+    for entry in files[:len(files) - keep]:
+        try:
+            os.unlink(entry.path)
+        except FileNotFoundError:
+            pass
+
+
+class PdfRenderer:
+    def __init__(self, cache_dir: Path = PDF_CACHE_DIR, workers: int = PDF_WORKERS):
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # key -> [lock, requests using it]
+        self._locks: Dict[str, list] = {}
+        self.hits = 0
+        self.renders = 0
+        self.render_time = 0.0
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: forking a process that runs aiosqlite threads isn't safe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._executor
+
+    def path_for(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.pdf"
+
+    async def get(self, data: dict, template: str) -> Path:
+        """Path of the rendered PDF, rendering it on a cache miss"""
+        key = content_key(data, template)
+        path = self.path_for(key)
+        if _touch(path):
+            self.hits += 1
+            return path
+
+        # One render per key even when several requests miss together
+        entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                if _touch(path):
+                    self.hits += 1
+                    return path
+                loop = asyncio.get_running_loop()
+                started = loop.time()
+                try:
+                    await loop.run_in_executor(
+                        self._pool(), render_to_file, data, template, str(path)
+                    )
+                except BrokenProcessPool:
+                    # A worker died (OOM, killed); start a fresh pool next time
+                    logger.error("PDF render pool broke, restarting it")
+                    self._executor = None
+                    raise
+                self.renders += 1
+                self.render_time += loop.time() - started
+        finally:
+            # Keys are unbounded, so a lock is dropped with its last user
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+        if self.renders % 100 == 0:
+            await asyncio.to_thread(_prune, self.cache_dir, PDF_CACHE_MAX_FILES)
+        return path
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            'workers': self.workers,
+            'cache_dir': str(self.cache_dir),
+            'hits': self.hits,
+            'renders': self.renders,
+            'render_avg_ms': round(self.render_time / self.renders * 1000, 3) if self.renders else 0,
+        }
+
+
+pdf_renderer = PdfRenderer()
@@ -0,0 +1,129 @@
+"""
+SQL query statistics
+Statements run on instrumented connections (see core.metrics) are grouped
+by fingerprint - the SQL with literals replaced by ? - and counted with their
+total and worst time. Statements slower than SLOW_QUERY_MS are logged with
+their EXPLAIN QUERY PLAN, which makes full table scans easy to spot.
+
+SQL_INSTRUMENT_SHARED=1 also routes the bot's shared modules (database,
+tekin_obunachi_db) through instrumented connections.
+"""
+import functools
+import logging
+import os
+import re
+from typing import Dict, List, Optional
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '50'))
+INSTRUMENT_SHARED = os.getenv('SQL_INSTRUMENT_SHARED', '0') == '1'
+
+# Stop tracking new fingerprints past this many (ad-hoc SQL built with literals)
+MAX_FINGERPRINTS = 2000
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_SPACE_RE = re.compile(r"\s+")
+_EXPLAINABLE_RE = re.compile(r"\s*(SELECT|INSERT|UPDATE|DELETE|REPLACE|WITH)\b", re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=4096)
+def fingerprint(sql: str) -> str:
+    """Normalize SQL so statements differing only in literals group together"""
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = _SPACE_RE.sub(' ', sql).strip()
+    return _IN_LIST_RE.sub('IN (...)', sql)
+
+
+class QueryStats:
+    __slots__ = ('count', 'total', 'max', 'slow', 'plan')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.slow = 0
+        self.plan: Optional[List[str]] = None
+
+    @property
+    def full_scan(self) -> bool:
+        # "SCAN t" is a table scan; index scans read "SCAN t USING ... INDEX"
+        return any(
+            line.startswith('SCAN ') and ' USING ' not in line for line in self.plan or ()
+        )
+
+
+query_stats: Dict[str, QueryStats] = {}
+
+
+def explainable(sql: str) -> bool:
+    """Whether EXPLAIN QUERY PLAN says anything useful about `sql`"""
+    return _EXPLAINABLE_RE.match(sql) is not None
+
+
+def record(sql: str, elapsed: float) -> Optional[QueryStats]:
+    """Account one statement; returns its stats when it still needs a query plan"""
+    key = fingerprint(sql)
+    stats = query_stats.get(key)
+    if stats is None:
+        if len(query_stats) >= MAX_FINGERPRINTS:
+            return None
+        stats = query_stats[key] = QueryStats()
+    stats.count += 1
+    stats.total += elapsed
+    if elapsed > stats.max:
+        stats.max = elapsed
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        stats.slow += 1
+        if stats.plan is None:
+            return stats
+        logger.warning(f"Slow query ({elapsed * 1000:.1f}ms): {key}")
+    return None
+
+
+def log_slow(sql: str, elapsed: float, stats: QueryStats):
+    message = f"Slow query ({elapsed * 1000:.1f}ms): {fingerprint(sql)}"
+    if stats.plan:
+        message += "\n  query plan:\n    " + "\n    ".join(stats.plan)
+    logger.warning(message)
+
+
+def report(limit: int = 20, sort: str = 'total') -> List[dict]:
+    """Top fingerprints by total, max, avg or count"""
+    rows = [
+        {
+            'query': key,
+            'count': s.count,
+            'total_ms': round(s.total * 1000, 3),
+            'avg_ms': round(s.total / s.count * 1000, 3) if s.count else 0,
+            'max_ms': round(s.max * 1000, 3),
+            'slow': s.slow,
+            'full_scan': s.full_scan,
+            'plan': s.plan,
+        }
+        for key, s in list(query_stats.items())
+    ]
+    rows.sort(key=lambda row: row[f'{sort}_ms' if sort != 'count' else 'count'], reverse=True)
+    return rows[:limit]
+
+
+def reset():
+    query_stats.clear()
+
+
+def instrument_shared_modules():
+    """Make aiosqlite.connect() return instrumented connections process-wide
+
+    The shared bot modules open their own connections through aiosqlite.connect,
+    so patching the module attribute is the only way to see their queries.
+    """
+    from core import metrics
+
+    if aiosqlite.connect is not metrics.connect:
+        aiosqlite.connect = metrics.connect
+        logger.info("SQL instrumentation enabled for shared modules")
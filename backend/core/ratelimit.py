@@ -0,0 +1,175 @@
+"""
+Per-client request rate limiting
+Token buckets per (rule, client), checked in middleware before routing and
+authentication, so a flood is turned away without HMAC validation or a
+database connection. Clients are identified by their Telegram user id when
+their initData has already been validated (a lookup in the auth cache),
+and by IP address otherwise.
+
+Buckets are stored GCRA-style as a single float each, the time at which
+the bucket will be full again; a bucket that is already full carries no
+information and is dropped by the periodic sweep.
+
+Rules are "burst:rate" (requests, then requests per second) and match the
+longest path prefix. Override or add them with RATE_LIMITS, e.g.
+RATE_LIMITS="/api/search=10:1,/api/tekin/daily-bonus=3:0.05". A rate of
+0 turns limiting off for the prefix.
+"""
+import math
+import os
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from core import metrics
+
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', '1') == '1'
+RATE_LIMIT_MAX_KEYS = int(os.getenv('RATE_LIMIT_MAX_KEYS', '100000'))
+SWEEP_INTERVAL = 60.0
+
+DEFAULT_RULES = {
+    '': '60:10',
+    '/api/auth/validate': '20:1',
+    '/api/batch': '20:2',
+    '/api/search': '30:3',
+    '/api/events/stream': '10:0.2',
+    '/api/tekin/daily-bonus': '5:0.1',
+    '/api/tekin/tasks/submit': '20:1',
+    '/api/resume/': '30:2',
+    '/api/market/orders/': '20:1',
+    '/api/market/products/create': '10:0.2',
+    '/api/jobs/create': '10:0.2',
+    '/api/jobs/daily/create': '10:0.2',
+}
+
+EXEMPT_PATHS = {'/', '/api/health', '/metrics'}
+
+
+class Rule:
+    __slots__ = ('prefix', 'burst', 'rate', 'interval', 'tolerance')
+
+    def __init__(self, prefix: str, spec: str):
+        try:
+            burst, rate = spec.split(':')
+            self.burst = int(burst)
+            self.rate = float(rate)
+        except ValueError:
+            raise ValueError(
+                f"Invalid rate limit {spec!r} for {prefix!r}, expected burst:rate"
+            ) from None
+        if not math.isfinite(self.rate) or self.rate < 0 or (self.rate and self.burst < 1):
+            raise ValueError(
+                f"Invalid rate limit {spec!r} for {prefix!r}: "
+                f"burst must be at least 1 and rate positive, or rate 0 for no limit"
+            )
+        self.prefix = prefix
+        # GCRA: one request every `interval`, up to `burst` at once; 0 = no limit
+        self.interval = 1.0 / self.rate if self.rate else 0.0
+        self.tolerance = self.interval * (self.burst - 1)
+
+
+def parse_rules(spec: str) -> Dict[str, str]:
+    rules = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        prefix, _, value = item.partition('=')
+        rules[prefix.strip()] = value.strip()
+    return rules
+
+
+class RateLimiter:
+    def __init__(self, rules: Dict[str, str], max_keys: int = RATE_LIMIT_MAX_KEYS):
+        # Longest prefix first
+        self.rules: List[Rule] = sorted(
+            (Rule(prefix, spec) for prefix, spec in rules.items()),
+            key=lambda rule: len(rule.prefix), reverse=True
+        )
+        self.max_keys = max_keys
+        self._buckets: Dict[Tuple[str, object], float] = {}
+        self._next_sweep = time.monotonic() + SWEEP_INTERVAL
+        self.limited = 0
+        self.evicted = 0
+
+    def rule_for(self, path: str) -> Rule:
+        for rule in self.rules:
+            if path.startswith(rule.prefix):
+                return rule
+        return self.rules[-1]
+
+    def hit(self, rule: Rule, client) -> float:
+        """Take one request from the client's bucket; returns 0 or seconds to wait"""
+        if not rule.interval:
+            return 0.0
+        now = time.monotonic()
+        if now >= self._next_sweep or len(self._buckets) >= self.max_keys:
+            self.sweep(now)
+
+        key = (rule.prefix, client)
+        full_at = max(self._buckets.get(key, now), now)
+        wait = full_at - rule.tolerance - now
+        if wait > 0:
+            self.limited += 1
+            return wait
+        self._buckets[key] = full_at + rule.interval
+        return 0.0
+
+    def sweep(self, now: Optional[float] = None):
+        """Drop full (idle) buckets; past max_keys, also the oldest ones"""
+        now = time.monotonic() if now is None else now
+        before = len(self._buckets)
+        self._buckets = {key: full_at for key, full_at in self._buckets.items() if full_at > now}
+        excess = len(self._buckets) - self.max_keys // 2
+        if excess > 0 and before >= self.max_keys:
+            # Under a flood of distinct clients: keep the newest half
+            for key in list(self._buckets)[:excess]:
+                del self._buckets[key]
+        self.evicted += before - len(self._buckets)
+        self._next_sweep = now + SWEEP_INTERVAL
+
+    def stats(self) -> dict:
+        return {
+            'enabled': RATE_LIMIT_ENABLED,
+            'buckets': len(self._buckets),
+            'limited': self.limited,
+            'evicted': self.evicted,
+            'rules': {rule.prefix or '*': f"{rule.burst}:{rule.rate:g}" for rule in self.rules},
+        }
+
+
+rate_limiter = RateLimiter({**DEFAULT_RULES, **parse_rules(os.getenv('RATE_LIMITS', ''))})
+
+
+class RateLimitMiddleware:
+    def __init__(
+        self,
+        app,
+        identify: Callable[[dict], Optional[int]] = lambda scope: None,
+        limiter: RateLimiter = rate_limiter
+    ):
+        """`identify(scope)` returns an already-validated user id, or None to key by IP"""
+        self.app = app
+        self.identify = identify
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        if (not RATE_LIMIT_ENABLED or scope['type'] != 'http'
+                or scope['method'] == 'OPTIONS' or scope['path'] in EXEMPT_PATHS):
+            return await self.app(scope, receive, send)
+
+        user_id = self.identify(scope)
+        client = user_id if user_id is not None else (scope.get('client') or ('',))[0]
+        rule = self.limiter.rule_for(scope['path'])
+        wait = self.limiter.hit(rule, client)
+        if not wait:
+            return await self.app(scope, receive, send)
+
+        metrics.rate_limited.inc(rule.prefix or '*')
+        body = b'{"detail":"Too many requests"}'
+        await send({
+            'type': 'http.response.start',
+            'status': 429,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode()),
+                (b'retry-after', str(math.ceil(wait)).encode()),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': body})
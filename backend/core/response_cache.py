@@ -0,0 +1,145 @@
+"""
+In-process response cache for static and slow-changing endpoints
+Payloads are serialized to JSON bytes once and served with an ETag, so cache
+hits skip both the handler and response encoding, and clients holding a
+matching If-None-Match get an empty 304.
+"""
+import asyncio
+import hashlib
+import inspect
+import os
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, Set
+
+from fastapi import Request, Response
+
+from core.responses import dumps
+
+# Tags used to invalidate groups of cached responses
+PREMIUM_SETTINGS = 'premium_settings'
+CATALOG = 'catalog'
+
+# Server-side lifetime and client max-age (seconds) per kind of data.
+# Catalog lists only change on deploy; premium prices are edited by admins.
+CATALOG_TTL = float(os.getenv('CATALOG_CACHE_TTL', '86400'))
+CATALOG_MAX_AGE = int(os.getenv('CATALOG_MAX_AGE', '3600'))
+SETTINGS_TTL = float(os.getenv('SETTINGS_CACHE_TTL', '300'))
+SETTINGS_MAX_AGE = int(os.getenv('SETTINGS_MAX_AGE', '60'))
+
+
+class CachedResponse:
+    __slots__ = ('body', 'etag', 'cache_control', 'expires_at')
+
+    def __init__(self, body: bytes, ttl: float, max_age: int):
+        self.body = body
+        self.etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        self.cache_control = f"public, max-age={max_age}"
+        self.expires_at = time.monotonic() + ttl
+
+
+def serialize(payload: Any) -> bytes:
+    """Encode a payload the way the app's default response class does"""
+    return dumps(payload)
+
+
+class ResponseCache:
+    """Cached JSON responses keyed by name, grouped by invalidation tags"""
+
+    def __init__(self):
+        self._entries: Dict[str, CachedResponse] = {}
+        self._tags: Dict[str, Set[str]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    async def _entry(
+        self,
+        key: str,
+        build: Callable[[], Any],
+        ttl: float,
+        max_age: int,
+        tags: Iterable[str]
+    ) -> CachedResponse:
+        entry = self._entries.get(key)
+        if entry and entry.expires_at > time.monotonic():
+            self.hits += 1
+            return entry
+
+        # One rebuild per key even when many requests miss at once
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            entry = self._entries.get(key)
+            if entry and entry.expires_at > time.monotonic():
+                self.hits += 1
+                return entry
+            self.misses += 1
+            payload = build()
+            if inspect.isawaitable(payload):
+                payload = await payload
+            entry = CachedResponse(serialize(payload), ttl, max_age)
+            self._entries[key] = entry
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            return entry
+
+    async def serve(
+        self,
+        request: Request,
+        key: str,
+        build: Callable[[], Any],
+        ttl: float,
+        max_age: Optional[int] = None,
+        tags: Iterable[str] = ()
+    ) -> Response:
+        """Return the cached response for `key`, building it with `build` on a miss
+
+        `build` may be a plain or async callable returning a JSON-able payload.
+        `max_age` (defaults to `ttl`) is what clients are told to cache for.
+        """
+        max_age = int(ttl if max_age is None else max_age)
+        entry = await self._entry(key, build, ttl, max_age, tags)
+        headers = {'ETag': entry.etag, 'Cache-Control': entry.cache_control}
+
+        if_none_match = request.headers.get('if-none-match')
+        # Weak comparison: a compressed response carries W/"<etag>"
+        if if_none_match and entry.etag in (
+            tag.strip().removeprefix('W/') for tag in if_none_match.split(',')
+        ):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+
+        return Response(content=entry.body, media_type='application/json', headers=headers)
+
+    def invalidate(self, *tags: str) -> int:
+        """Drop every entry carrying one of `tags`; returns how many were dropped"""
+        dropped = 0
+        for tag in tags:
+            for key in self._tags.pop(tag, ()):
+                if self._entries.pop(key, None) is not None:
+                    dropped += 1
+        return dropped
+
+    def clear(self):
+        self._entries.clear()
+        self._tags.clear()
+
+    def apply_invalidation(self, tag: str) -> int:
+        """Cache-sync handler: '*' clears everything, anything else is a tag"""
+        if tag == '*':
+            dropped = len(self._entries)
+            self.clear()
+            return dropped
+        return self.invalidate(tag)
+
+    def stats(self) -> dict:
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'not_modified': self.not_modified,
+            'tags': {tag: len(keys) for tag, keys in self._tags.items()},
+        }
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,148 @@
+"""
+In-process background task scheduler
+Each task is an async callable run every `interval` seconds on the event
+loop; it returns the number of rows it changed. Intervals can be overridden
+with SCHEDULE_<TASK_NAME> (seconds, 0 disables the task).
+
+With several worker processes only one of them runs the tasks: the one
+holding an flock on `<db>.scheduler-lock`. The others retry every
+SCHEDULER_LEADER_RETRY seconds in case that worker goes away.
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+from core import metrics
+from core.db import ProcessLock, fcntl
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_ENABLED = os.getenv('SCHEDULER_ENABLED', '1') == '1'
+SCHEDULER_LEADER_RETRY = float(os.getenv('SCHEDULER_LEADER_RETRY', '60'))
+
+
+class Task:
+    def __init__(self, name: str, interval: float, fn: Callable[[], Awaitable[int]]):
+        self.name = name
+        self.interval = float(os.getenv(f'SCHEDULE_{name.upper()}', interval))
+        self.fn = fn
+        self.runs = 0
+        self.failures = 0
+        self.rows = 0
+        self.last_run: Optional[float] = None
+        self.last_duration = 0.0
+        self.last_rows = 0
+        self.last_error: Optional[str] = None
+        self.running = False
+
+    async def run(self) -> int:
+        self.running = True
+        started = time.perf_counter()
+        try:
+            rows = await self.fn() or 0
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e)
+            metrics.task_runs.inc(self.name, 'error')
+            logger.error(f"Scheduled task {self.name} failed: {e}")
+            raise
+        finally:
+            self.running = False
+            self.runs += 1
+            self.last_run = time.time()
+            self.last_duration = time.perf_counter() - started
+            metrics.task_latency.observe(self.last_duration, self.name)
+
+        self.rows += rows
+        self.last_rows = rows
+        self.last_error = None
+        metrics.task_runs.inc(self.name, 'ok')
+        metrics.task_rows.inc(self.name, amount=rows)
+        if rows:
+            logger.info(f"Scheduled task {self.name}: {rows} rows in {self.last_duration:.2f}s")
+        return rows
+
+    def stats(self) -> dict:
+        return {
+            'interval': self.interval,
+            'runs': self.runs,
+            'failures': self.failures,
+            'rows': self.rows,
+            'last_run': self.last_run,
+            'last_duration_ms': round(self.last_duration * 1000, 3),
+            'last_rows': self.last_rows,
+            'last_error': self.last_error,
+            'running': self.running,
+        }
+
+
+class Scheduler:
+    def __init__(self):
+        self.tasks: Dict[str, Task] = {}
+        self._runners = []
+        self._lock: Optional[ProcessLock] = None
+        self._waiter: Optional[asyncio.Task] = None
+        self.leader = False
+
+    def add(self, name: str, interval: float, fn: Callable[[], Awaitable[int]]):
+        self.tasks[name] = Task(name, interval, fn)
+
+    async def _loop(self, task: Task):
+        # Spread the first runs so tasks don't all start together
+        await asyncio.sleep(random.uniform(1, min(task.interval, 30)))
+        while True:
+            try:
+                await task.run()
+            except Exception:
+                pass  # Counted and logged by Task.run
+            await asyncio.sleep(task.interval)
+
+    def _start_tasks(self):
+        self.leader = True
+        for task in self.tasks.values():
+            if task.interval > 0:
+                self._runners.append(asyncio.create_task(self._loop(task)))
+        logger.info(f"Scheduler running {len(self._runners)} tasks in process {os.getpid()}")
+
+    async def _wait_for_leadership(self):
+        while not self._lock.try_acquire():
+            await asyncio.sleep(SCHEDULER_LEADER_RETRY)
+        self._start_tasks()
+
+    async def start(self, db_path: str):
+        if fcntl is None:
+            # No cross-process lock available: assume a single worker
+            self._start_tasks()
+            return
+        self._lock = ProcessLock(f"{os.path.realpath(db_path)}.scheduler-lock")
+        self._lock.open()
+        self._waiter = asyncio.create_task(self._wait_for_leadership())
+
+    async def run_now(self, name: str) -> int:
+        """Run a task immediately in this process, whether or not it leads"""
+        return await self.tasks[name].run()
+
+    async def stop(self):
+        pending = self._runners + ([self._waiter] if self._waiter else [])
+        for runner in pending:
+            runner.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        self._runners = []
+        self._waiter = None
+        self.leader = False
+        if self._lock:
+            self._lock.close()  # Closing the file releases the flock
+            self._lock = None
+
+    def stats(self) -> dict:
+        return {
+            'leader': self.leader,
+            'pid': os.getpid(),
+            'tasks': {name: task.stats() for name, task in self.tasks.items()},
+        }
+
+
+scheduler = Scheduler()
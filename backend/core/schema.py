@@ -0,0 +1,546 @@
+"""
+Mini App schema additions
+Indexes and helper tables the API relies on. Everything here is additive and
+idempotent so it is safe to run against the bot's live database on startup.
+
+Triggers only use built-in SQL so they keep working when the bot process,
+which knows nothing about this module, writes to the same tables.
+"""
+import logging
+import sqlite3
+from typing import Dict, List, Optional, Tuple
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+
+async def _table_exists(db: aiosqlite.Connection, name: str) -> bool:
+    async with db.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = ?", (name,)
+    ) as cursor:
+        return await cursor.fetchone() is not None
+
+
+async def _apply(db: aiosqlite.Connection, statements: list):
+    for statement in statements:
+        try:
+            await db.execute(statement)
+        except sqlite3.OperationalError as e:
+            logger.warning(f"Schema statement skipped ({e}): {' '.join(statement.split())[:80]}")
+
+
+INDEXES = [
+    # Keyset pagination: equality filters first, then the sort key
+    """CREATE INDEX IF NOT EXISTS idx_jobs_listing
+       ON jobs(status, job_type, created_at DESC, id DESC)""",
+    """CREATE INDEX IF NOT EXISTS idx_jobs_category_listing
+       ON jobs(status, job_type, category, created_at DESC, id DESC)""",
+    """CREATE INDEX IF NOT EXISTS idx_daily_jobs_listing
+       ON daily_jobs(status, work_date DESC, created_at DESC, id DESC)""",
+    """CREATE INDEX IF NOT EXISTS idx_products_listing
+       ON products(status, created_at DESC, id DESC)""",
+    """CREATE INDEX IF NOT EXISTS idx_products_category_listing
+       ON products(status, category, created_at DESC, id DESC)""",
+    # Housekeeping (core.housekeeping): expired and sold-out listings
+    """CREATE INDEX IF NOT EXISTS idx_jobs_expiry ON jobs(status, expires_at)""",
+    """CREATE INDEX IF NOT EXISTS idx_products_sold_out
+       ON products(status) WHERE COALESCE(stock, 0) <= 0""",
+]
+
+# ============================================
+# FULL-TEXT SEARCH
+# ============================================
+
+# Uzbek Latin is written with several apostrophe look-alikes (o‘, gʻ, o`).
+# Indexed text and queries are folded to a plain ' which the tokenizer keeps
+# inside words, so "Sog'liqni" stays one token.
+APOSTROPHES = "‘’ʻʼ`"
+FTS_TOKENIZE = "unicode61 remove_diacritics 2 tokenchars ''''"
+
+# Searchable tables -> indexed columns
+FTS_TABLES: Dict[str, Tuple[str, ...]] = {
+    'jobs': ('title', 'company', 'description', 'requirements', 'location'),
+    'daily_jobs': ('title', 'description', 'location'),
+    'products': ('name', 'description', 'category', 'location'),
+}
+
+# Set by ensure_schema once the FTS5 tables are in place
+fts_enabled = False
+
+
+def normalize_apostrophes(text: str) -> str:
+    """Fold apostrophe variants to a plain ' (Python twin of _sql_normalize)"""
+    for char in APOSTROPHES:
+        text = text.replace(char, "'")
+    return text
+
+
+def _sql_normalize(expr: str) -> str:
+    for char in APOSTROPHES:
+        expr = f"replace({expr}, '{char}', '''')"
+    return expr
+
+
+def fts_statements(table: str, columns: Tuple[str, ...]) -> List[str]:
+    """DDL for an FTS5 index over `table` kept in sync by triggers"""
+    fts = f"{table}_fts"
+    column_list = ', '.join(columns)
+    new_values = ', '.join(_sql_normalize(f"new.{column}") for column in columns)
+    return [
+        f"""CREATE VIRTUAL TABLE IF NOT EXISTS {fts}
+            USING fts5({column_list}, tokenize = "{FTS_TOKENIZE}")""",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN
+                INSERT INTO {fts}(rowid, {column_list}) VALUES (new.id, {new_values});
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN
+                DELETE FROM {fts} WHERE rowid = old.id;
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {column_list} ON {table} BEGIN
+                DELETE FROM {fts} WHERE rowid = old.id;
+                INSERT INTO {fts}(rowid, {column_list}) VALUES (new.id, {new_values});
+            END""",
+    ]
+
+
+def fts_backfill(table: str, columns: Tuple[str, ...]) -> str:
+    """Populate a freshly created FTS index from existing rows"""
+    column_list = ', '.join(columns)
+    values = ', '.join(_sql_normalize(column) for column in columns)
+    return f"INSERT INTO {table}_fts(rowid, {column_list}) SELECT id, {values} FROM {table}"
+
+
+async def _ensure_fts(db: aiosqlite.Connection) -> bool:
+    for table, columns in FTS_TABLES.items():
+        if not await _table_exists(db, table):
+            logger.warning(f"Full-text search disabled: table {table} not found")
+            return False
+        created = not await _table_exists(db, f"{table}_fts")
+        try:
+            for statement in fts_statements(table, columns):
+                await db.execute(statement)
+            if created:
+                await db.execute(fts_backfill(table, columns))
+                logger.info(f"Built full-text index {table}_fts")
+        except sqlite3.OperationalError as e:
+            logger.warning(f"Full-text search disabled: {e}")
+            return False
+    return True
+
+
+# ============================================
+# STATISTICS
+# ============================================
+
+# Running totals for the admin dashboard, maintained by triggers
+STATS_TABLES = [
+    """CREATE TABLE IF NOT EXISTS stats_counters (
+           name TEXT PRIMARY KEY,
+           value INTEGER NOT NULL DEFAULT 0
+       )""",
+    """CREATE TABLE IF NOT EXISTS stats_daily (
+           day TEXT NOT NULL,
+           name TEXT NOT NULL,
+           value INTEGER NOT NULL DEFAULT 0,
+           PRIMARY KEY (day, name)
+       ) WITHOUT ROWID""",
+    # premium_until is time-dependent, so it is counted with a range scan
+    "CREATE INDEX IF NOT EXISTS idx_users_premium_until ON users(premium_until)",
+]
+
+# A row counts as active when this expression is 1
+ACTIVE_JOB = "({row}.status IS 'active')"
+ACTIVE_PRODUCT = "({row}.status IS 'active' AND COALESCE({row}.stock, 0) > 0)"
+
+# counter -> (table, full recount query)
+STATS_COUNTERS = {
+    'total_users': ('users', "SELECT COUNT(*) FROM users"),
+    'total_balance': ('users', "SELECT COALESCE(SUM(balance), 0) FROM users"),
+    'total_resumes': ('resumes', "SELECT COUNT(*) FROM resumes"),
+    'active_jobs': ('jobs', "SELECT COUNT(*) FROM jobs WHERE status = 'active'"),
+    'active_products': (
+        'products', "SELECT COUNT(*) FROM products WHERE status = 'active' AND stock > 0"
+    ),
+}
+
+# daily series -> (table, value added per inserted row, recount aggregate)
+STATS_DAILY = {
+    'new_users': ('users', "1", "COUNT(*)"),
+    'new_jobs': ('jobs', "1", "COUNT(*)"),
+    'new_daily_jobs': ('daily_jobs', "1", "COUNT(*)"),
+    'new_products': ('products', "1", "COUNT(*)"),
+    'new_orders': ('orders', "1", "COUNT(*)"),
+    'order_volume': (
+        'orders', "COALESCE(new.total_price, 0)", "SUM(COALESCE(total_price, 0))"
+    ),
+}
+
+# Set by ensure_schema to the counters that are being maintained
+stats_enabled = set()
+
+
+def _bump(name: str, delta: str) -> str:
+    return (
+        f"INSERT INTO stats_counters(name, value) VALUES ('{name}', {delta}) "
+        f"ON CONFLICT(name) DO UPDATE SET value = value + excluded.value;"
+    )
+
+
+def _bump_daily(name: str, delta: str) -> str:
+    return (
+        f"INSERT INTO stats_daily(day, name, value) VALUES (date('now'), '{name}', {delta}) "
+        f"ON CONFLICT(day, name) DO UPDATE SET value = value + excluded.value;"
+    )
+
+
+def _trigger(
+    name: str, when: str, table: str, body: List[str], condition: Optional[str] = None
+) -> str:
+    where = f" WHEN {condition}" if condition else ""
+    return (
+        f"CREATE TRIGGER IF NOT EXISTS {name} {when} ON {table}{where} BEGIN\n"
+        + "\n".join(body)
+        + "\nEND"
+    )
+
+
+def _daily_bumps(table: str) -> List[str]:
+    return [
+        _bump_daily(name, delta)
+        for name, (source, delta, _) in STATS_DAILY.items() if source == table
+    ]
+
+
+def stats_triggers(tables: set) -> List[str]:
+    """Triggers keeping stats_counters and stats_daily current for `tables`"""
+    statements = []
+
+    if 'users' in tables:
+        statements += [
+            _trigger("stats_users_ai", "AFTER INSERT", "users", [
+                _bump('total_users', "1"),
+                _bump('total_balance', "COALESCE(new.balance, 0)"),
+            ] + _daily_bumps('users')),
+            _trigger("stats_users_ad", "AFTER DELETE", "users", [
+                _bump('total_users', "-1"),
+                _bump('total_balance', "-COALESCE(old.balance, 0)"),
+            ]),
+            _trigger("stats_users_au", "AFTER UPDATE OF balance", "users", [
+                _bump('total_balance', "COALESCE(new.balance, 0) - COALESCE(old.balance, 0)"),
+            ], "new.balance IS NOT old.balance"),
+        ]
+
+    if 'resumes' in tables:
+        statements += [
+            _trigger("stats_resumes_ai", "AFTER INSERT", "resumes", [_bump('total_resumes', "1")]),
+            _trigger("stats_resumes_ad", "AFTER DELETE", "resumes", [_bump('total_resumes', "-1")]),
+        ]
+
+    if 'jobs' in tables:
+        new, old = ACTIVE_JOB.format(row='new'), ACTIVE_JOB.format(row='old')
+        statements += [
+            _trigger("stats_jobs_ai", "AFTER INSERT", "jobs", [
+                _bump('active_jobs', new),
+            ] + _daily_bumps('jobs')),
+            _trigger("stats_jobs_ad", "AFTER DELETE", "jobs", [_bump('active_jobs', f"-{old}")]),
+            _trigger("stats_jobs_au", "AFTER UPDATE OF status", "jobs", [
+                _bump('active_jobs', f"{new} - {old}"),
+            ], f"{new} != {old}"),
+        ]
+
+    if 'products' in tables:
+        new, old = ACTIVE_PRODUCT.format(row='new'), ACTIVE_PRODUCT.format(row='old')
+        statements += [
+            _trigger("stats_products_ai", "AFTER INSERT", "products", [
+                _bump('active_products', new),
+            ] + _daily_bumps('products')),
+            _trigger("stats_products_ad", "AFTER DELETE", "products", [
+                _bump('active_products', f"-{old}"),
+            ]),
+            _trigger("stats_products_au", "AFTER UPDATE OF status, stock", "products", [
+                _bump('active_products', f"{new} - {old}"),
+            ], f"{new} != {old}"),
+        ]
+
+    for table in ('daily_jobs', 'orders'):
+        if table in tables:
+            statements.append(
+                _trigger(f"stats_{table}_ai", "AFTER INSERT", table, _daily_bumps(table))
+            )
+
+    return statements
+
+
+async def _stats_tables(db: aiosqlite.Connection) -> set:
+    wanted = {table for table, _ in STATS_COUNTERS.values()}
+    wanted |= {table for table, _, _ in STATS_DAILY.values()}
+    return {table for table in wanted if await _table_exists(db, table)}
+
+
+async def rebuild_stats(db: aiosqlite.Connection, tables: Optional[set] = None):
+    """Recount every counter and the daily series from the source tables"""
+    if tables is None:
+        tables = await _stats_tables(db)
+    await db.execute("DELETE FROM stats_counters")
+    for name, (table, recount) in STATS_COUNTERS.items():
+        if table in tables:
+            await db.execute(
+                f"INSERT INTO stats_counters(name, value) SELECT '{name}', ({recount})"
+            )
+
+    await db.execute("DELETE FROM stats_daily")
+    for name, (table, _, aggregate) in STATS_DAILY.items():
+        if table in tables:
+            await db.execute(
+                f"""INSERT INTO stats_daily(day, name, value)
+                    SELECT DATE(created_at), '{name}', {aggregate} FROM {table}
+                    WHERE created_at IS NOT NULL GROUP BY DATE(created_at)"""
+            )
+
+
+async def _ensure_stats(db: aiosqlite.Connection) -> set:
+    tables = await _stats_tables(db)
+    if 'users' not in tables:
+        logger.warning("Materialized stats disabled: table users not found")
+        return set()
+
+    fresh = not await _table_exists(db, 'stats_counters')
+    await _apply(db, STATS_TABLES)
+    await _apply(db, stats_triggers(tables))
+    if fresh:
+        # Same transaction as the triggers, so no write can slip in between
+        await rebuild_stats(db, tables)
+        logger.info("Built materialized stats")
+
+    return {name for name, (table, _) in STATS_COUNTERS.items() if table in tables}
+
+
+# ============================================
+# BALANCE LEDGER
+# ============================================
+
+# One row per balance change made by the API (see core.ledger)
+LEDGER_TABLES = [
+    """CREATE TABLE IF NOT EXISTS balance_ledger (
+           id INTEGER PRIMARY KEY AUTOINCREMENT,
+           user_id INTEGER NOT NULL,
+           amount INTEGER NOT NULL,
+           balance_after INTEGER NOT NULL,
+           reason TEXT,
+           ref_type TEXT,
+           ref_id INTEGER,
+           created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+       )""",
+    "CREATE INDEX IF NOT EXISTS idx_balance_ledger_user ON balance_ledger(user_id, id DESC)",
+]
+
+
+# ============================================
+# CACHE VERSIONS
+# ============================================
+
+# In-memory caches stamp entries with a version from this table; triggers
+# bump it whenever the underlying rows change, whoever writes them.
+VERSION_TABLES = [
+    """CREATE TABLE IF NOT EXISTS cache_versions (
+           name TEXT PRIMARY KEY,
+           version INTEGER NOT NULL DEFAULT 0
+       ) WITHOUT ROWID""",
+]
+
+
+def question_set(competition_id) -> str:
+    """cache_versions name for a competition's questions"""
+    return f"competition_questions:{competition_id}"
+
+
+def _bump_version(name: str) -> str:
+    return (
+        f"INSERT INTO cache_versions(name, version) VALUES ({name}, 1) "
+        f"ON CONFLICT(name) DO UPDATE SET version = version + 1;"
+    )
+
+
+def version_triggers() -> List[str]:
+    new = "'competition_questions:' || new.competition_id"
+    old = "'competition_questions:' || old.competition_id"
+    return [
+        _trigger("cv_questions_ai", "AFTER INSERT", "competition_questions", [_bump_version(new)]),
+        _trigger("cv_questions_ad", "AFTER DELETE", "competition_questions", [_bump_version(old)]),
+        _trigger("cv_questions_au", "AFTER UPDATE", "competition_questions", [
+            _bump_version(new),
+            _bump_version(old),
+        ]),
+    ]
+
+
+async def get_version(db: aiosqlite.Connection, name: str) -> int:
+    async with db.execute(
+        "SELECT version FROM cache_versions WHERE name = ?", (name,)
+    ) as cursor:
+        row = await cursor.fetchone()
+    return row[0] if row else 0
+
+
+async def bump_version(db: aiosqlite.Connection, name: str) -> int:
+    """Increment a version from application code; returns the new value"""
+    await db.execute(_bump_version('?').rstrip(';'), (name,))
+    return await get_version(db, name)
+
+
+async def _ensure_versions(db: aiosqlite.Connection):
+    await _apply(db, VERSION_TABLES)
+    if await _table_exists(db, 'competition_questions'):
+        await _apply(db, version_triggers())
+
+
+# ============================================
+# EVENT LOG
+# ============================================
+
+# Push events relayed between workers (see core.events); pruned by housekeeping
+EVENT_TABLES = [
+    """CREATE TABLE IF NOT EXISTS event_log (
+           id INTEGER PRIMARY KEY AUTOINCREMENT,
+           origin INTEGER NOT NULL,
+           topics TEXT NOT NULL,
+           type TEXT NOT NULL,
+           data TEXT NOT NULL,
+           created_at REAL NOT NULL
+       )""",
+    "CREATE INDEX IF NOT EXISTS idx_event_log_created ON event_log(created_at)",
+]
+
+
+# ============================================
+# IDEMPOTENCY KEYS
+# ============================================
+
+# Stored POST responses keyed by a 16-byte hash of caller, path and client
+# key (see core.idempotency); status is NULL while the first attempt runs
+IDEMPOTENCY_TABLES = [
+    """CREATE TABLE IF NOT EXISTS idempotency_keys (
+           key BLOB PRIMARY KEY,
+           fingerprint BLOB NOT NULL,
+           status INTEGER,
+           content_type BLOB,
+           body BLOB,
+           created_at REAL NOT NULL
+       ) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created ON idempotency_keys(created_at)",
+]
+
+
+# ============================================
+# TEKIN TASK SUBMISSIONS
+# ============================================
+
+# Submissions accepted by the task dispatcher (see core.dispatch), queued
+# until they are handed to the tekin module; one per user and task
+SUBMISSION_TABLES = [
+    """CREATE TABLE IF NOT EXISTS tekin_task_submissions (
+           id INTEGER PRIMARY KEY AUTOINCREMENT,
+           user_id INTEGER NOT NULL,
+           task_id INTEGER NOT NULL,
+           proof_url TEXT,
+           status TEXT NOT NULL,
+           claimed_at REAL,
+           created_at REAL NOT NULL,
+           UNIQUE (user_id, task_id)
+       )""",
+    """CREATE INDEX IF NOT EXISTS idx_tekin_task_submissions_status
+           ON tekin_task_submissions(status, id)""",
+]
+
+
+# ============================================
+# LEADERBOARD
+# ============================================
+
+# Submitted scores per (competition, score); a participant's rank is one
+# plus the number of participants with a higher score.
+LEADERBOARD_TABLES = [
+    """CREATE TABLE IF NOT EXISTS competition_score_counts (
+           competition_id INTEGER NOT NULL,
+           score INTEGER NOT NULL,
+           participants INTEGER NOT NULL DEFAULT 0,
+           PRIMARY KEY (competition_id, score)
+       ) WITHOUT ROWID""",
+    """CREATE INDEX IF NOT EXISTS idx_competition_participants_score
+       ON competition_participants(competition_id, test_submitted, test_score DESC, test_date)""",
+]
+
+SUBMITTED = "({row}.test_submitted = 1 AND {row}.test_score IS NOT NULL)"
+
+# Set by ensure_schema once competition_score_counts is maintained
+leaderboard_enabled = False
+
+
+def _count_score(row: str, delta: str) -> str:
+    return (
+        f"INSERT INTO competition_score_counts(competition_id, score, participants) "
+        f"SELECT {row}.competition_id, {row}.test_score, {delta} "
+        f"WHERE {SUBMITTED.format(row=row)} "
+        f"ON CONFLICT(competition_id, score) DO UPDATE "
+        f"SET participants = participants + excluded.participants;"
+    )
+
+
+def leaderboard_triggers() -> List[str]:
+    return [
+        _trigger("lb_participants_ai", "AFTER INSERT", "competition_participants", [
+            _count_score('new', "1"),
+        ]),
+        _trigger("lb_participants_ad", "AFTER DELETE", "competition_participants", [
+            _count_score('old', "-1"),
+        ]),
+        _trigger(
+            "lb_participants_au",
+            "AFTER UPDATE OF competition_id, test_submitted, test_score",
+            "competition_participants",
+            [_count_score('old', "-1"), _count_score('new', "1")],
+        ),
+    ]
+
+
+async def rebuild_leaderboard(db: aiosqlite.Connection):
+    """Recount competition_score_counts from competition_participants"""
+    await db.execute("DELETE FROM competition_score_counts")
+    await db.execute(
+        f"""INSERT INTO competition_score_counts(competition_id, score, participants)
+            SELECT competition_id, test_score, COUNT(*) FROM competition_participants
+            WHERE {SUBMITTED.format(row='competition_participants')}
+            GROUP BY competition_id, test_score"""
+    )
+
+
+async def _ensure_leaderboard(db: aiosqlite.Connection) -> bool:
+    if not await _table_exists(db, 'competition_participants'):
+        logger.warning("Leaderboard disabled: table competition_participants not found")
+        return False
+
+    fresh = not await _table_exists(db, 'competition_score_counts')
+    await _apply(db, LEADERBOARD_TABLES)
+    await _apply(db, leaderboard_triggers())
+    if fresh:
+        await rebuild_leaderboard(db)
+        logger.info("Built leaderboard score counts")
+    return True
+
+
+# ============================================
+# STARTUP
+# ============================================
+
+async def ensure_schema(db: aiosqlite.Connection):
+    """Create missing indexes and tables; runs as a pool write unit"""
+    global fts_enabled, stats_enabled, leaderboard_enabled
+    await _apply(db, INDEXES)
+    fts_enabled = await _ensure_fts(db)
+    stats_enabled = await _ensure_stats(db)
+    await _apply(db, LEDGER_TABLES)
+    await _ensure_versions(db)
+    await _apply(db, EVENT_TABLES)
+    await _apply(db, IDEMPOTENCY_TABLES)
+    await _apply(db, SUBMISSION_TABLES)
+    leaderboard_enabled = await _ensure_leaderboard(db)
@@ -0,0 +1,89 @@
+"""
+Full-text search over the FTS5 indexes defined in core.schema
+"""
+import html
+import re
+from typing import List, Optional
+
+import aiosqlite
+
+from core.schema import FTS_TABLES, normalize_apostrophes
+
+# Words, keeping inner apostrophes (o'qituvchi, sog'liqni)
+TOKEN_RE = re.compile(r"\w+(?:'\w+)*'?", re.UNICODE)
+
+MAX_TERMS = 8
+
+SEARCHABLE = tuple(FTS_TABLES)
+
+# Private-use characters FTS5 wraps matches in; they become <mark> tags only
+# after the indexed text has been HTML-escaped
+MARK_OPEN, MARK_CLOSE = '\ue000', '\ue001'
+
+# bm25 column weights, in FTS_TABLES column order
+WEIGHTS = {
+    'jobs': (10.0, 4.0, 1.0, 1.0, 2.0),
+    'daily_jobs': (10.0, 1.0, 3.0),
+    'products': (10.0, 1.0, 3.0, 2.0),
+}
+
+# Filters applied to the content table alongside the MATCH
+ACTIVE_FILTERS = {
+    'jobs': "t.status = 'active'",
+    'daily_jobs': "t.status = 'active'",
+    'products': "t.status = 'active' AND t.stock > 0",
+}
+
+
+def highlight(snippet: Optional[str]) -> Optional[str]:
+    """HTML-safe snippet with matches wrapped in <mark>"""
+    if snippet is None:
+        return None
+    return (
+        html.escape(snippet)
+        .replace(MARK_OPEN, '<mark>')
+        .replace(MARK_CLOSE, '</mark>')
+    )
+
+
+def build_match_query(text: str, column: Optional[str] = None) -> Optional[str]:
+    """Turn free text into an FTS5 query of prefix-matched terms, ANDed together
+
+    Returns None when the text has nothing searchable in it.
+    """
+    terms = TOKEN_RE.findall(normalize_apostrophes(text).lower())[:MAX_TERMS]
+    if not terms:
+        return None
+    query = ' '.join(f'"{term}"*' for term in terms)
+    if column:
+        query = f"{column} : ({query})"
+    return query
+
+
+async def search_table(
+    db: aiosqlite.Connection,
+    table: str,
+    match: str,
+    limit: int = 20
+) -> List[dict]:
+    """Rank active rows of `table` against an FTS5 query, best first"""
+    fts = f"{table}_fts"
+    weights = ', '.join(str(weight) for weight in WEIGHTS[table])
+    query = f"""
+        SELECT t.*,
+               snippet({fts}, -1, '{MARK_OPEN}', '{MARK_CLOSE}', '…', 12) AS snippet,
+               bm25({fts}, {weights}) AS score
+        FROM {fts}
+        JOIN {table} t ON t.id = {fts}.rowid
+        WHERE {fts} MATCH ? AND {ACTIVE_FILTERS[table]}
+        ORDER BY score
+        LIMIT ?
+    """
+    async with db.execute(query, (match, limit)) as cursor:
+        rows = await cursor.fetchall()
+    results = []
+    for row in rows:
+        item = dict(row)
+        item['snippet'] = highlight(item['snippet'])
+        results.append(item)
+    return results
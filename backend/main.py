@@ -9,20 +9,37 @@ from pathlib import Path
 # Add parent directory to path to import bot modules
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 
-from fastapi import FastAPI, Depends, HTTPException, Header
+from fastapi import FastAPI, Depends, HTTPException, Header, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import PlainTextResponse, StreamingResponse
 import hashlib
 import hmac
 import json
+import time
 from urllib.parse import parse_qsl
 from typing import Optional
+from contextlib import asynccontextmanager
 import logging
 
 # Import bot modules
-from database import get_user, add_user, get_user_balance
+from database import DB_NAME, get_user, add_user, get_user_balance
 from dotenv import load_dotenv
 
+from core import batch, events, housekeeping, metrics, queries
+from core.cache import TTLCache
+from core.cache_sync import RESPONSE_CACHE, cache_sync
+from core.compression import CompressionMiddleware
+from core.dispatch import TASKS
+from core.events import event_bus
+from core.idempotency import IdempotencyMiddleware
+from core.ratelimit import RateLimitMiddleware
+from core.db import pool
+from core.pdf import pdf_renderer
+from core.response_cache import response_cache
+from core.responses import JSONResponse
+from core.scheduler import SCHEDULER_ENABLED, scheduler
+from core.schema import ensure_schema
+
 load_dotenv()
 
 # Configure logging
@@ -33,12 +50,74 @@ BOT_TOKEN = os.getenv('BOT_TOKEN')
 if not BOT_TOKEN:
     raise ValueError("BOT_TOKEN not found in environment variables")
 
+DB_PATH = os.getenv('DB_PATH', DB_NAME)
+
+# Reject initData older than this many seconds (0 disables the check)
+INIT_DATA_MAX_AGE = int(os.getenv('INIT_DATA_MAX_AGE', '0'))
+
+# HMAC key for initData signatures, derived once from the bot token
+WEBAPP_SECRET = hmac.new(
+    key=b"WebAppData",
+    msg=BOT_TOKEN.encode(),
+    digestmod=hashlib.sha256
+).digest()
+
+# Validated initData keyed by its hash -> (init_data, user_data)
+auth_cache = TTLCache(
+    maxsize=int(os.getenv('AUTH_CACHE_SIZE', '10000')),
+    ttl=float(os.getenv('AUTH_CACHE_TTL', '300'))
+)
+
+# Users already known to exist in the database
+upserted_users = TTLCache(maxsize=int(os.getenv('AUTH_CACHE_SIZE', '10000')), ttl=86400)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open shared resources on startup and release them on shutdown"""
+    if queries.INSTRUMENT_SHARED:
+        queries.instrument_shared_modules()
+    await pool.open(DB_PATH)
+    await pool.write(ensure_schema)
+    cache_sync.subscribe(RESPONSE_CACHE, response_cache.apply_invalidation)
+    cache_sync.subscribe(TASKS, tekin.task_dispatcher.mark_dirty)
+    await cache_sync.start()
+    await tekin.task_dispatcher.start(publish=lambda: cache_sync.publish(TASKS))
+    await event_bus.start()
+    housekeeping.register(scheduler)
+    if SCHEDULER_ENABLED:
+        await scheduler.start(DB_PATH)
+    yield
+    await event_bus.stop()
+    await scheduler.stop()
+    await tekin.task_dispatcher.stop()
+    await cache_sync.stop()
+    pdf_renderer.close()
+    await pool.close()
+
 app = FastAPI(
     title="MEGABOT Mini App API",
     description="Telegram Mini App backend for MEGABOT",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=JSONResponse
 )
 
+# Idempotency-Key replay for retried POSTs; inside CORS so replays get its headers
+app.add_middleware(IdempotencyMiddleware)
+
+def _cached_user_id(scope) -> Optional[int]:
+    """User id for initData validated earlier, without validating it again"""
+    for key, value in scope['headers']:
+        if key == b'authorization':
+            init_data = value.decode('latin-1').replace('Bearer ', '')
+            cached = auth_cache.get(_init_data_hash(init_data))
+            if cached and cached[0] == init_data:
+                return cached[1]['user_id']
+    return None
+
+# Token-bucket rate limits per user (or IP), checked before any auth or DB work
+app.add_middleware(RateLimitMiddleware, identify=_cached_user_id)
+
 # CORS settings
 app.add_middleware(
     CORSMiddleware,
@@ -48,15 +127,34 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# gzip/brotli for JSON and text responses above COMPRESS_MIN_SIZE
+app.add_middleware(CompressionMiddleware)
+
+# Per-route latency and DB usage, served on /metrics
+app.add_middleware(metrics.MetricsMiddleware)
+
 # ============================================
 # TELEGRAM WEBAPP AUTHENTICATION
 # ============================================
 
+def _init_data_hash(init_data: str) -> Optional[str]:
+    """Pull the hash field out of initData without parsing the whole string"""
+    for field in init_data.split('&'):
+        if field.startswith('hash='):
+            return field[5:]
+    return None
+
+@metrics.timed("validate_telegram_webapp_data")
 def validate_telegram_webapp_data(init_data: str) -> dict:
     """
     Validate Telegram WebApp initData
     Returns user data if valid, raises HTTPException if invalid
     """
+    cache_key = _init_data_hash(init_data)
+    cached = auth_cache.get(cache_key) if cache_key else None
+    if cached and cached[0] == init_data:
+        return dict(cached[1])
+
     try:
         # Parse init_data
         parsed_data = dict(parse_qsl(init_data))
@@ -71,38 +169,45 @@ def validate_telegram_webapp_data(init_data: str) -> dict:
         data_check_string = '\n'.join(data_check_arr)
         
         # Calculate hash
-        secret_key = hmac.new(
-            key=b"WebAppData",
-            msg=BOT_TOKEN.encode(),
-            digestmod=hashlib.sha256
-        ).digest()
-        
         calculated_hash = hmac.new(
-            key=secret_key,
+            key=WEBAPP_SECRET,
             msg=data_check_string.encode(),
             digestmod=hashlib.sha256
         ).hexdigest()
         
         # Verify hash
-        if calculated_hash != received_hash:
+        if not hmac.compare_digest(calculated_hash, received_hash):
             raise HTTPException(status_code=401, detail="Invalid hash")
         
+        # Check freshness
+        ttl = None
+        if INIT_DATA_MAX_AGE:
+            auth_date = int(parsed_data.get('auth_date', 0))
+            ttl = min(auth_cache.ttl, auth_date + INIT_DATA_MAX_AGE - time.time())
+            if ttl <= 0:
+                raise HTTPException(status_code=401, detail="Init data expired")
+        
         # Parse user data
         user_data = json.loads(parsed_data.get('user', '{}'))
         
-        return {
+        result = {
             'user_id': user_data.get('id'),
             'username': user_data.get('username'),
             'first_name': user_data.get('first_name'),
             'last_name': user_data.get('last_name'),
             'language_code': user_data.get('language_code')
         }
+    except HTTPException:
+        raise
     except json.JSONDecodeError:
         raise HTTPException(status_code=401, detail="Invalid user data format")
     except Exception as e:
         logger.error(f"Telegram auth error: {e}")
         raise HTTPException(status_code=401, detail="Authentication failed")
 
+    auth_cache.set(cache_key, (init_data, result), ttl)
+    return dict(result)
+
 async def get_current_user(authorization: Optional[str] = Header(None)) -> dict:
     """
     Dependency to get current authenticated user
@@ -118,15 +223,17 @@ async def get_current_user(authorization: Optional[str] = Header(None)) -> dict:
     
     # Ensure user exists in database
     user_id = user_data['user_id']
-    user = await get_user(user_id)
-    if not user:
-        # Create new user
-        await add_user(
-            user_id=user_id,
-            username=user_data.get('username'),
-            first_name=user_data.get('first_name'),
-            last_name=user_data.get('last_name')
-        )
+    if not upserted_users.get(user_id):
+        user = await get_user(user_id)
+        if not user:
+            # Create new user
+            await add_user(
+                user_id=user_id,
+                username=user_data.get('username'),
+                first_name=user_data.get('first_name'),
+                last_name=user_data.get('last_name')
+            )
+        upserted_users.set(user_id, True)
     
     return user_data
 
@@ -148,9 +255,14 @@ async def health():
     """Detailed health check"""
     return {
         "status": "healthy",
-        "database": "connected"
+        "database": "connected" if pool.is_open else "disconnected"
     }
 
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 # ============================================
 # AUTH ENDPOINTS
 # ============================================
@@ -173,8 +285,87 @@ async def validate_auth(user: dict = Depends(get_current_user)):
         }
     }
 
+# ============================================
+# BATCH ENDPOINT
+# ============================================
+
+@app.post("/api/batch")
+async def run_batch(
+    request: Request,
+    body: batch.BatchRequest,
+    user: dict = Depends(get_current_user)
+):
+    """Run several API requests in one round trip
+
+    initData is validated once here; every sub-request runs as this user
+    (its user_id parameter is overridden). Sub-requests run concurrently,
+    so don't batch requests that depend on each other's effects.
+    """
+    if len(body.requests) > batch.MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=400, detail=f"At most {batch.MAX_BATCH_SIZE} requests per batch"
+        )
+    content = await batch.run(request.app, request.scope, body, user['user_id'])
+    return Response(content=content, media_type="application/json")
+
+# ============================================
+# EVENT STREAM
+# ============================================
+
+# Signs event stream tokens; separate from the initData key
+STREAM_TOKEN_SECRET = hmac.new(WEBAPP_SECRET, b"EventStream", hashlib.sha256).digest()
+
+@app.post("/api/events/token")
+async def event_stream_token(user: dict = Depends(get_current_user)):
+    """Short-lived token for opening an event stream"""
+    return {
+        "token": events.issue_token(STREAM_TOKEN_SECRET, user['user_id']),
+        "expires_in": events.TOKEN_TTL
+    }
+
+@app.get("/api/events/stream")
+async def event_stream(
+    token: Optional[str] = None,
+    authorization: Optional[str] = Header(None)
+):
+    """Server-sent events for the authenticated user
+
+    EventSource can't set headers, so browsers pass a token from
+    POST /api/events/token as the `token` query parameter; other clients
+    may send the Authorization header. Either is checked once, when the
+    stream opens. A `ready` event is sent first; clients should refetch
+    what they show on every (re)connect and then apply the deltas that
+    follow.
+    """
+    if token:
+        user_id = events.verify_token(STREAM_TOKEN_SECRET, token)
+        if user_id is None:
+            raise HTTPException(status_code=401, detail="Invalid or expired stream token")
+    else:
+        user_id = (await get_current_user(authorization))['user_id']
+    subscriber = event_bus.subscribe(user_id, admin=user_id == admin_api.ADMIN_ID)
+    if subscriber is None:
+        raise HTTPException(status_code=429, detail="Too many open event streams")
+
+    async def stream():
+        try:
+            yield events.encode(0, 'ready', {"user_id": user_id})
+            while True:
+                message = await subscriber.next(events.HEARTBEAT)
+                if message is None:
+                    break
+                yield message
+        finally:
+            event_bus.unsubscribe(user_id, subscriber)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # Import API routers
-from api import tekin, jobs, resume, marketplace, books, premium, admin_api
+from api import tekin, jobs, resume, marketplace, books, premium, admin_api, search
 
 # Include API routers
 app.include_router(tekin.router, prefix="/api/tekin", tags=["Tekin Obunachi"])
@@ -184,6 +375,7 @@ app.include_router(marketplace.router, prefix="/api/market", tags=["Marketplace"
 app.include_router(books.router, prefix="/api/books", tags=["Books"])
 app.include_router(premium.router, prefix="/api/premium", tags=["Premium"])
 app.include_router(admin_api.router, prefix="/api/admin", tags=["Admin"])
+app.include_router(search.router, prefix="/api/search", tags=["Search"])
 
 if __name__ == "__main__":
     import uvicorn
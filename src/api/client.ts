@@ -9,15 +9,99 @@ export const api = axios.create({
   },
 })
 
+// POSTs that charge or credit money; the backend only honours
+// Idempotency-Key on these (IDEMPOTENT_PATHS in backend/core/idempotency.py)
+const IDEMPOTENT_PATHS = new Set([
+  '/market/products/create',
+  '/market/orders/create',
+  '/market/orders/cart',
+  '/jobs/create',
+  '/jobs/daily/create',
+  '/books/competitions/join',
+  '/premium/purchase',
+  '/tekin/orders',
+  '/tekin/topup',
+])
+
 // Add auth token to requests
 api.interceptors.request.use((config) => {
   const initData = localStorage.getItem('tg_init_data')
   if (initData && config.headers) {
     config.headers.Authorization = `Bearer ${initData}`
   }
+  // One key per logical money-moving POST; retries reuse this config and so
+  // the key, and the server replays the first response instead of charging again
+  const path = (config.url || '').split('?')[0]
+  if (
+    config.method === 'post' && config.headers && IDEMPOTENT_PATHS.has(path) &&
+    !config.headers['Idempotency-Key']
+  ) {
+    config.headers['Idempotency-Key'] = crypto.randomUUID()
+  }
   return config
 })
 
+export interface BatchRequest {
+  id?: string
+  method?: 'GET' | 'POST'
+  path: string
+  params?: Record<string, string | number>
+  body?: unknown
+}
+
+export interface BatchResponse<T = any> {
+  id: string | null
+  status: number
+  body: T
+}
+
+// Run several API calls in one round trip; user_id is filled in by the server
+export async function batch(requests: BatchRequest[]): Promise<BatchResponse[]> {
+  const response = await api.post('/batch', {
+    requests: requests.map((r) => ({ ...r, path: `/api${r.path}` })),
+  })
+  return response.data.responses
+}
+
+// Push events for the current user (order.created, payment.reviewed, ...).
+// 'ready' fires on every (re)connect: refetch there, then apply the deltas.
+// Returns a function that closes the stream.
+export function subscribeEvents(
+  handlers: Record<string, (data: any) => void>
+): () => void {
+  let source: EventSource | null = null
+  let retry: ReturnType<typeof setTimeout> | undefined
+  let closed = false
+
+  // EventSource can't send headers, so the stream is opened with a
+  // short-lived token instead of initData
+  const connect = async () => {
+    try {
+      const { data } = await api.post('/events/token')
+      if (closed) return
+      source = new EventSource(`${API_URL}/events/stream?token=${encodeURIComponent(data.token)}`)
+      for (const [type, handler] of Object.entries(handlers)) {
+        source.addEventListener(type, (event) => handler(JSON.parse((event as MessageEvent).data)))
+      }
+      source.onerror = () => {
+        // The browser reconnects by itself, until the token has expired
+        if (source?.readyState === EventSource.CLOSED && !closed) {
+          retry = setTimeout(connect, 3000)
+        }
+      }
+    } catch {
+      if (!closed) retry = setTimeout(connect, 10000)
+    }
+  }
+
+  connect()
+  return () => {
+    closed = true
+    clearTimeout(retry)
+    source?.close()
+  }
+}
+
 // Handle errors
 api.interceptors.response.use(
   (response) => response,